@@ -2,8 +2,12 @@ import threading
 import time
 import os
 import webbrowser
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, render_template, request, jsonify
 from pboc_approval_mysql import run_task, db_host, db_port, db_user, db_password, db_schema, db_charset
+from pboc_response_cache import ResponseCache
+from pboc_inst_cdc import format_summary
+import pboc_metrics
+import pboc_profiler
 
 app = Flask(__name__)
 
@@ -23,9 +27,16 @@ scraper_state = {
 # Lock for thread safety
 state_lock = threading.Lock()
 
+# 状态里只保留前端展示所需的前 N 条结果和总数，完整数据已写入数据库
+RESULT_PREVIEW = 100
+
+# /status 轮询缓存: 状态未变化时直接返回 304，状态变更时 bump
+status_cache = ResponseCache(max_entries=4)
+
 def update_state(key, value):
     with state_lock:
         scraper_state[key] = value
+    status_cache.bump()
 
 def append_log(message):
     with state_lock:
@@ -33,6 +44,7 @@ def append_log(message):
         # Keep logs manageable
         if len(scraper_state["logs"]) > 1000:
             scraper_state["logs"] = scraper_state["logs"][-1000:]
+    status_cache.bump()
 
 def scraper_callback(phase, current, total, items):
     with state_lock:
@@ -50,6 +62,23 @@ def scraper_callback(phase, current, total, items):
             scraper_state["message"] = "抓取完成"
         elif phase == "error":
             scraper_state["message"] = f"出错: {items}" # items carries error message here
+    status_cache.bump()
+
+def summarize_results(results):
+    summary = {"important_news": results.get("important_news") or []}
+    for key in ("registered", "unregistered"):
+        rows = results.get(key) or []
+        summary[key] = [dict(r) for r in rows[:RESULT_PREVIEW]]
+        summary[key + "_total"] = len(rows)
+    changes = results.get("registered_changes")
+    if changes:
+        summary["registered_changes"] = {
+            "new": changes["new"][:RESULT_PREVIEW],
+            "changed": changes["changed"][:RESULT_PREVIEW],
+            "cancelled": changes["cancelled"][:RESULT_PREVIEW],
+            "summary": format_summary(changes),
+        }
+    return summary
 
 def background_task(db_config, max_workers):
     try:
@@ -67,7 +96,9 @@ def background_task(db_config, max_workers):
         
         results = run_task(db_config, max_workers, scraper_callback)
         
-        update_state("results", results)
+        update_state("results", summarize_results(results))
+        if results.get("registered_changes"):
+            append_log(f"已获许可机构变化: {format_summary(results['registered_changes'])}")
         update_state("status", "completed")
         append_log("任务成功完成。")
         
@@ -110,10 +141,18 @@ def start_scraper():
     return jsonify({"status": "started"})
 
 @app.route('/status')
+@status_cache.cached
 def get_status():
     with state_lock:
         return jsonify(scraper_state)
 
+@app.route('/metrics')
+def metrics():
+    return Response(pboc_metrics.render(), content_type=pboc_metrics.CONTENT_TYPE)
+
+# /debug/profile、/debug/memory (需设置 PBOC_DEBUG_TOKEN 才启用)
+app.register_blueprint(pboc_profiler.blueprint)
+
 if __name__ == '__main__':
     if not os.environ.get("WERKZEUG_RUN_MAIN"):
         webbrowser.open("http://127.0.0.1:5200")
@@ -0,0 +1,318 @@
+"""
+网页端点的负载测试: 多个并发客户端持续请求，复现抓取进行中多人开着页面时的负载
+
+目标 (每个目标的服务在独立子进程中启动，数据为按种子生成的样本，并模拟一个运行中的任务):
+- status        app.py /status                    (客户端像浏览器一样带 If-None-Match 轮询)
+- index         pboc_penalty.py /                 (若干筛选 / 排序 / 分页组合轮换)
+- fetch_status  pboc_penalty.py /api/fetch_status
+- stream        web_download_pboc.py /stream      (SSE 长连接；每个客户端读 --stream-seconds 秒后重连)
+
+模拟的任务按 --job-interval 推进进度、写日志；pboc_penalty 每 --publish-every 次推进发布一次新数据快照
+(与真实抓取一样使响应缓存失效)。
+
+报告每个目标在每个并发数下的请求/秒、延迟 p50/p90/p99/最大值 (stream 为首个事件的延迟)、
+304 比例、失败数和服务进程的 CPU 占用 (读 /proc，仅 Linux)。
+服务进程默认关闭访问日志；单核机器上客户端和服务端互相抢 CPU，比较改动前后时请在同一台机器上用同样的参数。
+
+用法:
+    python benchmarks/bench_endpoints.py [--targets status index] [--clients 1 8 32] [--duration 10]
+        [--records 20000] [--output result.json]
+"""
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+TARGETS = {
+    "status": ("app", ["/status"]),
+    "index": ("penalty", ["/", "/?range=month", "/?range=year&sort=date_asc", "/?province=上海市",
+                          "/?keyword=支付宝", "/?offset=200", "/?sort=province"]),
+    "fetch_status": ("penalty", ["/api/fetch_status"]),
+    "stream": ("download", ["/stream"]),
+}
+DEFAULT_CLIENTS = [1, 8, 32]
+STARTUP_TIMEOUT = 30
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = min(len(ordered) - 1, max(0, int(round(p / 100 * (len(ordered) - 1)))))
+    return ordered[k]
+
+
+def cpu_seconds(pid):
+    """
+    进程累计的用户态 + 内核态 CPU 时间；读不到 /proc 时返回 None
+    """
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+    except OSError:
+        return None
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+# ---------------------------------------------------------------- 服务进程
+def seed_records(count, seed=0, prefix=""):
+    import pboc_penalty
+    from pboc_records import PenaltyRecord
+    rng = random.Random(seed)
+    today = time.time()
+    provinces = [s["province"] for s in pboc_penalty.PROVINCE_SITES]
+    records = []
+    for i in range(count):
+        province = rng.choice(provinces)
+        # 约 5% 的标题命中关注的机构
+        who = rng.choice(pboc_penalty.KEY_WORDS) if rng.random() < 0.05 else f"某某公司{i % 997}"
+        date = time.strftime("%Y-%m-%d", time.localtime(today - rng.random() * 730 * 86400))
+        records.append(PenaltyRecord(province=province, branch=f"{province}分行", title=f"{who}行政处罚信息公示表{i}",
+                                     url=f"https://fixture.pbc.gov.cn/{prefix}{i}.html", date=date))
+    return records
+
+
+def _fake_penalty_job(args, stop):
+    import pboc_penalty
+    pboc_penalty.PROGRESS.update(status="running", current=0, total=10 ** 6, message="正在抓取列表页")
+    tick = 0
+    while not stop.wait(args.job_interval):
+        tick += 1
+        pboc_penalty.PROGRESS["current"] += 1
+        if args.publish_every and tick % args.publish_every == 0:
+            extra = seed_records(args.publish_every, seed=tick, prefix=f"new-{tick}-")
+            pboc_penalty.publish_store(pboc_penalty.CACHE["store"].with_records(extra))
+
+
+def _fake_approval_job(args, stop):
+    import app
+    app.update_state("status", "running")
+    tick = 0
+    while not stop.wait(args.job_interval):
+        tick += 1
+        app.scraper_callback("registered", tick, 10 ** 6, tick * 15)
+        app.append_log(f"已完成第 {tick} 页")
+
+
+def _fake_download_job(args, stop):
+    import web_download_pboc
+    manager = web_download_pboc.manager
+    manager.reset(["上海市"])
+    manager.total = 10 ** 6
+    tick = 0
+    while not stop.wait(args.job_interval):
+        tick += 1
+        manager.record_result("上海市", "success")
+        manager.add_log(f"下载完成: 样本文件 {tick}")
+
+
+def serve(args):
+    import logging
+    if not args.access_log:
+        logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    if args.serve == "penalty":
+        import pboc_penalty as module
+        # 使用生成的数据，不连接数据库
+        module.WARM_START = False
+        module.publish_store(module.build_store(seed_records(args.records)))
+        job = _fake_penalty_job
+    elif args.serve == "app":
+        import app as module
+        job = _fake_approval_job
+    else:
+        import web_download_pboc as module
+        job = _fake_download_job
+    stop = threading.Event()
+    threading.Thread(target=job, args=(args, stop), daemon=True).start()
+    module.app.run(host="127.0.0.1", port=args.port, threaded=True, debug=False, use_reloader=False)
+
+
+def start_server(kind, args):
+    port = free_port()
+    cmd = [sys.executable, os.path.abspath(__file__), "--serve", kind, "--port", str(port),
+           "--records", str(args.records), "--job-interval", str(args.job_interval),
+           "--publish-every", str(args.publish_every)] + (["--access-log"] if args.access_log else [])
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    base = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"{kind} 服务启动失败: {proc.stderr.read().strip()[-500:]}")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return proc, base
+        except OSError:
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError(f"{kind} 服务 {STARTUP_TIMEOUT} 秒内未就绪")
+
+
+# ---------------------------------------------------------------- 客户端
+class Results:
+    def __init__(self):
+        self.latencies = []
+        self.not_modified = 0
+        self.failures = 0
+        self.events = 0
+        self._lock = threading.Lock()
+
+    def record(self, seconds, status=200, events=0):
+        with self._lock:
+            self.latencies.append(seconds)
+            self.not_modified += status == 304
+            self.failures += status >= 400
+            self.events += events
+
+    def fail(self):
+        with self._lock:
+            self.failures += 1
+
+
+def poll_client(base, paths, deadline, results, conditional, offset):
+    import requests
+    session = requests.Session()
+    etags = {}
+    i = offset
+    while time.monotonic() < deadline:
+        path = paths[i % len(paths)]
+        i += 1
+        headers = {"If-None-Match": etags[path]} if conditional and path in etags else {}
+        started = time.perf_counter()
+        try:
+            resp = session.get(base + path, headers=headers, timeout=30)
+            resp.content
+        except requests.RequestException:
+            results.fail()
+            continue
+        results.record(time.perf_counter() - started, resp.status_code)
+        if resp.headers.get("ETag"):
+            etags[path] = resp.headers["ETag"]
+
+
+def stream_client(base, paths, deadline, results, hold):
+    import requests
+    session = requests.Session()
+    while time.monotonic() < deadline:
+        started = time.perf_counter()
+        first = None
+        events = 0
+        try:
+            with session.get(base + paths[0], stream=True, timeout=30) as resp:
+                until = min(deadline, time.monotonic() + hold)
+                for line in resp.iter_lines():
+                    if not line.startswith(b"data:"):
+                        continue
+                    events += 1
+                    if first is None:
+                        first = time.perf_counter() - started
+                    if time.monotonic() >= until:
+                        break
+        except requests.RequestException:
+            results.fail()
+            continue
+        results.record(first if first is not None else time.perf_counter() - started, resp.status_code, events)
+
+
+def run_load(target, clients, base, proc, args):
+    _, paths = TARGETS[target]
+    results = Results()
+    deadline = time.monotonic() + args.duration
+    if target == "stream":
+        threads = [threading.Thread(target=stream_client, args=(base, paths, deadline, results, args.stream_seconds))
+                   for _ in range(clients)]
+    else:
+        threads = [threading.Thread(target=poll_client,
+                                    args=(base, paths, deadline, results, not args.no_conditional, k))
+                   for k in range(clients)]
+    cpu_before = cpu_seconds(proc.pid)
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    seconds = time.perf_counter() - started
+    cpu_after = cpu_seconds(proc.pid)
+    n = len(results.latencies)
+    result = {
+        "target": target,
+        "clients": clients,
+        "requests": n,
+        "seconds": round(seconds, 2),
+        "req_per_sec": round(n / seconds, 1),
+        "p50_ms": round(percentile(results.latencies, 50) * 1000, 1),
+        "p90_ms": round(percentile(results.latencies, 90) * 1000, 1),
+        "p99_ms": round(percentile(results.latencies, 99) * 1000, 1),
+        "max_ms": round(max(results.latencies, default=0) * 1000, 1),
+        "not_modified": round(results.not_modified / n, 3) if n else 0,
+        "failed": results.failures,
+        "server_cpu": round((cpu_after - cpu_before) / seconds, 3) if cpu_before is not None else None,
+    }
+    if target == "stream":
+        result["events_per_sec"] = round(results.events / seconds, 1)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="网页端点负载测试")
+    parser.add_argument("--targets", nargs="+", choices=list(TARGETS), default=list(TARGETS))
+    parser.add_argument("--clients", nargs="+", type=int, default=DEFAULT_CLIENTS, help="并发客户端数 (逐个测)")
+    parser.add_argument("--duration", type=float, default=10, help="每组的测试时长 (秒)")
+    parser.add_argument("--records", type=int, default=20000, help="pboc_penalty 的样本记录数")
+    parser.add_argument("--job-interval", type=float, default=0.2, help="模拟任务的推进间隔 (秒)")
+    parser.add_argument("--publish-every", type=int, default=10, help="pboc_penalty 每推进几次发布一次新快照 (0 为不发布)")
+    parser.add_argument("--stream-seconds", type=float, default=5, help="stream 客户端每个连接保持的秒数")
+    parser.add_argument("--no-conditional", action="store_true", help="轮询时不带 If-None-Match")
+    parser.add_argument("--access-log", action="store_true", help="保留服务进程的访问日志")
+    parser.add_argument("--output", help="把结果写入 JSON 文件")
+    parser.add_argument("--serve", choices=["penalty", "app", "download"], help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args)
+        return 0
+
+    results = []
+    servers = {}
+    try:
+        for target in args.targets:
+            kind = TARGETS[target][0]
+            if kind not in servers:
+                servers[kind] = start_server(kind, args)
+            proc, base = servers[kind]
+            for clients in args.clients:
+                result = run_load(target, clients, base, proc, args)
+                results.append(result)
+                cpu = f"{result['server_cpu'] * 100:5.0f}%" if result["server_cpu"] is not None else "    -"
+                print(f"{target:<13}{clients:>4} 客户端 {result['req_per_sec']:>8.1f} 请求/s  "
+                      f"p50 {result['p50_ms']:>7.1f}  p90 {result['p90_ms']:>7.1f}  p99 {result['p99_ms']:>7.1f}  "
+                      f"max {result['max_ms']:>7.1f} ms  304 {result['not_modified']:>5.0%}  "
+                      f"失败 {result['failed']}  服务端 CPU {cpu}"
+                      + (f"  事件/s {result['events_per_sec']}" if "events_per_sec" in result else ""))
+    finally:
+        for proc, _ in servers.values():
+            proc.terminate()
+            proc.wait()
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"args": {k: v for k, v in vars(args).items() if k not in ("serve", "port", "output")},
+                       "results": results}, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,280 @@
+"""
+HTML 解析函数的微基准，用于在修改解析逻辑时发现性能回退
+
+样本集默认由 pboc_fixtures 生成 (各省份 x 各页面类型)；也可以用 --corpus 指定保存的页面目录，
+目录结构与 --save-corpus 写出的相同: <页面类型>/<host>/<路径>。
+每个用例按生产代码的调用方式计时 (需要 soup 的函数包含建 soup 的开销)，报告:
+- ms: 每页耗时 (--repeat 轮的中位数；每轮把样本重复若干遍，使单轮不少于 MIN_ROUND 秒)
+- rel: 每页耗时与紧挨着测的校准任务 (解析同一个固定页面) 耗时之比的中位数
+- peak_kb: 单页解析时 tracemalloc 记录的内存峰值 (各页中的最大值)
+
+与基准文件比较的是 rel 和 peak_kb，任一超过基准的 (1 + 阈值) 倍即视为回退，退出码为 1。
+rel 抵消了机器快慢，但抵消不了全部负载波动: 在共享的单核机器上 ms 可相差 50% 以上，
+rel 在两次运行之间仍可相差 10%~30%。
+因此 --save-baseline 把整套测量跑 --runs 遍，基准取各遍的中位数，并按各遍 rel 的离散程度
+为每个用例记下阈值 threshold (不低于 --threshold)；比较时取两者中较大的。
+更换 Python 或 lxml 版本后仍建议用 --save-baseline 重新生成基准。
+
+用法:
+    python benchmarks/bench_parsers.py                      # 与 benchmarks/parser_baseline.json 比较
+    python benchmarks/bench_parsers.py --save-baseline      # 更新基准
+    python benchmarks/bench_parsers.py --cases list_pages --threshold 0.3
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from urllib.parse import urlparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bs4 import BeautifulSoup
+
+from pboc_fixtures import IMPORTANT_KEYWORD, FixtureSite, penalty_sites
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "parser_baseline.json")
+DEFAULT_THRESHOLD = 0.25
+# 单轮计时的最短时长，页面少的用例会重复多遍，减小计时抖动
+MIN_ROUND = 0.2
+# 生成基准时整套测量的遍数
+BASELINE_RUNS = 5
+# 用例阈值 = 各遍 rel 相对中位数的最大偏离 x SPREAD_FACTOR
+SPREAD_FACTOR = 2
+
+
+def _standard_branch(url, province, html):
+    import pboc_penalty_data
+    return pboc_penalty_data.parse_standard_branch_page(BeautifulSoup(html, "lxml"), url, province)
+
+
+def _special_branch(url, province, html):
+    import pboc_penalty_data
+    return pboc_penalty_data.parse_special_branch_page(BeautifulSoup(html, "lxml"), url, province)
+
+
+def _list_pages(url, province, html):
+    import pboc_penalty_data
+    return pboc_penalty_data.parse_page_links(html, url)
+
+
+def _total_pages(url, province, html):
+    import pboc_approval_mysql
+    return pboc_approval_mysql.parse_total_pages(html)
+
+
+def _additional_info(url, province, html):
+    import pboc_approval_mysql
+    return pboc_approval_mysql.parse_additional_info(html)
+
+
+def _find_target_url(url, province, html):
+    import pboc_approval_mysql
+    return pboc_approval_mysql.find_link_by_keyword(html, url, IMPORTANT_KEYWORD)
+
+
+def _important_news(url, province, html):
+    import pboc_approval_mysql
+    return pboc_approval_mysql.parse_important_news(html)
+
+
+def _attachment_link(url, province, html):
+    import web_download_pboc
+    return web_download_pboc.find_attachment_link(web_download_pboc.parse_html(html.encode("utf-8")))
+
+
+def _table_scoring(url, province, html):
+    import pboc_table_extract
+    doc = pboc_table_extract.parse_html(html.encode("utf-8"))
+    table = pboc_table_extract.find_penalty_table(doc)
+    return pboc_table_extract.extract_penalty_table(doc) if table is not None else None
+
+
+# 用例名 -> (函数, 适用的页面类型)
+CASES = {
+    "parse_standard_branch_page": (_standard_branch, ["penalty_standard"]),
+    "parse_special_branch_page": (_special_branch, ["penalty_special"]),
+    "list_pages": (_list_pages, ["penalty_standard", "penalty_special"]),
+    "get_total_pages": (_total_pages, ["approval_list"]),
+    "get_additional_info": (_additional_info, ["approval_detail"]),
+    "find_target_url": (_find_target_url, ["important_directory"]),
+    "scrape_important_news": (_important_news, ["important_news"]),
+    "find_attachment_link": (_attachment_link, ["penalty_detail"]),
+    "table_scoring": (_table_scoring, ["penalty_table"]),
+}
+
+
+def load_corpus(directory):
+    """
+    读取 <页面类型>/<host>/<路径> 结构的样本目录，返回 [(页面类型, 省份, URL, html)]
+    """
+    sites, _ = penalty_sites()
+    province_by_host = {urlparse(s["base_url"]).netloc: s["province"] for s in sites}
+    corpus = []
+    for dirpath, _, filenames in os.walk(directory):
+        for name in sorted(filenames):
+            path = os.path.join(dirpath, name)
+            parts = os.path.relpath(path, directory).split(os.sep)
+            if len(parts) < 3:
+                continue
+            kind, host = parts[0], parts[1]
+            with open(path, "rb") as f:
+                html = f.read()
+            corpus.append((kind, province_by_host.get(host, ""), f"https://{host}/{'/'.join(parts[2:])}", html))
+    return corpus
+
+
+def _run(func, pages, number):
+    started = time.perf_counter()
+    for _ in range(number):
+        for url, province, html in pages:
+            func(url, province, html)
+    return (time.perf_counter() - started) / number
+
+
+def _calibration(url, province, html):
+    return BeautifulSoup(html, "lxml").find_all("a")
+
+
+CALIBRATION_PAGE = FixtureSite._page("calibration", "".join(
+    f'<ul class="txtlist"><li><span class="date">2025-01-{k % 28 + 1:02d}</span>'
+    f'<a href="{k}.html" title="标题{k}">标题{k}</a></li></ul>' for k in range(200)))
+
+
+def measure(func, pages, repeat):
+    """
+    :param pages: [(url, 省份, html 文本)]
+    :return: {"pages", "ms", "rel", "peak_kb"}
+    """
+    calibration = [("", "", CALIBRATION_PAGE)]
+    number = max(1, int(MIN_ROUND / max(_run(func, pages, 1), 1e-6)) + 1)
+    cal_number = max(1, int(MIN_ROUND / max(_run(_calibration, calibration, 1), 1e-6)) + 1)
+    times, ratios = [], []
+    for _ in range(repeat):
+        gc.collect()
+        cal = _run(_calibration, calibration, cal_number)
+        elapsed = _run(func, pages, number) / len(pages)
+        times.append(elapsed)
+        ratios.append(elapsed / cal)
+
+    peak = 0
+    tracemalloc.start()
+    try:
+        for url, province, html in pages:
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+            func(url, province, html)
+            peak = max(peak, tracemalloc.get_traced_memory()[1] - base)
+    finally:
+        tracemalloc.stop()
+    return {"pages": len(pages), "ms": round(statistics.median(times) * 1000, 3),
+            "rel": round(statistics.median(ratios), 4), "peak_kb": round(peak / 1024, 1)}
+
+
+def combine(runs, threshold):
+    """
+    合并多遍测量的结果作为基准: 各指标取中位数，并按 rel 的离散程度给出用例阈值
+    :param runs: [{用例: measure() 的结果}]
+    """
+    combined = {}
+    for name in runs[0]:
+        results = [r[name] for r in runs]
+        entry = {"pages": results[0]["pages"]}
+        for metric, digits in (("ms", 3), ("rel", 4), ("peak_kb", 1)):
+            entry[metric] = round(statistics.median(r[metric] for r in results), digits)
+        rels = [r["rel"] for r in results]
+        spread = max(abs(v / entry["rel"] - 1) for v in rels) if entry["rel"] else 0
+        entry["threshold"] = round(max(threshold, spread * SPREAD_FACTOR), 2)
+        combined[name] = entry
+    return combined
+
+
+def compare(results, baseline, threshold):
+    """
+    :return: [(用例, 指标, 基准值, 当前值, 阈值)] 超过阈值的回退；用例阈值取基准中记录的和 threshold 中较大的
+    """
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        limit = max(threshold, base.get("threshold", 0))
+        for metric in ("rel", "peak_kb"):
+            if base.get(metric) and result[metric] > base[metric] * (1 + limit):
+                regressions.append((name, metric, base[metric], result[metric], limit))
+    return regressions
+
+
+def run_cases(cases, corpus, repeat):
+    results = {}
+    for name in cases:
+        func, kinds = CASES[name]
+        pages = [(url, province, html.decode("utf-8")) for kind, province, url, html in corpus if kind in kinds]
+        if pages:
+            results[name] = measure(func, pages, repeat)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTML 解析函数微基准")
+    parser.add_argument("--corpus", help="保存的页面目录 (<页面类型>/<host>/<路径>)，默认使用生成的样本")
+    parser.add_argument("--save-corpus", metavar="DIR", help="把生成的样本写到目录后退出")
+    parser.add_argument("--cases", nargs="+", choices=list(CASES), default=list(CASES))
+    parser.add_argument("--repeat", type=int, default=7, help="计时轮数，取中位数")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="基准文件")
+    parser.add_argument("--save-baseline", action="store_true", help="把本次结果写为基准")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="允许的回退比例")
+    parser.add_argument("--runs", type=int, default=BASELINE_RUNS, help="--save-baseline 时整套测量的遍数")
+    args = parser.parse_args()
+
+    if args.save_corpus:
+        print(f"写出 {FixtureSite().save_corpus(args.save_corpus)} 个页面到 {args.save_corpus}")
+        return 0
+
+    corpus = load_corpus(args.corpus) if args.corpus else FixtureSite().corpus()
+    # 进度打印不计入耗时
+    real_stdout, sys.stdout = sys.stdout, open(os.devnull, "w")
+    try:
+        if args.save_baseline:
+            results = combine([run_cases(args.cases, corpus, args.repeat) for _ in range(max(1, args.runs))],
+                              args.threshold)
+        else:
+            results = run_cases(args.cases, corpus, args.repeat)
+    finally:
+        sys.stdout.close()
+        sys.stdout = real_stdout
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f).get("cases", {})
+
+    print(f"{'用例':<28}{'页数':>6}{'ms/页':>10}{'rel':>10}{'基准':>10}{'峰值KB':>10}{'基准':>10}")
+    for name, r in results.items():
+        base = baseline.get(name, {})
+        print(f"{name:<28}{r['pages']:>6}{r['ms']:>10.3f}{r['rel']:>10.4f}{base.get('rel', '-'):>10}"
+              f"{r['peak_kb']:>10.1f}{base.get('peak_kb', '-'):>10}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({"python": platform.python_version(), "machine": platform.machine(),
+                       "cases": {**baseline, **results}}, f, ensure_ascii=False, indent=2)
+            f.write("\n")
+        print(f"基准已写入 {args.baseline}")
+        return 0
+
+    regressions = compare(results, baseline, args.threshold)
+    for name, metric, old, new, limit in regressions:
+        print(f"回退: {name} {metric} {old} -> {new} (+{(new / old - 1) * 100:.0f}%，阈值 {limit * 100:.0f}%)")
+    if not baseline:
+        print("没有基准文件，可用 --save-baseline 生成")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,116 @@
+"""
+对比 dict 与 pboc_records 紧凑记录在 10 万条数据下的内存占用
+
+每种表示在独立子进程中构造，分别报告常驻内存 (RSS) 增量和 tracemalloc 统计。
+用法: python benchmarks/bench_record_memory.py [--count 100000]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+PROVINCES = ["上海市", "北京市", "广东省", "浙江省", "海南省", "四川省", "辽宁省", "陕西省"]
+
+
+def rss_bytes():
+    # Linux 下读取当前 RSS；其他平台退回到峰值 RSS
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def penalty_row(i):
+    province = PROVINCES[i % len(PROVINCES)]
+    # 模拟从网页解析出的字符串: 每条记录都是新建的 str 对象
+    return {
+        "province": "".join(province),
+        "branch": "".join([province, "分行"]) if i % 3 else "辖内分支机构",
+        "title": f"中国人民银行{province}行政处罚信息公示表（第{i}号）",
+        "url": f"https://example.pbc.gov.cn/{i // 1000}/{i}/index.html",
+        "date": f"20{20 + i % 5}-{1 + i % 12:02d}-{1 + i % 28:02d}",
+        "attachments": [],
+    }
+
+
+def inst_row(i):
+    return {
+        "许可证号": f"Z{i:010d}",
+        "公司名称": f"某某支付有限公司{i}",
+        "生成日期": f"20{20 + i % 5}-{1 + i % 12:02d}-{1 + i % 28:02d}",
+        "法定代表人（负责人）": f"张{i % 100}",
+        "住所（营业场所）": f"某市某区某路{i}号",
+        "业务类型": "".join(["储值账户运营", "Ⅰ类" if i % 2 else "Ⅱ类"]),
+        "业务覆盖范围": "".join(["全国"]),
+        "换证日期": "2021-07-01",
+        "首次许可日期": "2011-05-03",
+        "发证日期": "",
+        "有效期至": "2026-05-02",
+        "备注": "",
+    }
+
+
+def build(kind, count):
+    from pboc_records import PenaltyRecord, InstRecord
+    if kind == "penalty_dict":
+        return [penalty_row(i) for i in range(count)]
+    if kind == "penalty_slots":
+        return [PenaltyRecord(penalty_row(i)) for i in range(count)]
+    if kind == "inst_dict":
+        return [inst_row(i) for i in range(count)]
+    if kind == "inst_slots":
+        return [InstRecord(inst_row(i)) for i in range(count)]
+    raise ValueError(kind)
+
+
+def measure(kind, count):
+    before = rss_bytes()
+    tracemalloc.start()
+    data = build(kind, count)
+    traced, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    after = rss_bytes()
+    assert len(data) == count
+    return {"kind": kind, "count": count, "rss_delta": after - before, "traced": traced}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--count", type=int, default=100000)
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure(args.child, args.count)))
+        return
+
+    results = {}
+    for kind in ("penalty_dict", "penalty_slots", "inst_dict", "inst_slots"):
+        out = subprocess.run(
+            [sys.executable, __file__, "--child", kind, "--count", str(args.count)],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        results[kind] = json.loads(out.strip().splitlines()[-1])
+
+    print(f"{'表示':<16}{'RSS 增量(MB)':>14}{'tracemalloc(MB)':>18}")
+    for kind, r in results.items():
+        print(f"{kind:<16}{r['rss_delta'] / 2**20:>14.1f}{r['traced'] / 2**20:>18.1f}")
+    for prefix in ("penalty", "inst"):
+        d, s = results[f"{prefix}_dict"], results[f"{prefix}_slots"]
+        print(f"{prefix}: RSS 减少 {1 - s['rss_delta'] / d['rss_delta']:.0%}，"
+              f"分配减少 {1 - s['traced'] / d['traced']:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+"""
+离线抓取基准: 用本地替身服务器 (pboc_standin_server) 代替人民银行站点，端到端运行各抓取任务
+
+场景 (每个场景在独立子进程中运行，峰值 RSS 互不影响):
+- scrape_and_save   pboc_approval_mysql.scrape_and_save (许可证列表页 + 详情页)
+- run_spider        pboc_penalty_data.run_spider (标准 portlet / 表格两种列表结构；不写数据库、不导出快照)
+- async_fetch_all   pboc_penalty._async_fetch_all (列表页 + 每条记录的详情页附件链接)
+- process_download  web_download_pboc.process_download (详情页 + 附件下载 / 表格转 xlsx；
+                    数据库记录由替身连接按样本生成，下载到临时目录)
+
+报告每个场景的请求数、页面/秒、请求延迟 p50/p99 (客户端计时) 和峰值 RSS。
+线上站点的各省分行是不同的 host，而替身服务器只有一个 host，所以 process_download 默认把
+HOST_DELAY 设为 0 (可用 --host-delay 恢复)，否则同一 host 的礼貌间隔会掩盖抓取本身的开销。
+
+用法:
+    python benchmarks/bench_scrapers.py [--scenarios run_spider ...] [--provinces 上海市 重庆市]
+        [--latency 30 --jitter 20 --error-rate 0.01] [--output result.json]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from pboc_fixtures import (FixtureConfig, FixtureSite, IMPORTANT_DIR_URL, REGISTERED_URL, local_url,
+                           penalty_sites)
+from pboc_standin_server import add_server_arguments, server_from_args
+
+SCENARIOS = ["scrape_and_save", "run_spider", "async_fetch_all", "process_download"]
+DEFAULT_PROVINCES = ["上海市", "重庆市"]
+
+
+class RequestTimer:
+    """
+    包装 requests.Session.request (requests.get 等模块级函数也经过它)，记录每个请求的耗时
+    """
+
+    def __init__(self):
+        self.latencies = []
+        self.failures = 0
+        self._lock = threading.Lock()
+
+    def install(self):
+        import requests
+        original = requests.Session.request
+        timer = self
+
+        def request(session, method, url, *args, **kwargs):
+            started = time.perf_counter()
+            try:
+                resp = original(session, method, url, *args, **kwargs)
+            except Exception:
+                timer.record(time.perf_counter() - started, failed=True)
+                raise
+            # 流式下载的耗时算到读完响应头为止
+            timer.record(time.perf_counter() - started, failed=resp.status_code >= 400)
+            return resp
+
+        requests.Session.request = request
+
+    def record(self, seconds, failed=False):
+        with self._lock:
+            self.latencies.append(seconds)
+            self.failures += failed
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = min(len(ordered) - 1, max(0, int(round(p / 100 * (len(ordered) - 1)))))
+    return ordered[k]
+
+
+def peak_rss_mb():
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+def local_sites(sites, provinces, base):
+    return [{"province": s["province"], "base_url": local_url(s["base_url"], base)}
+            for s in sites if s["province"] in provinces]
+
+
+# ---------------------------------------------------------------- 场景
+def run_scrape_and_save(args):
+    import pboc_approval_mysql
+    rows = pboc_approval_mysql.scrape_and_save(local_url(REGISTERED_URL, args.base), max_workers=args.workers)
+    important = pboc_approval_mysql.scrape_important_news(local_url(IMPORTANT_DIR_URL, args.base),
+                                                          "非银行支付机构重大事项变更许可信息公示")
+    return len(rows) + len(important)
+
+
+def run_run_spider(args):
+    import pboc_penalty_data
+    collected = []
+    pboc_penalty_data.PROVINCE_SITES = local_sites(pboc_penalty_data.PROVINCE_SITES, args.provinces, args.base)
+    pboc_penalty_data.save_to_db = collected.extend
+    pboc_penalty_data.snapshot_after_run = lambda *a, **k: None
+    pboc_penalty_data.run_spider(args.provinces, max_pages=args.pages)
+    return len(collected)
+
+
+def run_async_fetch_all(args):
+    import pboc_penalty
+    pboc_penalty.PROVINCE_SITES = local_sites(pboc_penalty.PROVINCE_SITES, args.provinces, args.base)
+    pboc_penalty._async_fetch_all()
+    if pboc_penalty.PROGRESS["status"] != "done":
+        raise RuntimeError(pboc_penalty.PROGRESS["message"])
+    return len(pboc_penalty.CACHE["store"])
+
+
+class _FixtureCursor:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        province = params[0].strip("%") if params else ""
+        self.result = [r for r in self.rows if province in r["省份"]]
+
+    def fetchall(self):
+        return self.result
+
+
+class FixtureConnection:
+    """
+    替身数据库连接: fetch_province_records 查询时返回按样本页面生成的处罚记录
+    """
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def cursor(self, *args):
+        return _FixtureCursor(self.rows)
+
+    def close(self):
+        pass
+
+
+def fixture_penalty_rows(args):
+    site = FixtureSite(FixtureConfig(pages=args.pages, items=args.items))
+    sites, _ = penalty_sites()
+    rows = []
+    for s in sites:
+        if s["province"] not in args.provinces:
+            continue
+        host = s["base_url"].split("/")[2]
+        directory = s["base_url"].rsplit("/", 1)[0]
+        for page in range(1, args.pages + 1):
+            for href, title, date in site._penalty_items(host, s["province"], page, 0):
+                rows.append({"id": len(rows) + 1, "省份": s["province"], "行政处罚文件": title,
+                             "发布日期": date, "下载链接": local_url(f"{directory}/{href}", args.base)})
+    return rows
+
+
+def run_process_download(args):
+    import web_download_pboc
+    rows = fixture_penalty_rows(args)
+    web_download_pboc.get_db_connection = lambda: FixtureConnection(rows)
+    web_download_pboc.HOST_DELAY = args.host_delay
+    web_download_pboc.manager.add_log = lambda *a, **k: None
+    with tempfile.TemporaryDirectory() as root:
+        web_download_pboc.DOWNLOAD_ROOT = root
+        web_download_pboc.process_batch(args.provinces)
+    return web_download_pboc.manager.success
+
+
+RUNNERS = {
+    "scrape_and_save": run_scrape_and_save,
+    "run_spider": run_run_spider,
+    "async_fetch_all": run_async_fetch_all,
+    "process_download": run_process_download,
+}
+
+
+def child(args):
+    timer = RequestTimer()
+    timer.install()
+    # 被测代码的进度打印不计入结果
+    real_stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    started = time.perf_counter()
+    try:
+        records = RUNNERS[args.child](args)
+    finally:
+        sys.stdout.close()
+        sys.stdout = real_stdout
+    seconds = time.perf_counter() - started
+    n = len(timer.latencies)
+    print(json.dumps({
+        "scenario": args.child,
+        "records": records,
+        "requests": n,
+        "failed": timer.failures,
+        "seconds": round(seconds, 3),
+        "pages_per_sec": round(n / seconds, 1) if seconds else 0,
+        "p50_ms": round(percentile(timer.latencies, 50) * 1000, 1),
+        "p99_ms": round(percentile(timer.latencies, 99) * 1000, 1),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }))
+
+
+def run_scenario(scenario, args, server):
+    cmd = [sys.executable, os.path.abspath(__file__), "--child", scenario, "--base", server.base_url,
+           "--provinces", *args.provinces, "--pages", str(args.pages), "--items", str(args.items),
+           "--workers", str(args.workers), "--host-delay", str(args.host_delay)]
+    server.reset_stats()
+    proc = subprocess.run(cmd, capture_output=True, text=True)
+    if proc.returncode != 0:
+        print(proc.stderr, file=sys.stderr)
+        return {"scenario": scenario, "error": proc.stderr.strip().splitlines()[-1] if proc.stderr else "failed"}
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result["server"] = server.stats()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="离线抓取基准")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--provinces", nargs="+", default=DEFAULT_PROVINCES, help="参与基准的省份")
+    parser.add_argument("--workers", type=int, default=3, help="scrape_and_save 的线程数")
+    parser.add_argument("--host-delay", type=float, default=0, help="process_download 的同 host 请求间隔 (秒)")
+    parser.add_argument("--output", help="把结果写入 JSON 文件")
+    parser.add_argument("--child", choices=SCENARIOS, help=argparse.SUPPRESS)
+    parser.add_argument("--base", help=argparse.SUPPRESS)
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args)
+        return
+
+    server = server_from_args(args).start()
+    print(f"替身服务器 {server.base_url}，延迟 {args.latency:g}±{args.jitter:g} ms，错误率 {args.error_rate:g}")
+    results = []
+    try:
+        for scenario in args.scenarios:
+            result = run_scenario(scenario, args, server)
+            results.append(result)
+            if "error" in result:
+                print(f"{scenario:<17} 失败: {result['error']}")
+                continue
+            print(f"{scenario:<17} {result['requests']:>5} 请求 {result['seconds']:>7.2f} s "
+                  f"{result['pages_per_sec']:>7.1f} 页/s  p50 {result['p50_ms']:>6.1f} ms  "
+                  f"p99 {result['p99_ms']:>6.1f} ms  峰值 RSS {result['peak_rss_mb']:>6.1f} MB  "
+                  f"记录 {result['records']}  失败请求 {result['failed']}")
+    finally:
+        server.stop()
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"args": {k: v for k, v in vars(args).items() if k not in ("child", "base", "output")},
+                       "results": results}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+对比详情页表格转 xlsx 的旧实现 (BeautifulSoup + pandas.to_excel) 与 pboc_table_extract
+
+默认生成一批模拟的人民银行详情页 (导航 / 版权布局表格 + 含 rowspan / colspan 的处罚信息表)；
+也可以用 --pages 指定保存下来的详情页目录 (*.html)。
+每个页面都走完整流程: 解析 -> 找表 -> 规整 -> 写 xlsx，报告每页耗时和加速比。
+用法: python benchmarks/bench_table_extract.py [--pages DIR] [--count 50] [--rows 200]
+"""
+import argparse
+import glob
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import pandas as pd
+from bs4 import BeautifulSoup
+
+import pboc_table_extract
+
+HEADER = ["序号", "当事人名称", "行政处罚决定书文号", "违法行为类型", "行政处罚内容", "作出行政处罚决定机关名称",
+          "作出行政处罚决定日期", "备注"]
+
+
+def synthetic_page(rows, seed):
+    body = []
+    for i in range(rows):
+        # 每 5 行的 "作出决定机关" 合并为一个 rowspan 单元格
+        organ = (f'<td rowspan="{min(5, rows - i)}">中国人民银行某某分行</td>' if i % 5 == 0 else "")
+        body.append(
+            f"<tr><td>{i + 1}</td><td>某某银行股份有限公司{seed}-{i}</td>"
+            f"<td>银某罚决字〔2024〕{i}号</td><td>违反金融统计管理规定&nbsp;</td>"
+            f"<td>罚款{(i + 1) * 10}万元</td>{organ}<td>2024-0{1 + i % 9}-1{i % 9}</td><td> </td></tr>"
+        )
+    table = (
+        '<table border="1"><tr><td colspan="8">中国人民银行某某分行行政处罚信息公示表</td></tr>'
+        + "<tr>" + "".join(f"<th>{h}</th>" for h in HEADER) + "</tr>"
+        + "".join(body)
+        + '<tr><td colspan="8">以上内容为准</td></tr></table>'
+    )
+    nav = "".join(f'<td><a href="/n/{k}.html">栏目{k}</a></td>' for k in range(30))
+    return (
+        "<html><head><meta charset='utf-8'><title>行政处罚</title></head><body>"
+        f"<table><tr>{nav}</tr></table>"
+        f"<div class='content'>{table}</div>"
+        "<table><tr><td>版权所有 中国人民银行</td></tr></table></body></html>"
+    ).encode("utf-8")
+
+
+def legacy_save(content, final_path):
+    """
+    优化前 web_download_pboc.save_table_as_xlsx 的实现
+    """
+    soup = BeautifulSoup(content.decode("utf-8"), "html.parser")
+    keywords = pboc_table_extract.KEYWORDS
+    best_table, best_score = None, 0
+    for table in soup.find_all("table"):
+        text = table.get_text(" ", strip=True)
+        score = sum(1 for kw in keywords if kw in text) + ("中国人民银行" in text)
+        if score > best_score:
+            best_score, best_table = score, table
+    if not best_table or best_score < 2:
+        return False
+    rows_html = best_table.find_all("tr")
+    header_idx = header_cells = None
+    for idx_tr, tr in enumerate(rows_html):
+        cells = tr.find_all(["td", "th"])
+        if not cells:
+            continue
+        texts = [c.get_text(strip=True) for c in cells]
+        row_text = "".join(texts)
+        if "序号" in row_text and ("当事人" in row_text or "当事人名称" in row_text or "单位" in row_text):
+            header_idx, header_cells = idx_tr, texts
+            break
+    if header_idx is None:
+        for idx_tr, tr in enumerate(rows_html):
+            cells = tr.find_all(["td", "th"])
+            texts = [c.get_text(strip=True) for c in cells]
+            if cells and any(texts):
+                header_idx, header_cells = idx_tr, texts
+                break
+    data_rows = []
+    for tr in rows_html[header_idx + 1:]:
+        cells = tr.find_all(["td", "th"])
+        texts = [c.get_text(strip=True) for c in cells]
+        if not cells or not any(texts):
+            continue
+        if "以上内容" in "".join(texts):
+            break
+        data_rows.append(texts)
+    if not (header_cells and data_rows):
+        return False
+    max_len = max(len(header_cells), max(len(r) for r in data_rows))
+    pad = lambda r: (r + [""] * (max_len - len(r)))[:max_len]
+    df = pd.DataFrame([pad(r) for r in data_rows], columns=pad(header_cells))
+    df = df.replace(r"^\s*$", pd.NA, regex=True)
+    df = df.dropna(how="all")
+    df = df.loc[:, df.columns.notnull()]
+    df = df.loc[:, df.columns != ""]
+    df.to_excel(final_path, index=False)
+    return True
+
+
+def new_save(content, final_path):
+    return pboc_table_extract.save_table_as_xlsx(pboc_table_extract.parse_html(content), final_path)
+
+
+def run(func, pages, out_dir):
+    started = time.perf_counter()
+    ok = 0
+    for i, content in enumerate(pages):
+        ok += bool(func(content, os.path.join(out_dir, f"{func.__name__}_{i}.xlsx")))
+    return time.perf_counter() - started, ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pages", help="保存的详情页目录 (*.html)")
+    parser.add_argument("--count", type=int, default=50, help="模拟页面数")
+    parser.add_argument("--rows", type=int, default=200, help="模拟页面的表格行数")
+    args = parser.parse_args()
+
+    if args.pages:
+        pages = []
+        for path in sorted(glob.glob(os.path.join(args.pages, "*.html"))):
+            with open(path, "rb") as f:
+                pages.append(f.read())
+    else:
+        pages = [synthetic_page(args.rows, i) for i in range(args.count)]
+    if not pages:
+        print("没有可用的页面")
+        return
+
+    with tempfile.TemporaryDirectory() as out_dir:
+        # 预热 (导入、首次创建 writer 的开销)
+        legacy_save(pages[0], os.path.join(out_dir, "warm_legacy.xlsx"))
+        new_save(pages[0], os.path.join(out_dir, "warm_new.xlsx"))
+        legacy_time, legacy_ok = run(legacy_save, pages, out_dir)
+        new_time, new_ok = run(new_save, pages, out_dir)
+
+    n = len(pages)
+    print(f"页面 {n} 个")
+    print(f"旧实现 (bs4 + pandas): {legacy_time / n * 1000:8.1f} ms/页，成功 {legacy_ok}")
+    print(f"pboc_table_extract   : {new_time / n * 1000:8.1f} ms/页，成功 {new_ok}")
+    print(f"加速 {legacy_time / new_time:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
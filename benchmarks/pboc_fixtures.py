@@ -0,0 +1,345 @@
+"""
+人民银行各站点页面的离线样本 (供 benchmarks 下的离线基准使用)
+
+按实际站点的页面结构生成确定性的样本页面，同一 URL 每次生成的内容都相同:
+- 行政处罚列表页:
+  - 标准 portlet 结构 (省分行 + 辖内分支机构两个 portlet，moduleid-N.html 分页)
+  - SPECIAL_PROVINCES 的 td#content_right 表格结构 (index_N.html 分页)
+- 行政处罚详情页: 带附件链接，或只有处罚信息表格 (web_download_pboc 的表格回退)
+- 附件文件 (.pdf / .doc / .xlsx)
+- 支付许可证: 列表页 (9398ddc0-N.html / 63ead9a6-N.html)、详情页、重大事项变更目录页和表格页
+
+URL 形如 http://<服务器>/<原站点 host>/<原路径>，local_url() 负责把线上地址映射到本地。
+FixtureSite.render(path) 若在 recorded 目录下找到 <host>/<路径> 文件 (保存下来的真实页面) 则优先使用。
+"""
+import hashlib
+import os
+import re
+import sys
+from urllib.parse import urlparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+APPROVAL_HOST = "www.pbc.gov.cn"
+APPROVAL_DIR = "/zhengwugongkai/4081330/4081344/4081407/4081702/4081749"
+REGISTERED_URL = f"https://{APPROVAL_HOST}{APPROVAL_DIR}/4081783/9398ddc0-{{}}.html"
+UNREGISTERED_URL = f"https://{APPROVAL_HOST}{APPROVAL_DIR}/4081786/63ead9a6-{{}}.html"
+IMPORTANT_DIR_URL = f"https://{APPROVAL_HOST}{APPROVAL_DIR}/4693227/index.html"
+IMPORTANT_KEYWORD = "非银行支付机构重大事项变更许可信息公示"
+
+KEY_WORDS = ["支付宝", "财付通", "拉卡拉", "快钱", "新生", "钱宝"]
+ATTACHMENT_EXTS = (".pdf", ".doc", ".xlsx")
+CONTENT_TYPES = {
+    ".html": "text/html; charset=utf-8",
+    ".pdf": "application/pdf",
+    ".doc": "application/msword",
+    ".xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+
+_SITES = []
+
+
+def penalty_sites():
+    """
+    线上的省份站点列表 (首次调用时复制一份，基准把 PROVINCE_SITES 换成本地地址后不受影响)
+    """
+    if not _SITES:
+        from pboc_penalty_data import PROVINCE_SITES, SPECIAL_PROVINCES
+        _SITES.append(([dict(s) for s in PROVINCE_SITES], set(SPECIAL_PROVINCES)))
+    return _SITES[0]
+
+
+def local_url(url, base):
+    """
+    https://shanghai.pbc.gov.cn/a/b.html -> <base>/shanghai.pbc.gov.cn/a/b.html
+    """
+    parsed = urlparse(url)
+    return f"{base.rstrip('/')}/{parsed.netloc}{parsed.path}"
+
+
+def _seed(*parts):
+    return int(hashlib.md5("|".join(map(str, parts)).encode("utf-8")).hexdigest()[:8], 16)
+
+
+def _date(seed, year=2025):
+    return f"{year}-{1 + seed % 12:02d}-{1 + (seed // 12) % 28:02d}"
+
+
+def _cn_date(seed, year=2025):
+    return f"{year}年{1 + seed % 12}月{1 + (seed // 12) % 28}日"
+
+
+class FixtureConfig:
+    """
+    :param pages: 每个省份每个 portlet 的列表页数
+    :param items: 每个列表页的记录数
+    :param approval_pages: 许可证列表页数 (已许可 / 已注销各自)
+    :param approval_items: 每个许可证列表页的机构数
+    :param attachment_kb: 附件大小
+    :param table_every: 每隔多少条处罚记录有一条只有表格、没有附件
+    """
+
+    def __init__(self, pages=3, items=20, approval_pages=4, approval_items=15, attachment_kb=64, table_every=4):
+        self.pages = pages
+        self.items = items
+        self.approval_pages = approval_pages
+        self.approval_items = approval_items
+        self.attachment_kb = attachment_kb
+        self.table_every = table_every
+
+
+class FixtureSite:
+    def __init__(self, config=None, recorded=None):
+        self.config = config or FixtureConfig()
+        self.recorded = recorded
+        sites, self.special = penalty_sites()
+        # host -> (省份, 列表页所在目录)
+        self.by_host = {}
+        for site in sites:
+            parsed = urlparse(site["base_url"])
+            self.by_host[parsed.netloc] = (site["province"], parsed.path.rsplit("/", 1)[0])
+
+    # ------------------------------------------------------------------ 路由
+    def render(self, path):
+        """
+        :param path: /<host>/<原路径>
+        :return: (状态码, Content-Type, bytes)
+        """
+        if self.recorded:
+            recorded = os.path.join(self.recorded, path.lstrip("/"))
+            if os.path.isfile(recorded):
+                with open(recorded, "rb") as f:
+                    return 200, CONTENT_TYPES.get(os.path.splitext(path)[1], "text/html; charset=utf-8"), f.read()
+
+        host, _, rest = path.lstrip("/").partition("/")
+        rest = "/" + rest
+        name = rest.rsplit("/", 1)[-1]
+        body = None
+        if host == APPROVAL_HOST:
+            body = self._approval(rest, name)
+        elif host in self.by_host:
+            body = self._penalty(host, rest, name)
+        if body is None:
+            return 404, "text/html; charset=utf-8", b"<html><body>404</body></html>"
+        if isinstance(body, bytes):
+            return 200, CONTENT_TYPES.get(os.path.splitext(name)[1], "application/octet-stream"), body
+        return 200, CONTENT_TYPES[".html"], body.encode("utf-8")
+
+    def _penalty(self, host, rest, name):
+        province, directory = self.by_host[host]
+        m = re.fullmatch(r"penalty_(\d+)_(\d+)\.html", name)
+        if m:
+            return self.penalty_detail(host, province, int(m.group(1)), int(m.group(2)))
+        m = re.fullmatch(r"P0\d+_(\d+)_(\d+)(\.\w+)", name)
+        if m:
+            return self.attachment(host, int(m.group(1)), int(m.group(2)), m.group(3))
+        if not rest.startswith(directory + "/"):
+            return None
+        if name == "index.html":
+            return self.penalty_list(host, province, 1)
+        m = re.fullmatch(r"index_(\d+)\.html", name)
+        if m and province in self.special:
+            return self.penalty_list(host, province, int(m.group(1)))
+        m = re.fullmatch(r"(\d+)-(\d+)\.html", name)
+        if m and province not in self.special:
+            return self.penalty_list(host, province, int(m.group(2)), module=int(m.group(1)))
+        return None
+
+    def _approval(self, rest, name):
+        m = re.fullmatch(r"(9398ddc0|63ead9a6)-(\d+)\.html", name)
+        if m:
+            return self.approval_list(m.group(1), int(m.group(2)))
+        m = re.fullmatch(r"inst_(9398ddc0|63ead9a6)_(\d+)\.html", name)
+        if m:
+            return self.approval_detail(m.group(1), int(m.group(2)))
+        if rest == urlparse(IMPORTANT_DIR_URL).path:
+            return self.important_directory()
+        if name == "important_news.html":
+            return self.important_news()
+        return None
+
+    # ------------------------------------------------------------ 行政处罚
+    def _penalty_items(self, host, province, page, portlet):
+        n = self.config.items
+        items = []
+        for i in range(n):
+            idx = (portlet * 1000 + page) * n + i
+            seed = _seed(host, idx)
+            title = f"中国人民银行{province}行政处罚信息公示表（{2025 - seed % 3}年第{idx}期）"
+            if seed % 7 == 0:
+                title = f"{KEY_WORDS[seed % len(KEY_WORDS)]}支付有限公司行政处罚信息公示（第{idx}号）"
+            items.append((f"penalty_{portlet}_{idx}.html", title, _date(seed, 2025 - seed % 3)))
+        return items
+
+    def penalty_list(self, host, province, page, module=None):
+        if page > self.config.pages:
+            return None
+        if province in self.special:
+            return self._special_list(host, province, page)
+        portlets = []
+        for portlet, (title, module_id) in enumerate([(f"{province}分行行政处罚", 10983),
+                                                       ("辖内分支机构行政处罚", 10984)]):
+            if module is not None and module != module_id:
+                continue
+            lis = "".join(
+                f'<li><span class="date">{d}</span><a href="{href}" title="{t}" target="_blank">{t}</a></li>'
+                for href, t, d in self._penalty_items(host, province, page, portlet)
+            )
+            pager = "".join(f'<a href="{module_id}-{k}.html">{k}</a>' for k in range(2, self.config.pages + 1))
+            portlets.append(
+                f'<div class="txtbox_2 portlet" opentype="page">'
+                f'<div class="title"><span class="portlettitle2">{title}</span></div>'
+                f'<ul class="txtlist">{lis}</ul>'
+                f'<div class="list_page">{pager}</div>'
+                f'<input type="hidden" name="article_paging_list_hidden" moduleid="{module_id}" '
+                f'totalpage="{self.config.pages}"></div>'
+            )
+        return self._page(f"{province}行政处罚", "".join(portlets))
+
+    def _special_list(self, host, province, page):
+        rows = ['<table width="90%"><tr><td>公开信息名称</td><td>生成日期</td></tr></table>']
+        for href, t, d in self._penalty_items(host, province, page, 0):
+            rows.append(f'<table width="90%"><tr><td><a href="{href}" title="{t}">{t}</a></td>'
+                        f'<td>{d}</td></tr></table>')
+        pager = "".join(f'<a href="index_{k}.html">{k}</a>' for k in range(2, self.config.pages + 1))
+        body = (f'<table><tr><td id="content_left">导航</td><td id="content_right">{"".join(rows)}'
+                f'<div class="list_page">{pager}</div></td></tr></table>')
+        return self._page(f"{province}行政处罚", body)
+
+    def penalty_detail(self, host, province, portlet, idx):
+        seed = _seed(host, "detail", idx)
+        if self.config.table_every and idx % self.config.table_every == 0:
+            return self._page("行政处罚信息公示表", self._penalty_table(province, seed))
+        ext = ATTACHMENT_EXTS[seed % len(ATTACHMENT_EXTS)]
+        return self._page(
+            "行政处罚信息公示",
+            f'<div class="content"><p>中国人民银行{province}行政处罚信息公示，详见附件。</p>'
+            f'<p><a href="P0{seed % 1000:03d}_{portlet}_{idx}{ext}">行政处罚信息公示表{ext}</a></p></div>'
+        )
+
+    def _penalty_table(self, province, seed, rows=12):
+        header = ["序号", "当事人名称", "行政处罚决定书文号", "违法行为类型", "行政处罚内容",
+                  "作出行政处罚决定机关名称", "作出行政处罚决定日期", "备注"]
+        body = []
+        for i in range(rows):
+            organ = (f'<td rowspan="{min(4, rows - i)}">中国人民银行{province}分行</td>' if i % 4 == 0 else "")
+            body.append(f"<tr><td>{i + 1}</td><td>某某银行股份有限公司{seed % 97}-{i}</td>"
+                        f"<td>银罚决字〔2025〕{seed % 50 + i}号</td><td>违反反洗钱管理规定</td>"
+                        f"<td>罚款{(i + 1) * 10}万元</td>{organ}<td>{_date(seed + i)}</td><td></td></tr>")
+        return ('<table border="1"><tr><td colspan="8">行政处罚信息公示表</td></tr><tr>'
+                + "".join(f"<th>{h}</th>" for h in header) + "</tr>" + "".join(body)
+                + '<tr><td colspan="8">以上内容为准</td></tr></table>')
+
+    def attachment(self, host, portlet, idx, ext):
+        size = self.config.attachment_kb * 1024
+        block = hashlib.sha256(f"{host}{portlet}{idx}".encode()).digest() * 64
+        data = (block * (size // len(block) + 1))[:size]
+        return b"%PDF-1.4\n" + data if ext == ".pdf" else data
+
+    # ------------------------------------------------------------ 支付许可证
+    def approval_list(self, kind, page):
+        if page > self.config.approval_pages:
+            return None
+        lis = ['<li><span class="xkzh">许可证编号</span><span class="jgmc">公司名称</span>'
+               '<span class="date">发布日期</span></li>']
+        for i in range(self.config.approval_items):
+            idx = (page - 1) * self.config.approval_items + i
+            seed = _seed(kind, idx)
+            lis.append(f'<li><span class="xkzh">Z20{seed % 90 + 10:02d}{idx:06d}</span>'
+                       f'<span class="jgmc"><a href="inst_{kind}_{idx}.html" title="某某支付有限公司{idx}">'
+                       f'某某支付有限公司{idx}</a></span><span class="date">{_cn_date(seed)}</span></li>')
+        total = self.config.approval_pages
+        pager = (f'<span style="padding:0 15px;">共<b>{total * self.config.approval_items}</b>条 '
+                 f'第<b>{page}</b>页 共<b>{total}</b>页</span>')
+        return self._page("支付业务许可", f'<ul class="txtlist">{"".join(lis)}</ul><div>{pager}</div>')
+
+    def approval_detail(self, kind, idx):
+        seed = _seed(kind, "detail", idx)
+        fields = [
+            ("许可证编号", f"Z20{seed % 90 + 10:02d}{idx:06d}"),
+            ("公司名称", f"某某支付有限公司{idx}"),
+            ("法定代表人（负责人）", f"张{seed % 100}"),
+            ("住所（营业场所）", f"某省某市某区某路{seed % 500}号"),
+            ("业务类型", "储值账户运营Ⅰ类" if seed % 2 else "支付交易处理Ⅱ类"),
+            ("业务覆盖范围", "全国" if seed % 3 else "某省"),
+            ("换证日期", _cn_date(seed, 2021)),
+            ("首次许可日期", _cn_date(seed, 2011)),
+            ("有效期至", _cn_date(seed, 2026)),
+            ("备注", ""),
+        ]
+        rows = "".join(f"<tr><td>{k}</td><td>{v}</td></tr>" for k, v in fields)
+        return self._page("支付业务许可详情", f'<table><tbody>{rows}</tbody></table>')
+
+    def important_directory(self):
+        links = "".join(f'<li><a href="other_{k}.html" title="其他公示{k}">其他公示{k}</a></li>' for k in range(20))
+        return self._page("重大事项变更", f'<ul>{links}<li><a href="important_news.html" '
+                                          f'title="{IMPORTANT_KEYWORD}">{IMPORTANT_KEYWORD}</a></li></ul>')
+
+    def important_news(self, rows=60):
+        header = ["序号", "被许可人名称（姓名）", "许可文件编号", "许可文件名称", "有效期限", "许可内容", "许可机关"]
+        body = "".join(
+            f"<tr><td>{i + 1}</td><td>某某支付有限公司{i}</td><td>银许准予决字〔2025〕第{i}号</td>"
+            f"<td>关于某某支付有限公司变更事项的批复</td><td>长期</td><td>变更主要出资人</td><td>中国人民银行</td></tr>"
+            for i in range(rows)
+        )
+        return self._page(IMPORTANT_KEYWORD, "<table><tr>" + "".join(f"<td>{h}</td>" for h in header)
+                          + f"</tr>{body}</table>")
+
+    @staticmethod
+    def _page(title, body):
+        nav = "".join(f'<li><a href="/nav/{k}.html">栏目{k}</a></li>' for k in range(25))
+        return (f'<!DOCTYPE html><html><head><meta charset="utf-8"><title>{title}</title></head><body>'
+                f'<div class="header"><ul class="nav">{nav}</ul></div>{body}'
+                f'<div class="footer">中国人民银行 版权所有</div></body></html>')
+
+    # ------------------------------------------------------------ 样本集
+    def corpus(self, provinces=None):
+        """
+        解析基准用的样本集: [(页面类型, 省份, 线上 URL, html)]
+        """
+        sites, _ = penalty_sites()
+        result = []
+        for site in sites:
+            province = site["province"]
+            if provinces and province not in provinces:
+                continue
+            parsed = urlparse(site["base_url"])
+            kind = "penalty_special" if province in self.special else "penalty_standard"
+            directory = parsed.path.rsplit("/", 1)[0]
+            for page in (1, 2):
+                name = "index.html" if page == 1 else (
+                    f"index_{page}.html" if province in self.special else f"10983-{page}.html")
+                url = f"https://{parsed.netloc}{directory}/{name}"
+                result.append((kind, province, url, self.render(f"/{parsed.netloc}{directory}/{name}")[2]))
+            detail_url = f"https://{parsed.netloc}{directory}/penalty_0_1.html"
+            table_url = f"https://{parsed.netloc}{directory}/penalty_0_{self.config.table_every or 4}.html"
+            result.append(("penalty_detail", province, detail_url,
+                           self.render(f"/{parsed.netloc}{directory}/penalty_0_1.html")[2]))
+            result.append(("penalty_table", province, table_url,
+                           self.render(f"/{parsed.netloc}{directory}/{table_url.rsplit('/', 1)[1]}")[2]))
+        for kind, url in (("9398ddc0", REGISTERED_URL), ("63ead9a6", UNREGISTERED_URL)):
+            list_url = url.format(1)
+            result.append(("approval_list", "", list_url, self.render(local_url(list_url, ""))[2]))
+            detail_url = list_url.rsplit("/", 1)[0] + f"/inst_{kind}_0.html"
+            result.append(("approval_detail", "", detail_url, self.render(local_url(detail_url, ""))[2]))
+        result.append(("important_directory", "", IMPORTANT_DIR_URL, self.render(local_url(IMPORTANT_DIR_URL, ""))[2]))
+        important_url = IMPORTANT_DIR_URL.rsplit("/", 1)[0] + "/important_news.html"
+        result.append(("important_news", "", important_url, self.render(local_url(important_url, ""))[2]))
+        return result
+
+    def save_corpus(self, directory, provinces=None):
+        """
+        把样本集写到 directory/<页面类型>/<host>/<路径>，便于查看或替换为真实页面
+        """
+        count = 0
+        for kind, _, url, html in self.corpus(provinces):
+            parsed = urlparse(url)
+            path = os.path.join(directory, kind, parsed.netloc, parsed.path.lstrip("/"))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(html)
+            count += 1
+        return count
@@ -0,0 +1,153 @@
+"""
+人民银行站点的本地替身服务器 (离线基准用)
+
+按 pboc_fixtures 生成的样本页面应答，可注入延迟和错误，用于在不访问线上站点的情况下
+复现抓取任务的性能。URL 形如 http://127.0.0.1:<端口>/<原站点 host>/<原路径>。
+
+用法:
+    python benchmarks/pboc_standin_server.py --port 8765 --latency 50 --jitter 20 --error-rate 0.02
+    python benchmarks/pboc_standin_server.py --recorded saved_pages/   # 优先使用保存下来的真实页面
+"""
+import argparse
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from pboc_fixtures import FixtureConfig, FixtureSite
+
+# 注入的错误: 503 应答，或直接断开连接
+ERROR_KINDS = ("503", "reset")
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # 响应头和正文分两次写出，不关 Nagle 时 keep-alive 连接会叠加约 40ms 的延迟确认
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server.standin
+        delay, error = server.plan()
+        if delay:
+            time.sleep(delay)
+        if error == "reset":
+            server.count(error=True)
+            self.close_connection = True
+            self.connection.close()
+            return
+        if error == "503":
+            server.count(error=True)
+            self._send(503, "text/plain; charset=utf-8", b"Service Unavailable")
+            return
+        status, content_type, body = server.site.render(self.path.split("?", 1)[0])
+        server.count(sent=len(body))
+        self._send(status, content_type, body)
+
+    def _send(self, status, content_type, body):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class StandinServer:
+    """
+    :param latency: 每个请求的基础延迟 (秒)
+    :param jitter: 在基础延迟上随机增加 0~jitter 秒
+    :param error_rate: 注入错误的比例 (0~1)
+    :param error_kind: "503" 或 "reset"
+    """
+
+    def __init__(self, site=None, host="127.0.0.1", port=0, latency=0.0, jitter=0.0,
+                 error_rate=0.0, error_kind="503", seed=0):
+        self.site = site or FixtureSite()
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_kind = error_kind
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.bytes_sent = 0
+        self.httpd = ThreadingHTTPServer((host, port), _Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.standin = self
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def plan(self):
+        with self._lock:
+            delay = self.latency + (self._random.random() * self.jitter if self.jitter else 0)
+            error = self.error_kind if self.error_rate and self._random.random() < self.error_rate else None
+        return delay, error
+
+    def count(self, sent=0, error=False):
+        with self._lock:
+            self.requests += 1
+            self.errors += error
+            self.bytes_sent += sent
+
+    def stats(self):
+        with self._lock:
+            return {"requests": self.requests, "errors": self.errors, "bytes_sent": self.bytes_sent}
+
+    def reset_stats(self):
+        with self._lock:
+            self.requests = self.errors = self.bytes_sent = 0
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def add_server_arguments(parser):
+    parser.add_argument("--latency", type=float, default=0, help="每个请求的基础延迟 (毫秒)")
+    parser.add_argument("--jitter", type=float, default=0, help="随机附加延迟上限 (毫秒)")
+    parser.add_argument("--error-rate", type=float, default=0, help="注入错误的比例 (0~1)")
+    parser.add_argument("--error-kind", choices=ERROR_KINDS, default="503", help="注入的错误类型")
+    parser.add_argument("--pages", type=int, default=3, help="每个省份每个栏目的列表页数")
+    parser.add_argument("--items", type=int, default=20, help="每个列表页的记录数")
+    parser.add_argument("--approval-pages", type=int, default=4, help="许可证列表页数")
+    parser.add_argument("--approval-items", type=int, default=15, help="每个许可证列表页的机构数")
+    parser.add_argument("--attachment-kb", type=int, default=64, help="附件大小 (KB)")
+    parser.add_argument("--recorded", help="保存的真实页面目录 (<host>/<路径>)，存在时优先使用")
+
+
+def server_from_args(args, port=0):
+    config = FixtureConfig(pages=args.pages, items=args.items, approval_pages=args.approval_pages,
+                           approval_items=args.approval_items, attachment_kb=args.attachment_kb)
+    return StandinServer(FixtureSite(config, args.recorded), port=port, latency=args.latency / 1000,
+                         jitter=args.jitter / 1000, error_rate=args.error_rate, error_kind=args.error_kind)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="人民银行站点的本地替身服务器")
+    parser.add_argument("--port", type=int, default=8765)
+    add_server_arguments(parser)
+    args = parser.parse_args()
+    server = server_from_args(args, args.port)
+    print(f"Serving fixtures on {server.base_url}/<host>/<path>")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
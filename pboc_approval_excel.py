@@ -1,5 +1,9 @@
 r"""
 爬取中国人民银行公示的支付许可证信息，保存到 D:\excel\pbc_inst_register.xlsx
+
+导出是流式的: 每抓完一页就把该页写入文件，不在内存中保留全部记录。
+xlsx 使用 xlsxwriter 的 constant_memory 模式；也可以用 --format csv / parquet
+为每个工作表各输出一个文件，供下游工具使用。
 """
 import requests
 from bs4 import BeautifulSoup
@@ -7,20 +11,33 @@ import time
 from urllib.parse import urljoin
 import re
 import os
-import pandas as pd
+import csv
+import argparse
+import xlsxwriter
 from concurrent.futures import ThreadPoolExecutor, as_completed
+from pboc_records import InstRecord
+import pboc_trace
+import pboc_fetch_cache
+import pboc_metrics
 
 # output_path = r"D:\excel\中国人民银行行政审批公示.xlsx"
 output_path = r"/Users/zhouwei/EXCEL/中国人民银行行政审批公示.xlsx"
 
-def log_time_taken(start_time, step_description):
-    """
-    辅助函数：记录并打印某个步骤的耗时
-    :param start_time: 步骤开始的时间戳
-    :param step_description: 步骤描述
-    """
-    end_time = time.time()
-    print(f"{step_description} 用时 {end_time - start_time:.2f} 秒")
+EXPORT_FORMATS = ("xlsx", "csv", "parquet")
+# parquet 每攒够这么多行写一个 row group
+PARQUET_BATCH = 5000
+
+# 1. 已获许可机构（pbc_inst_registered）字段定义
+COLS_REGISTERED = [
+    "许可证号", "公司名称", "生成日期", "法定代表人（负责人）", "住所（营业场所）",
+    "业务类型", "业务覆盖范围", "换证日期", "首次许可日期", "有效期至", "备注"
+]
+
+# 2. 已注销许可机构（pbc_inst_unregistered）字段定义
+COLS_UNREGISTERED = [
+    "许可证号", "公司名称", "生成日期", "法定代表人（负责人）", "住所（营业场所）",
+    "业务类型", "业务覆盖范围", "换证日期", "首次许可日期", "发证日期", "有效期至", "备注"
+]
 
 def convert_date_format(date_string):
     """
@@ -37,14 +54,25 @@ def convert_date_format(date_string):
         return f"{year}-{int(month):02d}-{int(day):02d}"
     return date_string
 
+@pboc_fetch_cache.memoized
+def fetch_html(url):
+    """
+    下载列表页 / 目录页；同一次运行中重复的 URL 只请求一次
+    (如 get_total_pages 与 scrape_page 都要第一页，见 pboc_fetch_cache)
+    """
+    with pboc_trace.span("fetch", url=url):
+        response = requests.get(url, timeout=15, hooks=pboc_metrics.HTTP_HOOKS)
+        # 出错页面不能当作列表页解析 (否则总页数会被当作 1)
+        response.raise_for_status()
+        response.encoding = response.apparent_encoding or 'utf-8'
+    return response.text
+
 def get_total_pages(url):
     """
     获取列表页的总页数
     通过解析页面底部的分页控件（通常是倒数第二个加粗的数字）来获取
     """
-    response = requests.get(url, timeout=15)
-    response.encoding = response.apparent_encoding or 'utf-8'
-    soup = BeautifulSoup(response.text, 'html.parser')
+    soup = pboc_fetch_cache.soup(fetch_html(url), 'html.parser')
     span = soup.find('span', style="padding:0 15px;")
     if span:
         b_tags = span.find_all('b')
@@ -52,15 +80,24 @@ def get_total_pages(url):
             return int(b_tags[2].text)
     return 1
 
+@pboc_trace.traced("detail")
 def get_additional_info(url):
     """
     抓取详情页面的详细信息
     :param url: 详情页链接
     :return: 包含详情字段的字典
     """
-    response = requests.get(url, timeout=15)
-    response.encoding = response.apparent_encoding or 'utf-8'
-    soup = BeautifulSoup(response.text, 'html.parser')
+    with pboc_trace.span("fetch", url=url):
+        response = requests.get(url, timeout=15)
+        response.encoding = response.apparent_encoding or 'utf-8'
+    with pboc_trace.span("parse"):
+        return parse_additional_info(response.text)
+
+def parse_additional_info(html):
+    """
+    从详情页 HTML 中解析详细信息 (get_additional_info 的解析部分)
+    """
+    soup = BeautifulSoup(html, 'html.parser')
     tbody = soup.find('tbody')
     info: dict[str, str] = {}
     if tbody:
@@ -94,15 +131,15 @@ def get_additional_info(url):
                         break
     return info
 
+@pboc_trace.traced("page")
 def scrape_page(url):
     """
     抓取单个列表页的数据，并自动进入详情页抓取补充信息
     :param url: 列表页 URL
     :return: 包含该页所有记录的列表，每条记录是一个字典
     """
-    response = requests.get(url, timeout=15)
-    response.encoding = response.apparent_encoding or 'utf-8'
-    soup = BeautifulSoup(response.text, 'html.parser')
+    # 第一页在 get_total_pages 中已下载并解析过，这里直接复用
+    soup = pboc_fetch_cache.soup(fetch_html(url), 'html.parser')
     ul_element = soup.find('ul', class_='txtlist')
     data = []
     if ul_element:
@@ -145,35 +182,49 @@ def scrape_page(url):
                 '有效期至': additional_info.get('有效期至', ''),
                 '备注': additional_info.get('备注', '')
             }
-            data.append(row_dict)
+            data.append(InstRecord(row_dict))
             
     return data
 
-def scrape_and_save(base_url):
+def iter_pages(base_url):
     """
-    主抓取逻辑：遍历所有分页，抓取并汇总数据
+    遍历所有分页，每抓完一页就产出该页的记录列表 (按完成顺序)
     :param base_url: 包含分页占位符 {} 的基础 URL
-    :return: 所有抓取到的数据列表
     """
-    all_data = []
     total_pages = get_total_pages(base_url.format(1))
     print(f"开始抓取，总页数: {total_pages}，使用3个线程并行抓取")
     
     with ThreadPoolExecutor(max_workers=3) as executor:
-        future_to_page = {executor.submit(scrape_page, base_url.format(i)): i for i in range(1, total_pages + 1)}
+        future_to_page = {executor.submit(pboc_trace.wrap(scrape_page), base_url.format(i)): i for i in range(1, total_pages + 1)}
         
         completed_count = 0
+        total_count = 0
         for future in as_completed(future_to_page):
             page_num = future_to_page[future]
             try:
                 page_data = future.result()
-                all_data.extend(page_data)
                 completed_count += 1
+                total_count += len(page_data)
                 # 实时打印进度日志
-                print(f"进度: 已完成 {completed_count}/{total_pages} 页 (第 {page_num} 页) | 本页抓取: {len(page_data)} 条 | 累计抓取: {len(all_data)} 条")
+                print(f"进度: 已完成 {completed_count}/{total_pages} 页 (第 {page_num} 页) | 本页抓取: {len(page_data)} 条 | 累计抓取: {total_count} 条")
             except Exception as e:
                 print(f"第 {page_num} 页抓取失败: {e}")
-                
+                continue
+            yield page_data
+
+def scrape_and_save(base_url, sink=None):
+    """
+    主抓取逻辑：遍历所有分页，抓取并汇总数据
+    :param base_url: 包含分页占位符 {} 的基础 URL
+    :param sink: SheetWriter；给出时每页数据直接写入，不再保留在内存中
+    :return: 所有抓取到的数据列表 (给出 sink 时为空列表)
+    """
+    all_data = []
+    for page_data in iter_pages(base_url):
+        if sink is not None:
+            sink.write_rows(page_data)
+        else:
+            all_data.extend(page_data)
     return all_data
 
 def find_target_url(base_url, keyword):
@@ -185,9 +236,7 @@ def find_target_url(base_url, keyword):
     """
     print(f"正在搜索'{keyword}'...")
     try:
-        response = requests.get(base_url, timeout=15)
-        response.encoding = response.apparent_encoding or 'utf-8'
-        soup = BeautifulSoup(response.text, 'html.parser')
+        soup = pboc_fetch_cache.soup(fetch_html(base_url), 'html.parser')
         
         # 遍历所有链接，查找文本或 title 属性中包含关键字的链接
         for a_tag in soup.find_all('a'):
@@ -222,9 +271,7 @@ def scrape_important_news(directory_url, keyword):
 
     # 步骤 2: 抓取目标页面内容
     try:
-        response = requests.get(target_url, timeout=15)
-        response.encoding = response.apparent_encoding or 'utf-8'
-        soup = BeautifulSoup(response.text, 'html.parser')
+        soup = pboc_fetch_cache.soup(fetch_html(target_url), 'html.parser')
         
         table = soup.find('table')
         data = []
@@ -241,72 +288,207 @@ def scrape_important_news(directory_url, keyword):
         print(f"抓取重大事项变更数据失败: {e}")
         return []
 
-def export_to_excel(registered_data, unregistered_data, important_news_data, output_path):
-    # 1. 已获许可机构（pbc_inst_registered）字段定义
-    cols_registered = [
-        "许可证号", "公司名称", "生成日期", "法定代表人（负责人）", "住所（营业场所）", 
-        "业务类型", "业务覆盖范围", "换证日期", "首次许可日期", "有效期至", "备注"
-    ]
-    
-    # 2. 已注销许可机构（pbc_inst_unregistered）字段定义
-    cols_unregistered = [
-        "许可证号", "公司名称", "生成日期", "法定代表人（负责人）", "住所（营业场所）", 
-        "业务类型", "业务覆盖范围", "换证日期", "首次许可日期", "发证日期", "有效期至", "备注"
-    ]
-    
-    df_registered = pd.DataFrame(registered_data, columns=cols_registered)
-    df_unregistered = pd.DataFrame(unregistered_data, columns=cols_unregistered)
-    
-    # 处理重大事项变更数据
-    df_important = pd.DataFrame()
-    if important_news_data and len(important_news_data) > 0:
-        # 假设第一行为表头
-        try:
-            columns_imp = important_news_data[0]
-            data_imp = important_news_data[1:]
-            
-            if columns_imp and len(data_imp) > 0:
-                # 数据清洗：确保每行数据长度与表头一致
-                cleaned_data = []
-                for row in data_imp:
-                    # 如果行长度小于表头，用空字符串补齐
-                    if len(row) < len(columns_imp):
-                        row = row + [''] * (len(columns_imp) - len(row))
-                    # 如果行长度大于表头，截断
-                    elif len(row) > len(columns_imp):
-                        row = row[:len(columns_imp)]
-                    cleaned_data.append(row)
-                    
-                df_important = pd.DataFrame(cleaned_data, columns=columns_imp)
-        except Exception as e:
-            print(f"创建重大事项变更DataFrame失败: {e}")
-    
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    with pd.ExcelWriter(output_path) as writer:
-        df_registered.to_excel(writer, sheet_name="已许可", index=False)
-        df_unregistered.to_excel(writer, sheet_name="已注销", index=False)
-        if not df_important.empty:
-            df_important.to_excel(writer, sheet_name="重大事项变更", index=False)
-    print(f"已导出到: {output_path}")
+def clean_important_rows(important_news_data):
+    """
+    重大事项变更数据: 第一行为表头，其余行补齐或截断到表头长度
+    :return: (表头, 数据行列表)，没有数据时返回 (None, [])
+    """
+    if not important_news_data or not important_news_data[0] or len(important_news_data) < 2:
+        return None, []
+    columns_imp = important_news_data[0]
+    cleaned_data = []
+    for row in important_news_data[1:]:
+        # 如果行长度小于表头，用空字符串补齐；大于表头则截断
+        if len(row) < len(columns_imp):
+            row = row + [''] * (len(columns_imp) - len(row))
+        elif len(row) > len(columns_imp):
+            row = row[:len(columns_imp)]
+        cleaned_data.append(row)
+    return columns_imp, cleaned_data
+
+def _row_values(row, columns):
+    # InstRecord / dict 按列名取值，列表按位置
+    if isinstance(row, (list, tuple)):
+        return list(row)
+    return [row.get(c, '') for c in columns]
+
+class SheetWriter:
+    """
+    一个工作表 (或 csv / parquet 下的一个文件) 的逐行写入器，由 StreamingExporter.sheet 创建
+    """
+    def __init__(self, exporter, name, columns):
+        self.exporter = exporter
+        self.name = name
+        self.columns = list(columns)
+        self.rows = 0
+
+    def write_rows(self, rows):
+        started = time.time()
+        values = [_row_values(row, self.columns) for row in rows]
+        if values:
+            with pboc_trace.span("write", self.name, rows=len(values)):
+                self._write(values)
+            self.rows += len(values)
+        self.exporter.write_seconds += time.time() - started
+
+    def _write(self, values):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+class _XlsxSheet(SheetWriter):
+    def __init__(self, exporter, name, columns):
+        super().__init__(exporter, name, columns)
+        self.worksheet = exporter.workbook.add_worksheet(name)
+        self.worksheet.write_row(0, 0, self.columns, exporter.header_format)
+
+    def _write(self, values):
+        for i, row in enumerate(values, start=self.rows + 1):
+            self.worksheet.write_row(i, 0, row)
+
+class _CsvSheet(SheetWriter):
+    def __init__(self, exporter, name, columns):
+        super().__init__(exporter, name, columns)
+        self.path = exporter.sheet_path(name)
+        # utf-8-sig 便于 Excel 直接打开
+        self.file = open(self.path, "w", encoding="utf-8-sig", newline="")
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(self.columns)
+
+    def _write(self, values):
+        self.writer.writerows(values)
+
+    def close(self):
+        self.file.close()
+
+class _ParquetSheet(SheetWriter):
+    def __init__(self, exporter, name, columns):
+        super().__init__(exporter, name, columns)
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        self.pa = pa
+        self.path = exporter.sheet_path(name)
+        # 表头可能有重复列名 (重大事项变更)，parquet 要求唯一
+        names = []
+        for c in self.columns:
+            name_c = str(c) or "列"
+            while name_c in names:
+                name_c += "_"
+            names.append(name_c)
+        self.schema = pa.schema([(c, pa.string()) for c in names])
+        self.writer = pq.ParquetWriter(self.path, self.schema)
+        self.buffer = []
+
+    def _write(self, values):
+        self.buffer.extend(values)
+        if len(self.buffer) >= PARQUET_BATCH:
+            self._flush()
+
+    def _flush(self):
+        if not self.buffer:
+            return
+        columns = list(zip(*self.buffer))
+        arrays = [self.pa.array([None if v is None else str(v) for v in col], self.pa.string()) for col in columns]
+        self.writer.write_table(self.pa.Table.from_arrays(arrays, schema=self.schema))
+        self.buffer = []
+
+    def close(self):
+        self._flush()
+        self.writer.close()
+
+class StreamingExporter:
+    """
+    流式导出: xlsx 时各工作表写在同一个 constant_memory 工作簿中；
+    csv / parquet 时每个工作表输出为 <文件名>_<工作表>.<格式>
+    """
+    def __init__(self, output_path, fmt="xlsx"):
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"不支持的导出格式: {fmt}")
+        self.fmt = fmt
+        self.output_path = os.path.splitext(output_path)[0] + "." + fmt
+        self.sheets = []
+        self.write_seconds = 0.0
+        self.workbook = None
+        os.makedirs(os.path.dirname(self.output_path) or ".", exist_ok=True)
+        if fmt == "xlsx":
+            self.workbook = xlsxwriter.Workbook(self.output_path, {"constant_memory": True})
+            self.header_format = self.workbook.add_format({"bold": True})
+
+    def sheet_path(self, name):
+        return f"{os.path.splitext(self.output_path)[0]}_{name}.{self.fmt}"
+
+    def sheet(self, name, columns):
+        cls = {"xlsx": _XlsxSheet, "csv": _CsvSheet, "parquet": _ParquetSheet}[self.fmt]
+        sheet = cls(self, name, columns)
+        self.sheets.append(sheet)
+        return sheet
+
+    def paths(self):
+        if self.fmt == "xlsx":
+            return [self.output_path]
+        return [s.path for s in self.sheets]
+
+    @property
+    def rows(self):
+        return sum(s.rows for s in self.sheets)
+
+    def close(self):
+        for s in self.sheets:
+            s.close()
+        if self.workbook is not None:
+            self.workbook.close()
+
+def write_important_sheet(exporter, important_news_data):
+    columns_imp, cleaned_data = clean_important_rows(important_news_data)
+    if columns_imp:
+        exporter.sheet("重大事项变更", columns_imp).write_rows(cleaned_data)
+
+def export_to_excel(registered_data, unregistered_data, important_news_data, output_path, fmt="xlsx"):
+    """
+    一次性导出已抓取好的数据 (流式写入，不构造 DataFrame)
+    """
+    exporter = StreamingExporter(output_path, fmt)
+    try:
+        exporter.sheet("已许可", COLS_REGISTERED).write_rows(registered_data)
+        exporter.sheet("已注销", COLS_UNREGISTERED).write_rows(unregistered_data)
+        write_important_sheet(exporter, important_news_data)
+    finally:
+        exporter.close()
+    print(f"已导出到: {', '.join(exporter.paths())}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="爬取人民银行支付许可证信息并导出")
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="xlsx", help="导出格式")
+    parser.add_argument("--output", default=output_path, help="输出文件 (扩展名按格式替换)")
+    args = parser.parse_args(argv)
+
+    trace = pboc_trace.begin("pboc_approval_excel")
+    fetch_cache = pboc_fetch_cache.begin("pboc_approval_excel")
+    exporter = StreamingExporter(args.output, args.format)
+    try:
+        # 任务一：抓取“已获许可机构”数据，边抓边写
+        with pboc_trace.phase("抓取“已获许可机构”数据"):
+            base_url1 = "https://www.pbc.gov.cn/zhengwugongkai/4081330/4081344/4081407/4081702/4081749/4081783/9398ddc0-{}.html"
+            scrape_and_save(base_url1, exporter.sheet("已许可", COLS_REGISTERED))
+
+        # 任务二：抓取“已注销许可机构”数据
+        with pboc_trace.phase("抓取“已注销许可机构”数据"):
+            base_url2 = "https://www.pbc.gov.cn/zhengwugongkai/4081330/4081344/4081407/4081702/4081749/4081786/63ead9a6-{}.html"
+            scrape_and_save(base_url2, exporter.sheet("已注销", COLS_UNREGISTERED))
+
+        # 任务三：抓取“非银行支付机构重大事项变更许可信息公示”数据
+        with pboc_trace.phase("抓取“重大事项变更”数据"):
+            directory_url = "https://www.pbc.gov.cn/zhengwugongkai/4081330/4081344/4081407/4081702/4081749/4693227/index.html"
+            important_news_data = scrape_important_news(directory_url, "非银行支付机构重大事项变更许可信息公示")
+            write_important_sheet(exporter, important_news_data)
+    finally:
+        with pboc_trace.phase("导出收尾", show_memory=True):
+            exporter.close()
+        pboc_fetch_cache.finish(fetch_cache)
+        pboc_trace.finish(trace)
+    print(f"导出 {exporter.rows} 行 ({exporter.fmt})，逐页写入共用时 {exporter.write_seconds:.2f} 秒")
+    print(f"已导出到: {', '.join(exporter.paths())}")
 
 if __name__ == "__main__":
-    start_time = time.time()
-    
-    # 任务一：抓取“已获许可机构”数据
-    base_url1 = "https://www.pbc.gov.cn/zhengwugongkai/4081330/4081344/4081407/4081702/4081749/4081783/9398ddc0-{}.html"
-    registered_data = scrape_and_save(base_url1)
-    log_time_taken(start_time, "抓取“已获许可机构”数据")
-
-    # 任务二：抓取“已注销许可机构”数据
-    start_time_unreg = time.time()
-    base_url2 = "https://www.pbc.gov.cn/zhengwugongkai/4081330/4081344/4081407/4081702/4081749/4081786/63ead9a6-{}.html"
-    unregistered_data = scrape_and_save(base_url2)
-    log_time_taken(start_time_unreg, "抓取“已注销许可机构”数据")
-
-    # 任务三：抓取“非银行支付机构重大事项变更许可信息公示”数据
-    start_time_imp = time.time()
-    directory_url = "https://www.pbc.gov.cn/zhengwugongkai/4081330/4081344/4081407/4081702/4081749/4693227/index.html"
-    important_news_data = scrape_important_news(directory_url, "非银行支付机构重大事项变更许可信息公示")
-    log_time_taken(start_time_imp, "抓取“重大事项变更”数据")
-    
-    export_to_excel(registered_data, unregistered_data, important_news_data, output_path)
+    main()
@@ -8,6 +8,12 @@ from urllib.parse import urljoin
 from bs4 import BeautifulSoup
 from dotenv import load_dotenv
 from concurrent.futures import ThreadPoolExecutor, as_completed
+from pboc_records import InstRecord
+from pboc_snapshot import snapshot_after_run
+import pboc_inst_cdc
+import pboc_metrics
+import pboc_trace
+import pboc_fetch_cache
 
 # ==========================================
 # 1. 环境变量与数据库配置
@@ -35,14 +41,8 @@ db_password = os.getenv('password_aliyun')
 db_schema: str = 'fic'
 db_charset: str = 'utf8mb4'
 
-def log_time_taken(start_time, step_description):
-    """
-    辅助函数：记录并打印某个步骤的耗时
-    :param start_time: 步骤开始的时间戳
-    :param step_description: 步骤描述
-    """
-    end_time = time.time()
-    print(f"{step_description} 用时 {end_time - start_time:.2f} 秒")
+# CDC 模式: 已获许可机构只写入有变化的行，并在 pbc_inst_registered_history 中保留历史版本
+CDC_MODE = True
 
 # ==========================================
 # 2. 数据处理工具函数
@@ -65,14 +65,31 @@ def convert_date_format(date_string):
 # ==========================================
 # 3. 爬虫核心逻辑
 # ==========================================
+@pboc_fetch_cache.memoized
+def fetch_html(url):
+    """
+    下载列表页 / 目录页；同一次运行中重复的 URL 只请求一次
+    (如 get_total_pages 与 scrape_page 都要第一页，见 pboc_fetch_cache)
+    """
+    with pboc_trace.span("fetch", url=url):
+        response = requests.get(url, timeout=15, hooks=pboc_metrics.HTTP_HOOKS)
+        # 出错页面不能当作列表页解析 (否则总页数会被当作 1)
+        response.raise_for_status()
+        response.encoding = response.apparent_encoding or 'utf-8'
+    return response.text
+
 def get_total_pages(url):
     """
     获取列表页的总页数
     通过解析页面底部的分页控件（通常是倒数第二个加粗的数字）来获取
     """
-    response = requests.get(url, timeout=15)
-    response.encoding = response.apparent_encoding or 'utf-8'
-    soup = BeautifulSoup(response.text, 'html.parser')
+    return parse_total_pages(fetch_html(url))
+
+def parse_total_pages(html):
+    """
+    从列表页 HTML 中解析总页数 (get_total_pages 的解析部分)
+    """
+    soup = pboc_fetch_cache.soup(html, 'html.parser')
     span = soup.find('span', style="padding:0 15px;")
     if span:
         b_tags = span.find_all('b')
@@ -80,15 +97,24 @@ def get_total_pages(url):
             return int(b_tags[2].text)
     return 1
 
+@pboc_trace.traced("detail")
 def get_additional_info(url):
     """
     抓取详情页面的详细信息
     :param url: 详情页链接
     :return: 包含详情字段的字典
     """
-    response = requests.get(url, timeout=15)
-    response.encoding = response.apparent_encoding or 'utf-8'
-    soup = BeautifulSoup(response.text, 'html.parser')
+    with pboc_trace.span("fetch", url=url):
+        response = requests.get(url, timeout=15, hooks=pboc_metrics.HTTP_HOOKS)
+        response.encoding = response.apparent_encoding or 'utf-8'
+    with pboc_trace.span("parse"), pboc_metrics.PARSE_SECONDS.labels("approval_detail").time():
+        return parse_additional_info(response.text)
+
+def parse_additional_info(html):
+    """
+    从详情页 HTML 中解析详细信息 (get_additional_info 的解析部分)
+    """
+    soup = BeautifulSoup(html, 'html.parser')
     tbody = soup.find('tbody')
     info: dict[str, str] = {}
     if tbody:
@@ -122,15 +148,16 @@ def get_additional_info(url):
                         break
     return info
 
+@pboc_trace.traced("page")
 def scrape_page(url):
     """
     抓取单个列表页的数据，并自动进入详情页抓取补充信息
     :param url: 列表页 URL
     :return: 包含该页所有记录的列表，每条记录是一个字典
     """
-    response = requests.get(url, timeout=15)
-    response.encoding = response.apparent_encoding or 'utf-8'
-    soup = BeautifulSoup(response.text, 'html.parser')
+    started = time.perf_counter()
+    # 第一页在 get_total_pages 中已下载并解析过，这里直接复用
+    soup = pboc_fetch_cache.soup(fetch_html(url), 'html.parser')
     ul_element = soup.find('ul', class_='txtlist')
     data = []
     if ul_element:
@@ -173,8 +200,9 @@ def scrape_page(url):
                 '有效期至': additional_info.get('有效期至', ''),
                 '备注': additional_info.get('备注', '')
             }
-            data.append(row_dict)
+            data.append(InstRecord(row_dict))
             
+    pboc_metrics.PAGE_SECONDS.labels("approval_list").observe(time.perf_counter() - started)
     return data
 
 def scrape_and_save(base_url, max_workers=3, progress_callback=None):
@@ -190,7 +218,7 @@ def scrape_and_save(base_url, max_workers=3, progress_callback=None):
     print(f"开始抓取，总页数: {total_pages}，使用{max_workers}个线程并行抓取")
     
     with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        future_to_page = {executor.submit(scrape_page, base_url.format(i)): i for i in range(1, total_pages + 1)}
+        future_to_page = {executor.submit(pboc_trace.wrap(scrape_page), base_url.format(i)): i for i in range(1, total_pages + 1)}
         
         completed_count = 0
         for future in as_completed(future_to_page):
@@ -217,21 +245,10 @@ def find_target_url(base_url, keyword):
     """
     print(f"正在搜索'{keyword}'...")
     try:
-        response = requests.get(base_url, timeout=15)
-        response.encoding = response.apparent_encoding or 'utf-8'
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        # 遍历所有链接，查找文本或 title 属性中包含关键字的链接
-        for a_tag in soup.find_all('a'):
-            text = a_tag.get_text(strip=True)
-            title = a_tag.get('title', '').strip()
-            
-            if keyword in text or keyword in title:
-                href = a_tag.get('href')
-                if href:
-                    full_url = urljoin(base_url, href)
-                    print(f"找到链接: {full_url}")
-                    return full_url
+        full_url = find_link_by_keyword(fetch_html(base_url), base_url, keyword)
+        if full_url:
+            print(f"找到链接: {full_url}")
+            return full_url
         
         print(f"未找到包含关键字 '{keyword}' 的链接。")
         return None
@@ -239,6 +256,37 @@ def find_target_url(base_url, keyword):
         print(f"查找目标链接时出错: {e}")
         return None
 
+def find_link_by_keyword(html, base_url, keyword):
+    """
+    在目录页 HTML 中查找文本或 title 包含关键字的第一个链接 (find_target_url 的解析部分)
+    """
+    soup = pboc_fetch_cache.soup(html, 'html.parser')
+    # 遍历所有链接，查找文本或 title 属性中包含关键字的链接
+    for a_tag in soup.find_all('a'):
+        text = a_tag.get_text(strip=True)
+        title = a_tag.get('title', '').strip()
+        
+        if keyword in text or keyword in title:
+            href = a_tag.get('href')
+            if href:
+                return urljoin(base_url, href)
+    return None
+
+def parse_important_news(html):
+    """
+    解析重大事项变更公示页的第一个表格，返回非空行 (含表头)
+    """
+    soup = pboc_fetch_cache.soup(html, 'html.parser')
+    table = soup.find('table')
+    data = []
+    if table:
+        rows = table.find_all('tr')
+        for row in rows:
+            cols = [ele.get_text(strip=True) for ele in row.find_all(['td', 'th'])]
+            if any(cols):
+                data.append(cols)
+    return data
+
 def scrape_important_news(directory_url, keyword):
     """
     抓取重大事项变更许可信息公示
@@ -254,18 +302,9 @@ def scrape_important_news(directory_url, keyword):
 
     # 步骤 2: 抓取目标页面内容
     try:
-        response = requests.get(target_url, timeout=15)
-        response.encoding = response.apparent_encoding or 'utf-8'
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        table = soup.find('table')
-        data = []
-        if table:
-            rows = table.find_all('tr')
-            for row in rows:
-                cols = [ele.get_text(strip=True) for ele in row.find_all(['td', 'th'])]
-                if any(cols):
-                    data.append(cols)
+        html = fetch_html(target_url)
+        with pboc_trace.span("parse"), pboc_metrics.PARSE_SECONDS.labels("important_news").time():
+            data = parse_important_news(html)
         
         print(f"提取到 {len(data) - 1} 行重大事项变更数据 (不含表头)")
         return data
@@ -273,6 +312,7 @@ def scrape_important_news(directory_url, keyword):
         print(f"抓取重大事项变更数据失败: {e}")
         return []
 
+@pboc_trace.traced("write", target=None)
 def insert_important_news_to_mysql(connection, data):
     """
     将重大事项变更数据写入数据库
@@ -280,6 +320,7 @@ def insert_important_news_to_mysql(connection, data):
     if not data or len(data) <= 1:
         return
 
+    started = time.perf_counter()
     with connection.cursor() as cursor:
         inserted_rows = 0
         # 跳过表头
@@ -297,25 +338,32 @@ def insert_important_news_to_mysql(connection, data):
                 print(f"插入重大事项失败: {row} - {e}")
     
     connection.commit()
+    pboc_metrics.DB_WRITE_SECONDS.labels("pbc_important_news").observe(time.perf_counter() - started)
+    pboc_metrics.DB_BATCH_ROWS.labels("pbc_important_news").observe(len(data) - 1)
     print(f"已写入 {inserted_rows} 行重大事项变更数据到 pbc_important_news")
 
 # ==========================================
 # 4. 数据库操作
 # ==========================================
-def insert_data_to_mysql(connection, table_name, data, columns):
+@pboc_trace.traced("write", target=1)
+def insert_data_to_mysql(connection, table_name, data, columns, commit=True):
     """
     将抓取的数据批量写入 MySQL 数据库
+    :param commit: 为假时不提交，由调用方决定提交或回滚 (CDC 模式与历史表在同一事务中)
+    :return: 写入失败的行 (各列的值)
     """
     if not data:
-        return
+        return []
 
     # 预构建SQL语句
     escaped_columns = [f"`{col}`" for col in columns]
     placeholders = ', '.join(['%s'] * len(columns))
     sql = f"REPLACE INTO {table_name} ({', '.join(escaped_columns)}) VALUES ({placeholders})"
 
+    started = time.perf_counter()
     with connection.cursor() as cursor:
         inserted_rows = 0
+        failed = []
         for row_dict in data:
             row_values = [row_dict.get(col, '') for col in columns]
             try:
@@ -323,20 +371,29 @@ def insert_data_to_mysql(connection, table_name, data, columns):
                 inserted_rows += 1
             except Exception as e:
                 print(f"插入行失败: {row_values} - {e}")
+                failed.append(row_values)
 
-    connection.commit()
+    if commit:
+        connection.commit()
+    pboc_metrics.DB_WRITE_SECONDS.labels(table_name).observe(time.perf_counter() - started)
+    pboc_metrics.DB_BATCH_ROWS.labels(table_name).observe(len(data))
     print(f"已写入 {inserted_rows} 行到 {table_name}")
+    return failed
 
 # ==========================================
 # 5. 主程序入口
 # ==========================================
-def run_task(db_config=None, max_workers=3, progress_callback=None):
+def run_task(db_config=None, max_workers=3, progress_callback=None, cdc=None):
     """
     运行整个抓取任务
     :param db_config: 数据库配置字典 {'host':, 'port':, 'user':, 'password':, 'schema':}
     :param max_workers: 线程数
     :param progress_callback: 进度回调 func(phase, current, total, total_items)
+    :param cdc: 是否使用 CDC 模式写入已获许可机构，默认取 CDC_MODE；
+                结果中的 'registered_changes' 为本次的变更摘要 (新增 / 变更 / 注销)
     """
+    if cdc is None:
+        cdc = CDC_MODE
     if db_config is None:
         # Default to global vars
         db_config = {
@@ -349,6 +406,8 @@ def run_task(db_config=None, max_workers=3, progress_callback=None):
         }
     
     connection = None
+    trace = pboc_trace.begin("pboc_approval")
+    fetch_cache = pboc_fetch_cache.begin("pboc_approval")
     try:
         # 建立数据库连接
         connection = pymysql.connect(
@@ -380,55 +439,72 @@ def run_task(db_config=None, max_workers=3, progress_callback=None):
         # ---------------------------------------------------------
         # 任务一：抓取“已获许可机构”数据
         # ---------------------------------------------------------
-        start_time = time.time()
-        base_url1 = "https://www.pbc.gov.cn/zhengwugongkai/4081330/4081344/4081407/4081702/4081749/4081783/9398ddc0-{}.html"
+        with pboc_trace.phase("抓取“已获许可机构（支付机构）”数据"):
+            base_url1 = "https://www.pbc.gov.cn/zhengwugongkai/4081330/4081344/4081407/4081702/4081749/4081783/9398ddc0-{}.html"
         
-        def task1_callback(current, total, items):
-            if progress_callback:
-                progress_callback("registered", current, total, items)
+            def task1_callback(current, total, items):
+                if progress_callback:
+                    progress_callback("registered", current, total, items)
                 
-        registered_data = scrape_and_save(base_url1, max_workers=max_workers, progress_callback=task1_callback)
-        log_time_taken(start_time, "抓取“已获许可机构（支付机构）”数据")
+            registered_data = scrape_and_save(base_url1, max_workers=max_workers, progress_callback=task1_callback)
         results['registered'] = registered_data
         
-        start_time = time.time()
-        insert_data_to_mysql(connection, "pbc_inst_registered", registered_data, cols_registered)
-        log_time_taken(start_time, "写入”已获许可机构（支付机构）“数据到数据库")
+        with pboc_trace.phase("写入”已获许可机构（支付机构）“数据到数据库"):
+            if cdc:
+                pboc_inst_cdc.ensure_history_table(connection)
+                changed_rows, changes = pboc_inst_cdc.apply_changes(connection, registered_data, cols_registered)
+                failed = insert_data_to_mysql(connection, "pbc_inst_registered", changed_rows, cols_registered,
+                                              commit=False)
+                if failed:
+                    # 历史表不能记下没有写入成功的版本: 整体回滚，本次改为全量写入，下次运行重新比较
+                    connection.rollback()
+                    print(f"写入 pbc_inst_registered 失败 {len(failed)} 行，已回滚本次变更历史，改为全量写入")
+                    insert_data_to_mysql(connection, "pbc_inst_registered", registered_data, cols_registered)
+                    changes['rolled_back'] = True
+                else:
+                    connection.commit()
+                results['registered_changes'] = changes
+                print(f"已获许可机构变化: {pboc_inst_cdc.format_summary(changes)}")
+                for item in changes['changed']:
+                    fields = "; ".join(f"{f['field']}: {f['old']} -> {f['new']}" for f in item['fields'])
+                    print(f"  变更 {item['许可证号']} {item['公司名称']}: {fields}")
+            else:
+                insert_data_to_mysql(connection, "pbc_inst_registered", registered_data, cols_registered)
 
         # ---------------------------------------------------------
         # 任务二：抓取“已注销许可机构”数据
         # ---------------------------------------------------------
-        start_time = time.time()
-        base_url2 = "https://www.pbc.gov.cn/zhengwugongkai/4081330/4081344/4081407/4081702/4081749/4081786/63ead9a6-{}.html"
+        with pboc_trace.phase("抓取“已注销许可机构”数据"):
+            base_url2 = "https://www.pbc.gov.cn/zhengwugongkai/4081330/4081344/4081407/4081702/4081749/4081786/63ead9a6-{}.html"
         
-        def task2_callback(current, total, items):
-            if progress_callback:
-                progress_callback("unregistered", current, total, items)
+            def task2_callback(current, total, items):
+                if progress_callback:
+                    progress_callback("unregistered", current, total, items)
 
-        unregistered_data = scrape_and_save(base_url2, max_workers=max_workers, progress_callback=task2_callback)
-        log_time_taken(start_time, "抓取“已注销许可机构”数据")
+            unregistered_data = scrape_and_save(base_url2, max_workers=max_workers, progress_callback=task2_callback)
         results['unregistered'] = unregistered_data
         
-        start_time = time.time()
-        insert_data_to_mysql(connection, "pbc_inst_unregistered", unregistered_data, cols_unregistered)
-        log_time_taken(start_time, "写入“已注销许可机构”数据到数据库")
+        with pboc_trace.phase("写入“已注销许可机构”数据到数据库"):
+            insert_data_to_mysql(connection, "pbc_inst_unregistered", unregistered_data, cols_unregistered)
         
         # ---------------------------------------------------------
         # 任务三：抓取“非银行支付机构重大事项变更许可信息公示”数据
         # ---------------------------------------------------------
-        start_time = time.time()
-        directory_url = "https://www.pbc.gov.cn/zhengwugongkai/4081330/4081344/4081407/4081702/4081749/4693227/index.html"
-        # 这里的进度可能不好量化，或者只是简单的开始/结束
-        if progress_callback:
-            progress_callback("important_news_start", 0, 1, 0)
+        with pboc_trace.phase("抓取“重大事项变更”数据"):
+            directory_url = "https://www.pbc.gov.cn/zhengwugongkai/4081330/4081344/4081407/4081702/4081749/4693227/index.html"
+            # 这里的进度可能不好量化，或者只是简单的开始/结束
+            if progress_callback:
+                progress_callback("important_news_start", 0, 1, 0)
             
-        important_news_data = scrape_important_news(directory_url, "非银行支付机构重大事项变更许可信息公示")
-        log_time_taken(start_time, "抓取“重大事项变更”数据")
+            important_news_data = scrape_important_news(directory_url, "非银行支付机构重大事项变更许可信息公示")
         results['important_news'] = important_news_data
 
-        start_time = time.time()
-        insert_important_news_to_mysql(connection, important_news_data)
-        log_time_taken(start_time, "写入“重大事项变更”数据到数据库")
+        with pboc_trace.phase("写入“重大事项变更”数据到数据库"):
+            insert_important_news_to_mysql(connection, important_news_data)
+
+        # 导出列式快照，供离线分析查询
+        with pboc_trace.phase("导出 Parquet 快照"):
+            snapshot_after_run(["pbc_inst_registered", "pbc_inst_unregistered", "pbc_important_news"], connection)
         
         if progress_callback:
             progress_callback("done", 100, 100, 0)
@@ -443,6 +519,9 @@ def run_task(db_config=None, max_workers=3, progress_callback=None):
     finally:
         if connection and connection.open:
             connection.close()
+        pboc_fetch_cache.finish(fetch_cache)
+        pboc_trace.finish(trace)
 
 if __name__ == "__main__":
+    pboc_metrics.dump_on_exit()
     run_task()
@@ -0,0 +1,219 @@
+"""
+行政处罚附件的内容寻址存储 (供 web_download_pboc.py 使用)
+
+同一份处罚公告常常同时挂在省分行和辖内分支机构的页面下，按省份、按标题保存会重复下载、重复占用磁盘。
+这里把附件按 sha256 存为 downloads/pboc_penalty/.objects/ab/cdef...，
+各省目录下可读的文件名只是指向对象的硬链接:
+- 已下载过的附件地址直接链接已有对象，不再请求
+- 内容相同的不同地址只保存一份
+- verify 可批量校验所有对象的完整性
+
+索引 .objects/index.json:
+{"blobs": {sha256: {"size", "urls": [...], "created"}},
+ "urls": {附件地址: {"sha256", "etag", "last_modified"}}}
+
+注意: 各省目录中的文件与对象共用 inode，更新文件必须先写临时文件再 os.replace
+(pboc_download_engine 即如此)，不能原地覆盖写入，否则会改坏对象。
+
+用法:
+    python pboc_attachment_store.py verify       # 校验所有对象
+    python pboc_attachment_store.py stats        # 对象数量、去重节省的空间
+    python pboc_attachment_store.py adopt        # 把已有的下载目录收编进对象库
+"""
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import shutil
+import sys
+import threading
+
+OBJECTS_DIR = ".objects"
+INDEX_NAME = "index.json"
+HASH_BLOCK = 1024 * 1024
+
+
+def file_sha256(path):
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(HASH_BLOCK)
+            if not block:
+                break
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+class AttachmentStore:
+    """
+    :param root: 下载根目录 (DOWNLOAD_ROOT)，对象保存在 root/.objects 下
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.directory = os.path.join(root, OBJECTS_DIR)
+        self.index_path = os.path.join(self.directory, INDEX_NAME)
+        self.lock = threading.Lock()
+        self.blobs = {}
+        self.urls = {}
+        if os.path.exists(self.index_path):
+            try:
+                with open(self.index_path, encoding="utf-8") as f:
+                    index = json.load(f)
+                self.blobs = index.get("blobs", {})
+                self.urls = index.get("urls", {})
+            except Exception as e:
+                print(f"对象索引读取失败，将重新建立: {self.index_path}: {e}")
+
+    def blob_path(self, sha256):
+        return os.path.join(self.directory, sha256[:2], sha256[2:])
+
+    def lookup_url(self, url):
+        """
+        返回已保存的附件 {"sha256", "size", "etag", "last_modified"}，没有或对象文件丢失时返回 None
+        """
+        with self.lock:
+            ref = self.urls.get(url)
+            blob = self.blobs.get(ref["sha256"]) if ref else None
+        if blob is None or not os.path.exists(self.blob_path(ref["sha256"])):
+            return None
+        return {**ref, "size": blob["size"]}
+
+    def link(self, sha256, path):
+        """
+        在 path 处建立指向对象的硬链接 (已存在的文件会被替换)
+        文件系统不支持硬链接时退回到复制
+        """
+        blob = self.blob_path(sha256)
+        if os.path.exists(path) and os.path.samefile(blob, path):
+            return
+        tmp = path + ".link"
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        try:
+            os.link(blob, tmp)
+        except OSError:
+            shutil.copy2(blob, tmp)
+        os.replace(tmp, path)
+
+    def ingest(self, path, sha256=None, url=None, etag=None, last_modified=None):
+        """
+        把刚下载好的文件收进对象库，并把 path 换成指向对象的硬链接
+        对象已存在时 (其他省份 / 其他地址的同一文件) 直接复用，丢弃新文件
+        etag / last_modified 随附件地址保存，复用时供条件请求使用
+        :return: sha256
+        """
+        sha256 = sha256 or file_sha256(path)
+        blob = self.blob_path(sha256)
+        with self.lock:
+            if not os.path.exists(blob):
+                os.makedirs(os.path.dirname(blob), exist_ok=True)
+                try:
+                    os.link(path, blob)
+                except OSError:
+                    shutil.copy2(path, blob)
+            entry = self.blobs.setdefault(sha256, {
+                "size": os.path.getsize(blob),
+                "urls": [],
+                "created": datetime.datetime.now().isoformat(timespec="seconds"),
+            })
+            if url:
+                if url not in entry["urls"]:
+                    entry["urls"].append(url)
+                self.urls[url] = {"sha256": sha256, "etag": etag, "last_modified": last_modified}
+        self.link(sha256, path)
+        return sha256
+
+    def save(self):
+        with self.lock:
+            os.makedirs(self.directory, exist_ok=True)
+            tmp = self.index_path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"blobs": self.blobs, "urls": self.urls}, f, ensure_ascii=False, indent=1)
+            os.replace(tmp, self.index_path)
+
+    def verify(self):
+        """
+        重新计算每个对象的 sha256
+        :return: {"ok": n, "missing": [sha256...], "corrupt": [sha256...]}
+        """
+        result = {"ok": 0, "missing": [], "corrupt": []}
+        for sha256 in list(self.blobs):
+            path = self.blob_path(sha256)
+            if not os.path.exists(path):
+                result["missing"].append(sha256)
+            elif file_sha256(path) != sha256:
+                result["corrupt"].append(sha256)
+            else:
+                result["ok"] += 1
+        return result
+
+    def stats(self):
+        """
+        对象数量、实际占用，以及各省目录中的链接数 (即去重前需要的空间)
+        """
+        stored = 0
+        logical = 0
+        for sha256, blob in self.blobs.items():
+            path = self.blob_path(sha256)
+            if not os.path.exists(path):
+                continue
+            stored += blob["size"]
+            # 硬链接数减去对象自身即为各省目录中的引用数
+            logical += blob["size"] * max(os.stat(path).st_nlink - 1, 1)
+        return {"objects": len(self.blobs), "urls": len(self.urls), "stored_bytes": stored,
+                "logical_bytes": logical, "saved_bytes": logical - stored}
+
+    def adopt(self, manifest_name=".manifest.json"):
+        """
+        把各省目录中已有的附件 (按 manifest 记录) 收进对象库
+        :return: 收编的文件数
+        """
+        count = 0
+        for name in sorted(os.listdir(self.root)):
+            directory = os.path.join(self.root, name)
+            manifest_path = os.path.join(directory, manifest_name)
+            if name == OBJECTS_DIR or not os.path.isfile(manifest_path):
+                continue
+            with open(manifest_path, encoding="utf-8") as f:
+                entries = json.load(f)
+            for entry in entries.values():
+                path = os.path.join(directory, entry.get("file") or "")
+                if entry.get("kind") != "attachment" or not os.path.isfile(path):
+                    continue
+                self.ingest(path, entry.get("sha256"), entry.get("attachment_url"),
+                            entry.get("etag"), entry.get("last_modified"))
+                count += 1
+        self.save()
+        return count
+
+
+def main(argv=None):
+    from web_download_pboc import DOWNLOAD_ROOT
+
+    parser = argparse.ArgumentParser(description="行政处罚附件对象库")
+    parser.add_argument("command", choices=["verify", "stats", "adopt"])
+    parser.add_argument("--root", default=DOWNLOAD_ROOT, help="下载根目录")
+    args = parser.parse_args(argv)
+
+    store = AttachmentStore(args.root)
+    if args.command == "verify":
+        result = store.verify()
+        print(f"校验通过 {result['ok']} 个，缺失 {len(result['missing'])} 个，损坏 {len(result['corrupt'])} 个")
+        for sha256 in result["missing"]:
+            print(f"缺失: {sha256} {store.blobs[sha256]['urls']}")
+        for sha256 in result["corrupt"]:
+            print(f"损坏: {sha256} {store.blobs[sha256]['urls']}")
+        return 1 if result["missing"] or result["corrupt"] else 0
+    if args.command == "stats":
+        s = store.stats()
+        print(f"对象 {s['objects']} 个，附件地址 {s['urls']} 个，实际占用 {s['stored_bytes'] / 2**20:.1f} MB，"
+              f"去重节省 {s['saved_bytes'] / 2**20:.1f} MB")
+        return 0
+    print(f"已收编 {store.adopt()} 个文件")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,224 @@
+"""
+附件下载引擎 (供 web_download_pboc.py 使用)
+
+- 先写入 <目标文件>.part，校验长度后再原子 rename，不会留下截断的文件
+- 中断后重跑时用 HTTP Range 续传 .part (带 If-Range，服务器文件变化时自动重新下载)
+- 读缓冲按实际速度在 64KB ~ 4MB 之间自适应
+- 大文件且服务器支持 Range 时可分段并行下载
+- 返回 sha256、大小、耗时和吞吐量
+"""
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+MIN_CHUNK = 64 * 1024
+MAX_CHUNK = 4 * 1024 * 1024
+# 单次读取快于 FAST_READ 秒则加大缓冲，慢于 SLOW_READ 秒则减小
+FAST_READ = 0.05
+SLOW_READ = 0.5
+
+# 大于该大小且服务器支持 Range 时分段并行下载；0 表示不启用
+PARALLEL_THRESHOLD = 16 * 1024 * 1024
+PARALLEL_PARTS = 4
+
+HASH_BLOCK = 1024 * 1024
+
+
+class IncompleteDownload(IOError):
+    """
+    下载的字节数与 Content-Length 不符；.part 文件保留，下次可续传
+    """
+
+
+def _part_paths(final_path):
+    return final_path + ".part", final_path + ".part.json"
+
+
+def _load_part_meta(meta_path):
+    try:
+        with open(meta_path, encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+
+def _save_part_meta(meta_path, url, resp):
+    meta = {
+        "url": url,
+        "etag": resp.headers.get("ETag"),
+        "last_modified": resp.headers.get("Last-Modified"),
+    }
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+
+
+def _discard(*paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def _hash_file(path, sha256=None):
+    sha256 = sha256 or hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(HASH_BLOCK)
+            if not block:
+                break
+            sha256.update(block)
+    return sha256
+
+
+def _expected_length(resp, offset=0):
+    length = resp.headers.get("Content-Length")
+    if length is None or resp.headers.get("Content-Encoding"):
+        return None
+    try:
+        return offset + int(length)
+    except ValueError:
+        return None
+
+
+def _copy_adaptive(resp, f, sha256=None):
+    """
+    从响应中读取并写入 f，缓冲大小随读取速度调整
+    :return: 写入的字节数
+    """
+    chunk = MIN_CHUNK
+    written = 0
+    raw = resp.raw
+    while True:
+        started = time.monotonic()
+        data = raw.read(chunk, decode_content=True)
+        if not data:
+            break
+        elapsed = time.monotonic() - started
+        f.write(data)
+        if sha256 is not None:
+            sha256.update(data)
+        written += len(data)
+        if len(data) == chunk and elapsed < FAST_READ:
+            chunk = min(chunk * 2, MAX_CHUNK)
+        elif elapsed > SLOW_READ:
+            chunk = max(chunk // 2, MIN_CHUNK)
+    return written
+
+
+def _fetch_range(get, url, headers, timeout, path, start, end):
+    range_headers = dict(headers or {})
+    range_headers["Range"] = f"bytes={start}-{end}"
+    resp = get(url, headers=range_headers, stream=True, timeout=timeout)
+    with resp:
+        if resp.status_code != 206:
+            raise IncompleteDownload(f"range {start}-{end} not honoured: HTTP {resp.status_code}")
+        with open(path, "r+b") as f:
+            f.seek(start)
+            written = _copy_adaptive(resp, f)
+    if written != end - start + 1:
+        raise IncompleteDownload(f"range {start}-{end}: got {written} bytes")
+    return written
+
+
+def _download_parallel(get, url, headers, timeout, part_path, total, parts):
+    with open(part_path, "wb") as f:
+        f.truncate(total)
+    step = -(-total // parts)
+    ranges = [(start, min(start + step, total) - 1) for start in range(0, total, step)]
+    with ThreadPoolExecutor(max_workers=len(ranges)) as executor:
+        futures = [executor.submit(_fetch_range, get, url, headers, timeout, part_path, s, e) for s, e in ranges]
+        for future in futures:
+            future.result()
+    return _hash_file(part_path)
+
+
+def download_file(get, url, final_path, headers=None, timeout=30, response=None,
+                  parallel_threshold=None, parallel_parts=None):
+    """
+    下载 url 到 final_path
+    :param get: 发请求的函数 get(url, headers=..., stream=True, timeout=...)，如 session.get 或带限流的包装
+    :param response: 已发出的流式响应 (如条件请求返回的 200)，直接使用而不再请求
+    :return: {"size", "sha256", "seconds", "throughput", "resumed", "parts", "etag", "last_modified"}
+    """
+    parallel_threshold = PARALLEL_THRESHOLD if parallel_threshold is None else parallel_threshold
+    parallel_parts = parallel_parts or PARALLEL_PARTS
+    part_path, meta_path = _part_paths(final_path)
+    headers = dict(headers or {})
+    started = time.monotonic()
+
+    offset = 0
+    if response is None and os.path.exists(part_path):
+        meta = _load_part_meta(meta_path)
+        validator = meta.get("etag") or meta.get("last_modified")
+        if meta.get("url") == url and validator:
+            offset = os.path.getsize(part_path)
+            headers["Range"] = f"bytes={offset}-"
+            headers["If-Range"] = validator
+
+    resp = response or get(url, headers=headers, stream=True, timeout=timeout)
+    if offset and resp.status_code == 416:
+        # .part 已不小于服务器上的文件 (或文件已变短)，丢弃后重新下载
+        resp.close()
+        _discard(part_path, meta_path)
+        return download_file(get, url, final_path, headers={k: v for k, v in headers.items()
+                                                            if k not in ("Range", "If-Range")},
+                             timeout=timeout, parallel_threshold=parallel_threshold,
+                             parallel_parts=parallel_parts)
+    with resp:
+        resp.raise_for_status()
+        resumed = offset > 0 and resp.status_code == 206
+        if not resumed:
+            offset = 0
+        expected = _expected_length(resp, offset)
+        parts = 1
+
+        if (not resumed and expected and parallel_threshold and expected >= parallel_threshold
+                and resp.headers.get("Accept-Ranges") == "bytes"):
+            # 大文件: 放弃当前连接，改为分段并行
+            resp.close()
+            _save_part_meta(meta_path, url, resp)
+            base_headers = {k: v for k, v in headers.items() if k not in ("Range", "If-Range")}
+            try:
+                sha256 = _download_parallel(get, url, base_headers, timeout, part_path, expected, parallel_parts)
+                parts = parallel_parts
+                written = expected
+            except Exception:
+                # 并行失败则退回顺序下载
+                resp = get(url, headers=base_headers, stream=True, timeout=timeout)
+                with resp:
+                    resp.raise_for_status()
+                    sha256 = hashlib.sha256()
+                    with open(part_path, "wb") as f:
+                        written = _copy_adaptive(resp, f, sha256)
+        else:
+            if resp.headers.get("ETag") or resp.headers.get("Last-Modified"):
+                _save_part_meta(meta_path, url, resp)
+            if resumed:
+                sha256 = _hash_file(part_path)
+                mode = "ab"
+            else:
+                sha256 = hashlib.sha256()
+                mode = "wb"
+            with open(part_path, mode) as f:
+                written = offset + _copy_adaptive(resp, f, sha256)
+
+    if expected is not None and written != expected:
+        raise IncompleteDownload(f"{url}: expected {expected} bytes, got {written}")
+
+    os.replace(part_path, final_path)
+    _discard(meta_path)
+
+    seconds = time.monotonic() - started
+    return {
+        "size": written,
+        "sha256": sha256.hexdigest(),
+        "seconds": round(seconds, 3),
+        "throughput": round((written - offset) / seconds) if seconds > 0 else None,
+        "resumed": resumed,
+        "parts": parts,
+        "etag": resp.headers.get("ETag"),
+        "last_modified": resp.headers.get("Last-Modified"),
+    }
@@ -0,0 +1,169 @@
+"""
+抓取任务内的请求合并 (single-flight) 与按次运行的记忆
+
+同一次运行中同一个 URL 经常被请求两次: get_total_pages 和 scrape_page 都会下载第一页，
+list_pages 下载的首页又是 pages 中的第一项。本模块在抓取函数外加一层:
+
+    @pboc_fetch_cache.memoized
+    def fetch(url): ...
+
+- 并发调用同一个 URL 时只发一次请求，其余调用等待并共用结果 (始终生效)
+- 在 scope() 之内，结果在本次运行中保留 (LRU，最多 MAX_DOCUMENTS 个)，之后的调用直接返回
+- soup(html, features) 代替 BeautifulSoup(html, features): 同一次运行中对同一份 HTML 只解析一次
+  (以 HTML 字符串本身为键: 第一次查找时对整段文本求哈希，之后字符串对象缓存了哈希值；
+  记忆的抓取函数返回的是同一个对象，比较键时身份相同即可跳过逐字比较)
+
+用法:
+    token = pboc_fetch_cache.begin("pboc_approval")     # 或 with pboc_fetch_cache.scope(...) / 作为装饰器
+    ...
+    pboc_fetch_cache.finish(token)                       # 打印命中统计
+线程池中的调用需要用 pboc_trace.wrap() 提交，才能看到提交时的 scope。
+抓取失败 (抛出异常或返回 None) 的结果不保留，后续调用会重新请求。
+"""
+import collections
+import contextvars
+import functools
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+from bs4 import BeautifulSoup
+
+import pboc_metrics
+
+# 每次运行保留的文档数 (HTML 文本)
+MAX_DOCUMENTS = 128
+# 每次运行保留的解析结果数 (BeautifulSoup 对象比 HTML 大得多，只留最近的几个)
+MAX_SOUPS = 16
+
+_scope = contextvars.ContextVar("pboc_fetch_cache", default=None)
+
+
+class FetchCache:
+    def __init__(self, name=None, max_documents=MAX_DOCUMENTS, max_soups=MAX_SOUPS):
+        self.name = name
+        self.max_documents = max_documents
+        self.max_soups = max_soups
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._documents = collections.OrderedDict()
+        self._soups = collections.OrderedDict()
+        self.stats = collections.Counter()
+
+    def _count(self, kind, result):
+        self.stats[f"{kind}_{result}"] += 1
+        pboc_metrics.FETCH_CACHE.labels(kind, result).inc()
+
+    def get(self, key, loader):
+        """
+        返回 key 对应的结果: 已有则直接返回，正在请求则等待，否则调用 loader()
+        """
+        with self._lock:
+            if key in self._documents:
+                self._documents.move_to_end(key)
+                self._count("fetch", "hit")
+                return self._documents[key]
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+        if not owner:
+            self._count("fetch", "coalesced")
+            return future.result()
+
+        self._count("fetch", "miss")
+        try:
+            result = loader()
+        except BaseException as e:
+            with self._lock:
+                del self._inflight[key]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            del self._inflight[key]
+            if result is not None and self.max_documents:
+                self._documents[key] = result
+                while len(self._documents) > self.max_documents:
+                    self._documents.popitem(last=False)
+        future.set_result(result)
+        return result
+
+    def soup(self, html, features):
+        key = (features, html)
+        with self._lock:
+            if key in self._soups:
+                self._soups.move_to_end(key)
+                self._count("parse", "hit")
+                return self._soups[key]
+        self._count("parse", "miss")
+        # 解析在锁外进行；两个线程同时解析同一份 HTML 时各自解析，结果只保留一份
+        doc = BeautifulSoup(html, features)
+        with self._lock:
+            self._soups[key] = doc
+            while len(self._soups) > self.max_soups:
+                self._soups.popitem(last=False)
+        return doc
+
+    def summary(self):
+        s = self.stats
+        return (f"请求 {s['fetch_miss']} 次，复用 {s['fetch_hit']} 次，合并并发请求 {s['fetch_coalesced']} 次，"
+                f"复用解析结果 {s['parse_hit']} 次")
+
+
+# 没有进行中的运行时只做并发合并，不保留结果
+_shared = FetchCache("shared", max_documents=0)
+
+
+def current():
+    return _scope.get() or _shared
+
+
+def memoized(func):
+    """
+    装饰器: 按 (函数, 参数) 合并并发调用，并在 scope 内记忆结果
+    """
+    name = f"{func.__module__}.{func.__qualname__}"
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        key = (name, args, tuple(sorted(kwargs.items())))
+        return current().get(key, lambda: func(*args, **kwargs))
+    return wrapper
+
+
+def soup(html, features):
+    """
+    代替 BeautifulSoup(html, features)；调用方不应修改返回的文档
+    """
+    cache = _scope.get()
+    if cache is None:
+        return BeautifulSoup(html, features)
+    return cache.soup(html, features)
+
+
+def begin(name=None):
+    """
+    开始一次运行；返回的 token 交给 finish()
+    """
+    cache = FetchCache(name)
+    return _scope.set(cache), cache
+
+
+def finish(token, verbose=True):
+    ctx_token, cache = token
+    _scope.reset(ctx_token)
+    if verbose and cache.stats:
+        print(f"{cache.name or '抓取'}: {cache.summary()}")
+    return cache
+
+
+@contextmanager
+def scope(name=None, verbose=True):
+    """
+    with scope("penalty"): ... 或 @scope("penalty")
+    """
+    token = begin(name)
+    try:
+        yield token[1]
+    finally:
+        finish(token, verbose)
@@ -0,0 +1,191 @@
+"""
+已获许可机构 (pbc_inst_registered) 的变更历史 (CDC)
+
+pbc_inst_registered 用 REPLACE INTO 覆盖写入，机构的业务覆盖范围、有效期、法定代表人等变化后旧值就丢失了。
+这里对每条抓取结果按许可证号计算内容哈希，与历史表中当前有效版本的哈希比较:
+- 新出现的许可证号: 写入一条新版本 (new)
+- 哈希不同: 关闭旧版本 (valid_to = 本次运行时间)，写入新版本 (changed)
+- 本次没有抓到的许可证号: 关闭旧版本 (cancelled)
+只有变化的行会写入历史表和 pbc_inst_registered，每次运行的写入量与变化量成正比。
+许可证号为空的行无法跟踪历史，每次都照常写入 pbc_inst_registered，并在摘要中计数 (no_key)。
+注销的机构只在历史表中关闭版本，pbc_inst_registered 中的行保留不删 (与不使用 CDC 时的 REPLACE 写入一致)，
+注销信息以同一次运行写入的 pbc_inst_unregistered 为准。
+
+历史表 pbc_inst_registered_history 中 valid_to 为 NULL 的行即各机构的当前版本。
+"""
+import datetime
+import hashlib
+
+HISTORY_TABLE = "pbc_inst_registered_history"
+KEY = "许可证号"
+# 本次抓到的机构数少于当前有效机构数的该比例时，视为抓取不完整，不标记注销
+CANCEL_GUARD_RATIO = 0.9
+
+CREATE_HISTORY_SQL = f"""
+CREATE TABLE IF NOT EXISTS `{HISTORY_TABLE}` (
+  `id` int NOT NULL AUTO_INCREMENT,
+  `许可证号` varchar(100) NOT NULL,
+  `公司名称` varchar(200) DEFAULT NULL,
+  `生成日期` varchar(30) DEFAULT NULL,
+  `法定代表人（负责人）` varchar(100) DEFAULT NULL,
+  `住所（营业场所）` varchar(500) DEFAULT NULL,
+  `业务类型` varchar(500) DEFAULT NULL,
+  `业务覆盖范围` varchar(500) DEFAULT NULL,
+  `换证日期` varchar(30) DEFAULT NULL,
+  `首次许可日期` varchar(30) DEFAULT NULL,
+  `有效期至` varchar(30) DEFAULT NULL,
+  `备注` text,
+  `row_hash` char(64) NOT NULL,
+  `change_type` varchar(10) NOT NULL,
+  `valid_from` datetime NOT NULL,
+  `valid_to` datetime DEFAULT NULL,
+  PRIMARY KEY (`id`),
+  KEY `idx_current` (`valid_to`, `许可证号`),
+  KEY `idx_key` (`许可证号`, `valid_from`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+"""
+
+
+def row_hash(row, columns):
+    """
+    按列顺序拼接各字段 (去掉首尾空白) 后取 sha256
+    """
+    values = ["" if row.get(c) is None else str(row.get(c)).strip() for c in columns]
+    return hashlib.sha256("\x1f".join(values).encode("utf-8")).hexdigest()
+
+
+def ensure_history_table(connection):
+    with connection.cursor() as cursor:
+        cursor.execute(CREATE_HISTORY_SQL)
+    connection.commit()
+
+
+def load_current_hashes(connection):
+    """
+    当前有效版本: {许可证号: row_hash}
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT `{KEY}`, row_hash FROM `{HISTORY_TABLE}` WHERE valid_to IS NULL")
+        return {r[KEY]: r["row_hash"] for r in cursor.fetchall()}
+
+
+def load_current_rows(connection, keys, columns):
+    """
+    只取发生变化的机构的当前版本，用于列出具体变化的字段
+    """
+    if not keys:
+        return {}
+    result = {}
+    escaped = ", ".join(f"`{c}`" for c in columns)
+    keys = list(keys)
+    with connection.cursor() as cursor:
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            placeholders = ", ".join(["%s"] * len(chunk))
+            cursor.execute(f"SELECT {escaped} FROM `{HISTORY_TABLE}` "
+                           f"WHERE valid_to IS NULL AND `{KEY}` IN ({placeholders})", chunk)
+            for r in cursor.fetchall():
+                result[r[KEY]] = r
+    return result
+
+
+def diff_rows(scraped, current_hashes, columns):
+    """
+    :param scraped: 本次抓取结果 (InstRecord / dict)
+    :return: (新增 {许可证号: (行, hash)}, 变更 {许可证号: (行, hash)}, 消失的许可证号 list, 许可证号为空的行 list)
+    """
+    latest = {}
+    no_key = []
+    for row in scraped:
+        key = (row.get(KEY) or "").strip()
+        if key:
+            latest[key] = row
+        else:
+            no_key.append(row)
+    new, changed = {}, {}
+    for key, row in latest.items():
+        h = row_hash(row, columns)
+        old = current_hashes.get(key)
+        if old is None:
+            new[key] = (row, h)
+        elif old != h:
+            changed[key] = (row, h)
+    missing = [k for k in current_hashes if k not in latest]
+    return new, changed, missing, no_key
+
+
+def _changed_fields(old, row, columns):
+    fields = []
+    for c in columns:
+        a = "" if old.get(c) is None else str(old.get(c)).strip()
+        b = "" if row.get(c) is None else str(row.get(c)).strip()
+        if a != b:
+            fields.append({"field": c, "old": a, "new": b})
+    return fields
+
+
+def apply_changes(connection, scraped, columns, run_time=None):
+    """
+    比较并写入历史表；不提交事务，由调用方在写完 pbc_inst_registered 后一起提交
+    (写入 pbc_inst_registered 有失败时调用方应回滚，否则历史表会记下实际没有写入的版本)
+    :return: (需要写入 pbc_inst_registered 的行, 变更摘要)
+             摘要: {"new": [许可证号], "changed": [{"许可证号", "公司名称", "fields": [...]}],
+                    "cancelled": [许可证号], "unchanged": n, "no_key": n, "cancel_skipped": bool}
+    """
+    run_time = run_time or datetime.datetime.now().replace(microsecond=0)
+    current = load_current_hashes(connection)
+    new, changed, missing, no_key = diff_rows(scraped, current, columns)
+
+    cancel_skipped = False
+    if missing and len(scraped) < len(current) * CANCEL_GUARD_RATIO:
+        # 多半是部分页面抓取失败，不能据此认定机构已注销
+        print(f"本次只抓到 {len(scraped)} 条 (当前有效 {len(current)} 条)，跳过 {len(missing)} 条注销标记")
+        missing = []
+        cancel_skipped = True
+
+    old_rows = load_current_rows(connection, changed.keys(), columns)
+    summary = {
+        "new": sorted(new),
+        "changed": [{KEY: k, "公司名称": row.get("公司名称", ""),
+                     "fields": _changed_fields(old_rows.get(k, {}), row, columns)}
+                    for k, (row, _) in sorted(changed.items())],
+        "cancelled": sorted(missing),
+        "unchanged": len(current) - len(changed) - len(missing),
+        "no_key": len(no_key),
+        "cancel_skipped": cancel_skipped,
+    }
+
+    escaped = ", ".join(f"`{c}`" for c in columns)
+    placeholders = ", ".join(["%s"] * (len(columns) + 4))
+    insert_sql = (f"INSERT INTO `{HISTORY_TABLE}` ({escaped}, row_hash, change_type, valid_from, valid_to) "
+                  f"VALUES ({placeholders})")
+    close_sql = f"UPDATE `{HISTORY_TABLE}` SET valid_to = %s WHERE `{KEY}` = %s AND valid_to IS NULL"
+
+    with connection.cursor() as cursor:
+        closing = list(changed) + missing
+        if closing:
+            cursor.executemany(close_sql, [(run_time, k) for k in closing])
+        inserts = [(row, h, "new") for row, h in new.values()] + [(row, h, "changed") for row, h in changed.values()]
+        if inserts:
+            cursor.executemany(insert_sql, [
+                [row.get(c, "") for c in columns] + [h, change_type, run_time, None]
+                for row, h, change_type in inserts
+            ])
+
+    to_write = [row for row, _ in new.values()] + [row for row, _ in changed.values()] + no_key
+    return to_write, summary
+
+
+def format_summary(summary):
+    """
+    变更摘要的一行文字说明
+    """
+    text = (f"新增 {len(summary['new'])}，变更 {len(summary['changed'])}，"
+            f"注销 {len(summary['cancelled'])}，未变 {summary['unchanged']}")
+    if summary.get("no_key"):
+        text += f"，无许可证号 {summary['no_key']} (照常写入，不记历史)"
+    if summary.get("rolled_back"):
+        text += " (写入失败，变更历史已回滚)"
+    if summary.get("cancel_skipped"):
+        text += " (抓取不完整，未标记注销)"
+    return text
@@ -0,0 +1,385 @@
+"""
+抓取任务和 Flask 应用的运行指标 (Prometheus 文本格式)
+
+进程内维护计数器 (Counter)、仪表 (Gauge) 和直方图 (Histogram)，按标签区分 host / 页面类型 / 表名等。
+- 各 Flask 应用的 /metrics 返回 render() 的结果，可直接被 Prometheus 抓取
+- 命令行任务设置环境变量 PBOC_METRICS_FILE 后，进程退出时把指标写入该文件
+  (与 node_exporter 的 textfile collector 格式相同)
+- python pboc_metrics.py <文件或 /metrics 地址> 按 host 汇总请求数、错误数和平均耗时，找出慢的省份
+
+HTTP 请求通过 requests 的 response hook 统计 (instrument_session / HTTP_HOOKS)，耗时为 response.elapsed
+(发出请求到解析完响应头)，字节数按 Content-Length 统计；重试次数由 CountingRetry 记录。
+未安装 prometheus_client，这里只实现了用到的部分。
+"""
+import argparse
+import atexit
+import bisect
+import os
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+from urllib3.util.retry import Retry
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+METRICS_FILE_ENV = "PBOC_METRICS_FILE"
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+ROW_BUCKETS = (1, 10, 50, 100, 500, 1000, 5000, 10000, 50000)
+
+REGISTRY = []
+_registry_lock = threading.Lock()
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name, documentation, labelnames=(), register=True):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children = {}
+        if register:
+            with _registry_lock:
+                REGISTRY.append(self)
+
+    def labels(self, *values):
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} 需要标签 {self.labelnames}")
+        key = tuple(str(v) for v in values)
+        with self._lock:
+            child = self._children.get(key)
+            if child is None:
+                child = self._children[key] = self._new_child()
+            return child
+
+    def _default(self):
+        return self.labels()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def collect(self):
+        with self._lock:
+            return list(self._children.items())
+
+    def clear(self):
+        with self._lock:
+            self._children.clear()
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for key, child in sorted(self.collect()):
+            lines.extend(self._render_child(key, child))
+        return lines
+
+
+class _Value:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0.0
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value):
+        with self._lock:
+            self.value = float(value)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount=1):
+        self._default().inc(amount)
+
+    def _render_child(self, key, child):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(child.value)}"]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value):
+        self._default().set(value)
+
+    def dec(self, amount=1):
+        self._default().dec(amount)
+
+    @contextmanager
+    def track(self, *values):
+        """
+        进入时加一、退出时减一 (如活跃线程数)
+        """
+        child = self.labels(*values)
+        child.inc()
+        try:
+            yield
+        finally:
+            child.dec()
+
+
+class _HistogramValue:
+    def __init__(self, buckets):
+        self._lock = threading.Lock()
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            if i < len(self.counts):
+                self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    @contextmanager
+    def time(self):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, register=True):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, register)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value):
+        self._default().observe(value)
+
+    def time(self):
+        return self._default().time()
+
+    def _render_child(self, key, child):
+        with child._lock:
+            counts, total, count = list(child.counts), child.sum, child.count
+        lines = []
+        cumulative = 0
+        for bound, n in zip(self.buckets, counts):
+            cumulative += n
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', _format_value(bound)))} "
+                         f"{cumulative}")
+        lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', '+Inf'))} {count}")
+        lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+        lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+# ---------------------------------------------------------------- 指标定义
+HTTP_REQUESTS = Counter("pboc_http_requests_total", "HTTP 请求数", ["host", "status"])
+HTTP_ERRORS = Counter("pboc_http_errors_total", "没有拿到响应的请求 (超时、连接错误等)", ["host", "error"])
+HTTP_LATENCY = Histogram("pboc_http_request_seconds", "HTTP 请求耗时 (到收到响应头)", ["host"])
+HTTP_BYTES = Counter("pboc_http_response_bytes_total", "响应字节数 (按 Content-Length)", ["host"])
+HTTP_RETRIES = Counter("pboc_http_retries_total", "urllib3 层的重试次数", ["host"])
+PARSE_SECONDS = Histogram("pboc_parse_seconds", "单个页面的解析耗时", ["page_type"])
+PAGE_SECONDS = Histogram("pboc_page_seconds", "单个列表页的抓取总耗时 (含详情页)", ["job"])
+DB_WRITE_SECONDS = Histogram("pboc_db_write_seconds", "一批数据写入数据库的耗时", ["table"])
+DB_BATCH_ROWS = Histogram("pboc_db_batch_rows", "每批写入数据库的行数", ["table"], buckets=ROW_BUCKETS)
+QUEUE_DEPTH = Gauge("pboc_queue_depth", "等待处理的任务数", ["queue"])
+ACTIVE_WORKERS = Gauge("pboc_active_workers", "正在执行任务的线程数", ["pool"])
+DOWNLOADS = Counter("pboc_downloads_total", "附件下载结果", ["province", "status"])
+SCHEDULER_PROBES = Counter("pboc_scheduler_probes_total", "调度器首页探测结果", ["source", "result"])
+SCHEDULER_REFRESHES = Counter("pboc_scheduler_refreshes_total", "调度器触发的抓取", ["group", "status"])
+WATCH_POLLS = Counter("pboc_watch_polls_total", "新公告监视的首页请求结果", ["province", "result"])
+WATCH_NEW_ITEMS = Counter("pboc_watch_new_items_total", "监视发现的新公告", ["province", "matched"])
+WATCH_DELIVERIES = Counter("pboc_watch_deliveries_total", "新公告推送结果", ["sink", "status"])
+FETCH_CACHE = Counter("pboc_fetch_cache_total", "抓取层的请求合并与记忆 (kind: fetch / parse)", ["kind", "result"])
+
+
+# ---------------------------------------------------------------- HTTP 统计
+def observe_response(resp, *args, **kwargs):
+    """
+    requests 的 response hook: 记录状态码、耗时和字节数
+    """
+    host = urlparse(resp.url).netloc
+    HTTP_REQUESTS.labels(host, resp.status_code).inc()
+    HTTP_LATENCY.labels(host).observe(resp.elapsed.total_seconds())
+    length = resp.headers.get("Content-Length")
+    if length and length.isdigit():
+        HTTP_BYTES.labels(host).inc(int(length))
+    return resp
+
+
+# 用于模块级 requests.get(...) 调用: requests.get(url, hooks=HTTP_HOOKS)
+HTTP_HOOKS = {"response": [observe_response]}
+
+
+def observe_error(url, error):
+    HTTP_ERRORS.labels(urlparse(url).netloc, type(error).__name__).inc()
+
+
+class CountingRetry(Retry):
+    """
+    与 urllib3 的 Retry 相同，每次重试时记入 pboc_http_retries_total
+    """
+
+    def increment(self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None):
+        host = getattr(_pool, "host", "") or ""
+        port = getattr(_pool, "port", None)
+        # 与 urlparse(url).netloc 保持一致: 默认端口不带端口号
+        if port and port not in (80, 443):
+            host = f"{host}:{port}"
+        HTTP_RETRIES.labels(host).inc()
+        return super().increment(method, url, response, error, _pool, _stacktrace)
+
+
+def retries(total):
+    """
+    代替 HTTPAdapter(max_retries=total)，行为相同但统计重试次数
+    """
+    return CountingRetry(total, redirect=True)
+
+
+def instrument_session(session):
+    session.hooks["response"].append(observe_response)
+    return session
+
+
+# ---------------------------------------------------------------- 输出
+def render():
+    lines = []
+    with _registry_lock:
+        metrics = list(REGISTRY)
+    for metric in metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def write_textfile(path):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(render())
+    os.replace(tmp, path)
+
+
+def dump_on_exit(path=None):
+    """
+    命令行任务调用: 进程退出时把指标写入 path (默认取环境变量 PBOC_METRICS_FILE，未设置则不写)
+    """
+    path = path or os.getenv(METRICS_FILE_ENV)
+    if path:
+        atexit.register(write_textfile, path)
+    return path
+
+
+# ---------------------------------------------------------------- 汇总
+_SAMPLE = re.compile(r'^(\w+)(?:\{(.*)\})? (\S+)$')
+_LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+def parse_text(text):
+    """
+    解析文本格式，返回 [(指标名, {标签}, 值)]
+    """
+    samples = []
+    for line in text.splitlines():
+        m = _SAMPLE.match(line)
+        if m:
+            labels = {k: v.replace('\\"', '"').replace("\\n", "\n").replace("\\\\", "\\")
+                      for k, v in _LABEL.findall(m.group(2) or "")}
+            samples.append((m.group(1), labels, float(m.group(3))))
+    return samples
+
+
+def summarize_hosts(samples):
+    """
+    :return: [{"host", "requests", "errors", "retries", "avg_ms", "bytes"}]，按平均耗时从慢到快
+    """
+    hosts = {}
+
+    def entry(host):
+        return hosts.setdefault(host, {"host": host, "requests": 0, "errors": 0, "retries": 0,
+                                       "seconds": 0.0, "count": 0, "bytes": 0})
+
+    for name, labels, value in samples:
+        host = labels.get("host")
+        if host is None:
+            continue
+        if name == "pboc_http_requests_total":
+            entry(host)["requests"] += value
+            if not labels.get("status", "").startswith("2"):
+                entry(host)["errors"] += value
+        elif name == "pboc_http_errors_total":
+            entry(host)["errors"] += value
+        elif name == "pboc_http_retries_total":
+            entry(host)["retries"] += value
+        elif name == "pboc_http_request_seconds_sum":
+            entry(host)["seconds"] += value
+        elif name == "pboc_http_request_seconds_count":
+            entry(host)["count"] += value
+        elif name == "pboc_http_response_bytes_total":
+            entry(host)["bytes"] += value
+    rows = []
+    for h in hosts.values():
+        h["avg_ms"] = h.pop("seconds") / h["count"] * 1000 if h["count"] else 0.0
+        h.pop("count")
+        rows.append(h)
+    return sorted(rows, key=lambda r: r["avg_ms"], reverse=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="按 host 汇总指标文件或 /metrics 接口")
+    parser.add_argument("source", help="指标文件路径，或 http://.../metrics 地址")
+    parser.add_argument("--raw", action="store_true", help="直接输出原始文本")
+    args = parser.parse_args(argv)
+
+    if args.source.startswith(("http://", "https://")):
+        import requests
+        text = requests.get(args.source, timeout=10).text
+    else:
+        with open(args.source, encoding="utf-8") as f:
+            text = f.read()
+    if args.raw:
+        print(text, end="")
+        return 0
+
+    rows = summarize_hosts(parse_text(text))
+    print(f"{'host':<32}{'请求':>8}{'错误':>8}{'重试':>8}{'平均ms':>10}{'MB':>10}")
+    for r in rows:
+        print(f"{r['host']:<32}{r['requests']:>8.0f}{r['errors']:>8.0f}{r['retries']:>8.0f}"
+              f"{r['avg_ms']:>10.1f}{r['bytes'] / 1048576:>10.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
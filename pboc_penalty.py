@@ -1,10 +1,23 @@
 import datetime
+import os
 import re
+import threading
+import time
 from urllib.parse import urljoin, urlparse
-from flask import Flask, request, render_template_string
+from flask import Flask, request, Response, stream_with_context
 import requests
+import pymysql
 from bs4 import BeautifulSoup
 import concurrent.futures
+import pboc_initial_database as db
+from pboc_penalty_store import PenaltyStore
+from pboc_records import PenaltyRecord
+from pboc_response_cache import ResponseCache
+import pboc_metrics
+import pboc_profiler
+import pboc_fetch_cache
+import pboc_trace
+import pboc_penalty_watch
 
 app = Flask(__name__)
 
@@ -53,16 +66,44 @@ PROVINCE_SITES = [
 ]
 
 FILE_EXTS = (".pdf", ".doc", ".docx", ".xls", ".xlsx", ".et", ".zip", ".rar")
-CACHE = {"prov": None, "city": None, "records": None}
+CACHE = {"prov": None, "city": None, "store": None}
 PROGRESS = {"status": "idle", "current": 0, "total": 0, "message": ""}
 
+# 启动时从 pboc_penalty 表预加载 (由 pboc_penalty_data.run_spider 维护)，
+# 之后按“数据更新时间”增量轮询；DB_POLL_INTERVAL 为 0 时只加载一次。
+# 在服务进程收到第一个请求时启动 (WSGI 服务器下同样生效；debug 模式 reloader 的父进程不会启动)
+WARM_START = True
+DB_POLL_INTERVAL = 60
+DB_FETCH_SIZE = 2000
+DB_STATE = {"last_update": None, "loaded": 0}
+# 写入方 (数据库轮询、按省刷新、全量刷新) 在“读取快照-合并-发布”期间串行，读取方不加锁
+STORE_LOCK = threading.Lock()
+# PBOC_WATCH=1 时随服务启动新公告监视 (pboc_penalty_watch)，新条目并入首页数据并推送到 /watch/stream
+WATCH_ENABLED = os.getenv("PBOC_WATCH") == "1"
+
+# 首页分页: 默认每页条数与上限；stream=1 时不分页，流式输出全部结果
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+# 首页渲染结果缓存，数据更新 (publish_store) 时整体失效；
+# range=month / year 等按当天日期计算，缓存键带上日期，过了零点不再返回前一天的结果
+RESPONSE_CACHE = ResponseCache(max_entries=256, vary=datetime.date.today)
+SORT_KEYS = {
+    "date_desc": None,
+    "date_asc": None,
+    "province": lambda x: (x.get("province") or "", x.get("branch") or ""),
+    "title": lambda x: x.get("title") or "",
+}
+
 # Configure a global session for connection pooling
 SESSION = requests.Session()
 # Enable retries and connection pooling
-adapter = requests.adapters.HTTPAdapter(pool_connections=10, pool_maxsize=10, max_retries=3)
+adapter = requests.adapters.HTTPAdapter(pool_connections=10, pool_maxsize=10, max_retries=pboc_metrics.retries(3))
 SESSION.mount('http://', adapter)
 SESSION.mount('https://', adapter)
+pboc_metrics.instrument_session(SESSION)
 
+# 同一次刷新中重复的 URL (如 list_pages 的首页又是 pages 的第一项) 只请求一次
+@pboc_fetch_cache.memoized
 def fetch(url):
     try:
         # Use session for connection reuse and set a reasonable timeout (5s)
@@ -72,7 +113,8 @@ def fetch(url):
             return None
         r.encoding = r.apparent_encoding or "utf-8"
         return r.text
-    except Exception:
+    except Exception as e:
+        pboc_metrics.observe_error(url, e)
         return None
 
 def list_pages(base_url, max_pages=10):
@@ -80,7 +122,7 @@ def list_pages(base_url, max_pages=10):
     first_html = fetch(base_url)
     if not first_html:
         return list(pages)
-    soup = BeautifulSoup(first_html, "lxml")
+    soup = pboc_fetch_cache.soup(first_html, "lxml")
     
     # 1. Try to find multiple pagination inputs (for multiple portlets)
     inputs = soup.find_all("input", attrs={"name": "article_paging_list_hidden"})
@@ -377,8 +419,10 @@ def parse_special_branch_page(soup, page_url, province_name):
 
 def parse_page_items(soup, page_url, province_name):
     if province_name in SPECIAL_PROVINCES:
-        return parse_special_branch_page(soup, page_url, province_name)
-    return parse_standard_branch_page(soup, page_url, province_name)
+        items = parse_special_branch_page(soup, page_url, province_name)
+    else:
+        items = parse_standard_branch_page(soup, page_url, province_name)
+    return [PenaltyRecord(it) for it in items]
 
 def deduplicate_records(items):
     seen = set()
@@ -394,10 +438,12 @@ def collect_attachments(detail_url):
     html = fetch(detail_url)
     if not html:
         return []
-    soup = BeautifulSoup(html, "lxml")
+    with pboc_metrics.PARSE_SECONDS.labels("penalty_detail").time():
+        soup = BeautifulSoup(html, "lxml")
+        links = soup.find_all("a", href=True)
     atts = []
     seen = set()
-    for a in soup.find_all("a", href=True):
+    for a in links:
         href = normalize_href(detail_url, a.get("href"))
         if not href:
             continue
@@ -442,8 +488,141 @@ def filter_by_range(items, range_key):
             res.append(it)
     return res
 
+def build_store(records):
+    return PenaltyStore(KEY_WORDS, records)
+
+def publish_store(store):
+    # 快照不可变，一次引用赋值即完成发布；index() 读取时无需加锁
+    CACHE["store"] = store
+    RESPONSE_CACHE.bump()
+
+def _row_to_record(row):
+    pub_date = row.get("发布日期")
+    return PenaltyRecord(
+        province=row.get("省份") or "",
+        branch=row.get("分行") or "",
+        title=row.get("行政处罚文件") or "",
+        url=row.get("下载链接"),
+        date=pub_date.strftime("%Y-%m-%d") if pub_date else "",
+    )
+
+def load_from_db(since=None):
+    """
+    从 pboc_penalty 表读取记录，使用服务端游标分批读取，避免一次性载入全部结果
+    :param since: 只读取“数据更新时间”不早于该时间的记录，None 表示全量
+                  (该列精度为秒，与上次同一秒提交的记录也要读到；重复的 url 在合并时忽略)
+    :return: (记录列表, 本次读到的最大“数据更新时间”)
+    """
+    sql = "SELECT `省份`, `分行`, `行政处罚文件`, `发布日期`, `下载链接`, `数据更新时间` FROM `pboc_penalty`"
+    args = ()
+    if since is not None:
+        sql += " WHERE `数据更新时间` >= %s"
+        args = (since,)
+    records = []
+    last_update = since
+    conn = db.get_connection('fic')
+    try:
+        with conn.cursor(pymysql.cursors.SSDictCursor) as cursor:
+            cursor.execute(sql, args)
+            while True:
+                rows = cursor.fetchmany(DB_FETCH_SIZE)
+                if not rows:
+                    break
+                for row in rows:
+                    if not row.get("下载链接"):
+                        continue
+                    records.append(_row_to_record(row))
+                    updated = row.get("数据更新时间")
+                    if updated and (last_update is None or updated > last_update):
+                        last_update = updated
+    finally:
+        conn.close()
+    return records, last_update
+
+def merge_db_records(records):
+    """
+    将数据库记录并入当前数据；已存在的 url (可能带有附件信息) 保持不变
+    :return: 新增条数
+    """
+    with STORE_LOCK:
+        store = CACHE.get("store")
+        if store is None:
+            publish_store(build_store(records))
+            return len(CACHE["store"])
+        merged = store.with_records(records)
+        if merged is not store:
+            publish_store(merged)
+        return len(merged) - len(store)
+
+def merge_crawled(records, province=None):
+    """
+    将新抓取的记录并入当前数据并发布: 新记录优先 (带附件信息)，当前数据中未被覆盖的记录
+    (如从数据库预加载的历史记录) 保留
+    :param province: 只抓取了某个省份时传入，该省份的记录以新抓取的为准，其他省份原样保留
+    """
+    with STORE_LOCK:
+        old = CACHE.get("store")
+        if province is not None:
+            # 增量替换: 不遍历其他省份，也不把该省份新抓取中已不存在的旧记录带回来
+            store = (old or build_store([])).replace_province(province, records)
+        else:
+            store = build_store(records)
+            if old is not None:
+                store = store.with_records(old)
+        publish_store(store)
+        return store
+
+def sync_from_db():
+    records, last_update = load_from_db(DB_STATE["last_update"])
+    added = merge_db_records(records)
+    DB_STATE["last_update"] = last_update
+    DB_STATE["loaded"] += added
+    return added
+
+def _db_sync_loop():
+    try:
+        added = sync_from_db()
+        print(f"从数据库预加载 {added} 条记录")
+    except Exception as e:
+        print(f"从数据库预加载失败: {e}")
+    while DB_POLL_INTERVAL:
+        time.sleep(DB_POLL_INTERVAL)
+        try:
+            added = sync_from_db()
+            if added:
+                print(f"从数据库增量加载 {added} 条记录")
+        except Exception as e:
+            print(f"从数据库增量加载失败: {e}")
+
+def start_db_sync():
+    t = threading.Thread(target=_db_sync_loop, daemon=True)
+    t.start()
+    return t
+
+_BACKGROUND = {"started": False}
+_BACKGROUND_LOCK = threading.Lock()
+
+def start_background():
+    """
+    启动数据库预加载和新公告监视 (PBOC_WATCH=1)，每个进程只启动一次
+    多进程部署时监视只在抢到状态文件锁的那个进程中运行 (见 pboc_penalty_watch.start_watch)
+    """
+    with _BACKGROUND_LOCK:
+        if _BACKGROUND["started"]:
+            return
+        _BACKGROUND["started"] = True
+    if WARM_START:
+        start_db_sync()
+    if WATCH_ENABLED:
+        pboc_penalty_watch.start_watch(KEY_WORDS, on_new=merge_db_records)
+
+@app.before_request
+def _start_background():
+    start_background()
+
+@pboc_fetch_cache.scope("penalty")
 def get_all_data(force=False):
-    if force or CACHE["records"] is None:
+    if force or CACHE["store"] is None:
         records = []
         for site in PROVINCE_SITES:
             province = site["province"]
@@ -452,22 +631,25 @@ def get_all_data(force=False):
                 html = fetch(page)
                 if not html:
                     continue
-                soup = BeautifulSoup(html, "lxml")
+                soup = pboc_fetch_cache.soup(html, "lxml")
                 items = parse_page_items(soup, page, province)
                 records.extend(items)
         
         records = deduplicate_records(records)
         for it in records:
             it["attachments"] = collect_attachments(it["url"])
-        CACHE["records"] = sort_records(records)
-    return CACHE["records"]
+        merge_crawled(records)
+    return CACHE["store"]
 def process_single_page(page, prov):
     html = fetch(page)
     if html:
-        soup = BeautifulSoup(html, "lxml")
-        return parse_page_items(soup, page, prov)
+        page_type = "penalty_special" if prov in SPECIAL_PROVINCES else "penalty_standard"
+        with pboc_metrics.PARSE_SECONDS.labels(page_type).time():
+            soup = pboc_fetch_cache.soup(html, "lxml")
+            return parse_page_items(soup, page, prov)
     return []
 
+@pboc_fetch_cache.scope("penalty_fetch_all")
 def _async_fetch_all():
     try:
         PROGRESS["status"] = "running"
@@ -488,7 +670,7 @@ def _async_fetch_all():
             for entry in pages_map:
                 prov = entry["province"]
                 for page in entry["pages"]:
-                    future = executor.submit(process_single_page, page, prov)
+                    future = executor.submit(pboc_trace.wrap(process_single_page), page, prov)
                     future_to_info[future] = page
             
             for future in concurrent.futures.as_completed(future_to_info):
@@ -510,12 +692,13 @@ def _async_fetch_all():
             it["attachments"] = collect_attachments(it["url"])
             PROGRESS["current"] += 1
             
-        CACHE["records"] = sort_records(records)
+        merge_crawled(records)
         PROGRESS["status"] = "done"
         PROGRESS["message"] = "完成"
     except Exception as e:
         PROGRESS["status"] = "error"
         PROGRESS["message"] = str(e)
+@pboc_fetch_cache.scope("penalty_fetch_one")
 def _async_fetch_one(province):
     try:
         target = None
@@ -534,7 +717,7 @@ def _async_fetch_one(province):
         new_records = []
         # Use ThreadPoolExecutor for concurrent page fetching
         with concurrent.futures.ThreadPoolExecutor(max_workers=3) as executor:
-            future_to_url = {executor.submit(process_single_page, page, province): page for page in pages}
+            future_to_url = {executor.submit(pboc_trace.wrap(process_single_page), page, province): page for page in pages}
             for future in concurrent.futures.as_completed(future_to_url):
                 try:
                     items = future.result()
@@ -550,9 +733,7 @@ def _async_fetch_one(province):
         for it in new_records:
             it["attachments"] = collect_attachments(it["url"])
             PROGRESS["current"] += 1
-        old = CACHE.get("records") or []
-        others = [x for x in old if x.get("province") != province]
-        CACHE["records"] = sort_records(others + new_records)
+        merge_crawled(new_records, province)
         PROGRESS["status"] = "done"
         PROGRESS["message"] = "完成"
     except Exception as e:
@@ -580,6 +761,8 @@ INDEX_TMPL = """
       select { padding:4px; }
       .range-buttons { display:inline-flex; gap:0; }
       .range-buttons button { margin:0; padding:4px 10px; }
+      .pager { margin-bottom:8px; color:#666; font-size:12px; }
+      .pager a { margin-left:8px; }
     </style>
   </head>
   <body>
@@ -618,7 +801,21 @@ INDEX_TMPL = """
           <option value="{{ k }}" {% if k == keyword_filter %}selected{% endif %}>{{ k }}</option>
         {% endfor %}
       </select>
+      <label style="margin-left:8px;">排序：</label>
+      <select id="sortSel">
+        {% for key, label in [('date_desc', '日期↓'), ('date_asc', '日期↑'), ('province', '省份'), ('title', '名称')] %}
+          <option value="{{ key }}" {% if key == sort_key %}selected{% endif %}>{{ label }}</option>
+        {% endfor %}
+      </select>
+    </div>
+    {% if not stream %}
+    <div class="pager">
+      共 {{ total }} 条{% if total %}，第 {{ offset + 1 }}-{{ offset + page_count }} 条{% endif %}
+      {% if offset > 0 %}<a href="#" data-offset="{{ [offset - limit, 0]|max }}">上一页</a>{% endif %}
+      {% if offset + limit < total %}<a href="#" data-offset="{{ offset + limit }}">下一页</a>{% endif %}
+      {% if total > limit %}<a href="#" id="lnkStream">显示全部</a>{% endif %}
     </div>
+    {% endif %}
     {% if rows %}
       <table>
         <thead>
@@ -634,15 +831,15 @@ INDEX_TMPL = """
         <tbody>
           {% for r in rows %}
           <tr>
-            <td>{{ loop.index }}</td>
+            <td>{{ offset + loop.index }}</td>
             <td>{{ r.province }}</td>
             <td>{{ r.branch }}</td>
-            <td><a href="{{ r.url }}" target="_blank" rel="noopener">{{ r.name }}</a></td>
+            <td><a href="{{ r.url }}" target="_blank" rel="noopener">{{ r.title }}</a></td>
             <td>{{ r.date }}</td>
             <td class="downloads">
-              {% if r.downloads and r.downloads|length > 0 %}
-                {% for d in r.downloads %}
-                  <a href="{{ d }}" target="_blank" rel="noopener">下载</a>
+              {% if r.attachments and r.attachments|length > 0 %}
+                {% for d in r.attachments %}
+                  <a href="{{ d.url }}" target="_blank" rel="noopener">下载</a>
                 {% endfor %}
               {% else %}-{% endif %}
             </td>
@@ -663,18 +860,32 @@ INDEX_TMPL = """
       const btnRangeMonth = document.getElementById('btnRangeMonth');
       const btnRangeYear = document.getElementById('btnRangeYear');
       const btnRangeAll = document.getElementById('btnRangeAll');
-      sel.onchange = () => {
-        const p = sel.value;
+      const sortSel = document.getElementById('sortSel');
+      // 筛选条件变化时回到第一页
+      const setParam = (name, value) => {
         const q = new URLSearchParams(window.location.search);
-        if (p) q.set('province', p); else q.delete('province');
-        window.location.search = q.toString();
-      };
-      kwSel.onchange = () => {
-        const k = kwSel.value;
-        const q = new URLSearchParams(window.location.search);
-        if (k) q.set('keyword', k); else q.delete('keyword');
+        if (value) q.set(name, value); else q.delete(name);
+        q.delete('offset');
         window.location.search = q.toString();
       };
+      sel.onchange = () => setParam('province', sel.value);
+      kwSel.onchange = () => setParam('keyword', kwSel.value);
+      sortSel.onchange = () => setParam('sort', sortSel.value);
+      document.querySelectorAll('.pager a[data-offset]').forEach(a => {
+        a.onclick = (e) => {
+          e.preventDefault();
+          const q = new URLSearchParams(window.location.search);
+          q.set('offset', a.dataset.offset);
+          window.location.search = q.toString();
+        };
+      });
+      const lnkStream = document.getElementById('lnkStream');
+      if (lnkStream) {
+        lnkStream.onclick = (e) => {
+          e.preventDefault();
+          setParam('stream', '1');
+        };
+      }
       btnOne.onclick = async () => {
         const p = selFetch.value;
         btnOne.disabled = true;
@@ -710,60 +921,79 @@ INDEX_TMPL = """
           btnOne.disabled = false;
         }
       };
-      btnRangeMonth.onclick = () => {
-        const q = new URLSearchParams(window.location.search);
-        q.set('range', 'month');
-        window.location.search = q.toString();
-      };
-      btnRangeYear.onclick = () => {
-        const q = new URLSearchParams(window.location.search);
-        q.set('range', 'year');
-        window.location.search = q.toString();
-      };
-      btnRangeAll.onclick = () => {
-        const q = new URLSearchParams(window.location.search);
-        q.set('range', 'all');
-        window.location.search = q.toString();
-      };
+      btnRangeMonth.onclick = () => setParam('range', 'month');
+      btnRangeYear.onclick = () => setParam('range', 'year');
+      btnRangeAll.onclick = () => setParam('range', 'all');
     </script>
   </body>
 </html>
 """
 
+def _index_template():
+    # 模板只编译一次，之后每次请求直接渲染
+    tmpl = CACHE.get("index_tmpl")
+    if tmpl is None:
+        tmpl = CACHE["index_tmpl"] = app.jinja_env.from_string(INDEX_TMPL)
+    return tmpl
+
+def _int_arg(name, default, lo, hi):
+    try:
+        value = int(request.args.get(name, default))
+    except (TypeError, ValueError):
+        value = default
+    return max(lo, min(hi, value))
+
+def sort_rows(rows, sort_key):
+    if sort_key == "date_asc":
+        # 快照按日期倒序，无日期的记录在末尾；只反转有日期的部分，无日期的仍排在最后
+        split = next((i for i, r in enumerate(rows) if not r.get("date")), len(rows))
+        return rows[:split][::-1] + rows[split:]
+    key = SORT_KEYS.get(sort_key)
+    if key is None:
+        return rows
+    return sorted(rows, key=key)
+
 @app.route("/")
+@RESPONSE_CACHE.cached
 def index():
     range_key = request.args.get("range", "all")
     province_filter = request.args.get("province", "")
     keyword_filter = request.args.get("keyword", "")
-    records = CACHE.get("records") or []
-    filtered = filter_by_range(list(records), range_key)
-    if province_filter:
-        filtered = [x for x in filtered if x.get("province") == province_filter]
-    if keyword_filter:
-        filtered = [x for x in filtered if keyword_filter in (x.get("title") or "")]
-    rows = []
-    for it in filtered:
-        dls = [att["url"] for att in (it.get("attachments") or [])]
-        rows.append(
-            type(
-                "Row",
-                (),
-                {"province": it.get("province", ""), "branch": it.get("branch", ""), "name": it.get("title", ""), "url": it.get("url", ""), "date": it.get("date", ""), "downloads": dls},
-            )
-        )
-    return render_template_string(
-        INDEX_TMPL,
+    sort_key = request.args.get("sort", "date_desc")
+    if sort_key not in SORT_KEYS:
+        sort_key = "date_desc"
+    stream = request.args.get("stream") == "1"
+    store = CACHE.get("store") or PenaltyStore(KEY_WORDS)
+    rows = sort_rows(store.query(range_key, province_filter, keyword_filter), sort_key)
+    total = len(rows)
+    if stream:
+        limit, offset = total, 0
+    else:
+        limit = _int_arg("limit", PAGE_SIZE, 1, MAX_PAGE_SIZE)
+        offset = _int_arg("offset", 0, 0, max(total - 1, 0))
+        rows = rows[offset:offset + limit]
+    context = dict(
         rows=rows,
+        total=total,
+        offset=offset,
+        limit=limit,
+        page_count=len(rows),
+        stream=stream,
+        sort_key=sort_key,
         range_key=range_key,
-        provinces=sorted({x.get("province") for x in records}),
+        provinces=store.provinces(),
         site_provinces=[s["province"] for s in PROVINCE_SITES],
-        keywords=sorted({k for k in KEY_WORDS if any(k in (x.get("title") or "") for x in records)}),
+        keywords=store.keywords(),
         keyword_filter=keyword_filter,
         province_filter=province_filter,
     )
+    tmpl = _index_template()
+    if stream:
+        # 全量导出时边渲染边输出，首字节更快且内存不随结果数增长
+        return Response(stream_with_context(tmpl.generate(**context)), mimetype="text/html")
+    return tmpl.render(**context)
 @app.route("/api/fetch_start", methods=["POST"])
 def fetch_start():
-    import threading
     if PROGRESS["status"] == "running":
         return {"status": "running"}
     t = threading.Thread(target=_async_fetch_all, daemon=True)
@@ -779,7 +1009,6 @@ def fetch_status():
     }
 @app.route("/api/fetch_start_one", methods=["POST"])
 def fetch_start_one():
-    import threading
     if PROGRESS["status"] == "running":
         return {"status": "running"}
     prov = request.args.get("province") or (request.json or {}).get("province") or request.form.get("province")
@@ -788,6 +1017,17 @@ def fetch_start_one():
     t = threading.Thread(target=_async_fetch_one, args=(prov,), daemon=True)
     t.start()
     return {"status": "started"}
+@app.route("/metrics")
+def metrics():
+    return Response(pboc_metrics.render(), content_type=pboc_metrics.CONTENT_TYPE)
+
+# /debug/profile、/debug/memory (需设置 PBOC_DEBUG_TOKEN 才启用)
+app.register_blueprint(pboc_profiler.blueprint)
+# /watch/stream、/watch/status
+app.register_blueprint(pboc_penalty_watch.blueprint)
 
 if __name__ == "__main__":
+    # debug 模式下 reloader 的父进程不提供服务；实际服务进程立即启动，不等第一个请求
+    if os.environ.get("WERKZEUG_RUN_MAIN"):
+        start_background()
     app.run(host="0.0.0.0", port=5001, debug=True)
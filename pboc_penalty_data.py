@@ -1,9 +1,14 @@
 import datetime
 import re
+import time
 from urllib.parse import urljoin, urlparse
 import requests
-from bs4 import BeautifulSoup
 import pboc_initial_database as db
+from pboc_records import PenaltyRecord
+from pboc_snapshot import snapshot_after_run
+import pboc_metrics
+import pboc_fetch_cache
+import pboc_trace
 import concurrent.futures
 
 HEADERS = {
@@ -58,10 +63,13 @@ SPECIAL_PROVINCES = ["北京市", "天津市", "上海市", "宁波市", "深圳
 # Configure a global session for connection pooling
 SESSION = requests.Session()
 # Enable retries and connection pooling
-adapter = requests.adapters.HTTPAdapter(pool_connections=10, pool_maxsize=10, max_retries=3)
+adapter = requests.adapters.HTTPAdapter(pool_connections=10, pool_maxsize=10, max_retries=pboc_metrics.retries(3))
 SESSION.mount('http://', adapter)
 SESSION.mount('https://', adapter)
+pboc_metrics.instrument_session(SESSION)
 
+# 同一次运行中重复的 URL (如 list_pages 的首页又是 pages 的第一项) 只请求一次
+@pboc_fetch_cache.memoized
 def fetch(url):
     try:
         # Use session for connection reuse and set a reasonable timeout (5s)
@@ -73,6 +81,7 @@ def fetch(url):
         r.encoding = r.apparent_encoding or "utf-8"
         return r.text
     except Exception as e:
+        pboc_metrics.observe_error(url, e)
         print(f"Error fetching {url}: {e}")
         return None
 
@@ -86,11 +95,17 @@ def list_pages(base_url, max_pages=100):
     获取分页链接。
     参考 model1.py 的逻辑，增强对各类分页结构的兼容性。
     """
-    pages = {base_url}
     first_html = fetch(base_url)
     if not first_html:
-        return list(pages)
-    soup = BeautifulSoup(first_html, "lxml")
+        return [base_url]
+    return parse_page_links(first_html, base_url, max_pages)
+
+def parse_page_links(first_html, base_url, max_pages=100):
+    """
+    从第一页 HTML 中推断全部分页链接 (list_pages 的解析部分)
+    """
+    pages = {base_url}
+    soup = pboc_fetch_cache.soup(first_html, "lxml")
     
     # 1. Try to find multiple pagination inputs (for multiple portlets)
     inputs = soup.find_all("input", attrs={"name": "article_paging_list_hidden"})
@@ -399,8 +414,10 @@ def parse_special_branch_page(soup, page_url, province_name):
 
 def parse_page_items(soup, page_url, province_name):
     if province_name in SPECIAL_PROVINCES:
-        return parse_special_branch_page(soup, page_url, province_name)
-    return parse_standard_branch_page(soup, page_url, province_name)
+        items = parse_special_branch_page(soup, page_url, province_name)
+    else:
+        items = parse_standard_branch_page(soup, page_url, province_name)
+    return [PenaltyRecord(it) for it in items]
 
 def save_to_db(items):
     """
@@ -411,6 +428,7 @@ def save_to_db(items):
     if not items:
         return
 
+    started = time.perf_counter()
     try:
         conn = db.get_connection('fic')
         with conn.cursor() as cursor:
@@ -477,6 +495,8 @@ def save_to_db(items):
                     inserted_count += 1
 
         conn.commit()
+        pboc_metrics.DB_WRITE_SECONDS.labels("pboc_penalty").observe(time.perf_counter() - started)
+        pboc_metrics.DB_BATCH_ROWS.labels("pboc_penalty").observe(len(items))
         print(f"数据库操作完成: 新增 {inserted_count} 条, 更新 {updated_count} 条。")
         conn.close()
     except Exception as e:
@@ -490,10 +510,18 @@ def process_single_page(page_url, prov):
     html = fetch(page_url)
     if not html:
         return []
-    
-    soup = BeautifulSoup(html, "lxml")
-    return parse_page_items(soup, page_url, prov)
+    return parse_page_html(html, page_url, prov)
+
+def parse_page_html(html, page_url, prov):
+    """
+    解析列表页 HTML (process_single_page 的解析部分)
+    """
+    page_type = "penalty_special" if prov in SPECIAL_PROVINCES else "penalty_standard"
+    with pboc_metrics.PARSE_SECONDS.labels(page_type).time():
+        soup = pboc_fetch_cache.soup(html, "lxml")
+        return parse_page_items(soup, page_url, prov)
 
+@pboc_fetch_cache.scope("pboc_penalty")
 def run_spider(target_provinces=None, max_pages=5):
     """
     执行爬虫任务
@@ -517,7 +545,7 @@ def run_spider(target_provinces=None, max_pages=5):
         
         # 使用线程池并发抓取页面
         with concurrent.futures.ThreadPoolExecutor(max_workers=3) as executor:
-            future_to_url = {executor.submit(process_single_page, url, prov): url for url in pages}
+            future_to_url = {executor.submit(pboc_trace.wrap(process_single_page), url, prov): url for url in pages}
             for future in concurrent.futures.as_completed(future_to_url):
                 url = future_to_url[future]
                 try:
@@ -534,6 +562,8 @@ def run_spider(target_provinces=None, max_pages=5):
         
     print(f"爬取完成，共获取 {len(all_items)} 条记录，正在写入数据库...")
     save_to_db(all_items)
+    snapshot_after_run(["pboc_penalty"])
 
 if __name__ == "__main__":
+    pboc_metrics.dump_on_exit()
     run_spider()
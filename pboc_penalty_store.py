@@ -0,0 +1,243 @@
+"""
+行政处罚记录的内存索引 (供 pboc_penalty.py 的首页使用)
+
+记录在加入时就预先解析好日期，并按日期倒序维护在有序数组中；
+同时维护按省份分桶、按关键字 (KEY_WORDS) 的倒排列表以及 url 去重表。
+首页的时间范围 / 省份 / 关键字筛选因此只需 O(log n + k)，不再全表扫描。
+
+PenaltyStore 是不可变快照: 刷新某个省份或并入新记录时生成新的快照
+(只对新记录排序，再与现有有序数组线性归并，未变化的省份分桶直接复用)，
+由调用方一次引用赋值发布。读取方拿到的永远是完整一致的快照，无需加锁。
+"""
+import bisect
+import datetime
+import heapq
+import itertools
+from operator import itemgetter
+
+# 排序键: 日期越新越小 (倒序)，同日期按加入顺序；无法解析的日期排在最后
+_MAX_ORDINAL = datetime.date.max.toordinal()
+_SEQ_BITS = 32
+# 跨快照全局递增，保证同日期记录在归并后仍保持加入顺序
+_SEQ = itertools.count(1)
+
+RANGE_DAYS = {"month": 30, "year": 365}
+
+
+def date_ordinal(s):
+    """
+    将 'YYYY-MM-DD' 转为 ordinal，无法解析返回 0
+    """
+    try:
+        return datetime.date.fromisoformat(s).toordinal()
+    except ValueError:
+        pass
+    try:
+        return datetime.datetime.strptime(s, "%Y-%m-%d").date().toordinal()
+    except Exception:
+        return 0
+
+
+def range_start(range_key, today=None):
+    """
+    返回时间范围的起始日期 ordinal，'all' 返回 None
+    与 pboc_penalty.filter_by_range 的口径一致: year 为 365 天，其余为 30 天
+    """
+    if range_key == "all":
+        return None
+    today = today or datetime.date.today()
+    days = RANGE_DAYS.get(range_key, RANGE_DAYS["month"])
+    return (today - datetime.timedelta(days=days)).toordinal()
+
+
+def sort_key(item):
+    ordinal = date_ordinal(item.get("date") or "")
+    return ((_MAX_ORDINAL - ordinal) << _SEQ_BITS) | next(_SEQ)
+
+
+class _Bucket:
+    """
+    按排序键有序的一组记录，keys 与 items 下标一一对应；创建后不再修改
+    """
+
+    __slots__ = ("keys", "items")
+
+    def __init__(self, keys=(), items=()):
+        self.keys = list(keys)
+        self.items = list(items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def merged(self, pairs, drop=None):
+        """
+        返回新分桶: 去掉 drop(item) 为真的记录，再与已排序的 pairs 线性归并
+        """
+        if drop is None and not pairs:
+            return self
+        old = zip(self.keys, self.items)
+        if drop is not None:
+            old = ((k, it) for k, it in old if not drop(it))
+        keys = []
+        items = []
+        for k, it in heapq.merge(old, pairs, key=itemgetter(0)):
+            keys.append(k)
+            items.append(it)
+        return _Bucket(keys, items)
+
+    def head(self, start_ordinal):
+        """
+        返回日期 >= start_ordinal 的前缀 (start_ordinal 为 None 时返回全部)
+        """
+        if start_ordinal is None:
+            return self.items
+        cut = (_MAX_ORDINAL - start_ordinal + 1) << _SEQ_BITS
+        return self.items[:bisect.bisect_left(self.keys, cut)]
+
+
+_EMPTY = _Bucket()
+
+
+class PenaltyStore:
+    """
+    行政处罚记录索引 (不可变快照)
+    :param keywords: 需要建立倒排列表的关键字，通常为 KEY_WORDS
+    :param records: 初始记录；url 重复时保留先出现的 (与 deduplicate_records 一致)
+    """
+
+    def __init__(self, keywords=(), records=()):
+        self._keywords = tuple(keywords)
+        self._all = _EMPTY
+        self._by_province = {}
+        self._by_keyword = {k: _EMPTY for k in self._keywords}
+        self._by_url = {}
+        if records:
+            self._merge_in(self._partition(records), drop_province=None)
+
+    def __len__(self):
+        return len(self._all)
+
+    def __iter__(self):
+        return iter(self._all.items)
+
+    def __contains__(self, url):
+        return url in self._by_url
+
+    def _partition(self, records, exclude=None):
+        """
+        为新记录计算排序键并排序；跳过无 url、重复或已在 exclude 中的记录
+        """
+        seen = set()
+        pairs = []
+        for it in records:
+            url = it.get("url")
+            if not url or url in seen or (exclude is not None and url in exclude):
+                continue
+            seen.add(url)
+            pairs.append((sort_key(it), it))
+        pairs.sort(key=itemgetter(0))
+        return pairs
+
+    def _copy(self):
+        clone = PenaltyStore.__new__(PenaltyStore)
+        clone._keywords = self._keywords
+        clone._all = self._all
+        clone._by_province = dict(self._by_province)
+        clone._by_keyword = dict(self._by_keyword)
+        clone._by_url = self._by_url
+        return clone
+
+    def _merge_in(self, pairs, drop_province):
+        """
+        原地更新 (只在尚未发布的新快照上调用)
+        """
+        drop = None
+        dropped = _EMPTY
+        if drop_province is not None:
+            drop = lambda it: it.get("province") == drop_province
+            dropped = self._by_province.pop(drop_province, _EMPTY)
+        self._all = self._all.merged(pairs, drop)
+
+        by_province = {}
+        by_keyword = {k: [] for k in self._keywords}
+        for pair in pairs:
+            it = pair[1]
+            by_province.setdefault(it.get("province"), []).append(pair)
+            title = it.get("title") or ""
+            for k in self._keywords:
+                if k in title:
+                    by_keyword[k].append(pair)
+
+        for province, sub in by_province.items():
+            self._by_province[province] = self._by_province.get(province, _EMPTY).merged(sub)
+        for k, sub in by_keyword.items():
+            self._by_keyword[k] = self._by_keyword[k].merged(sub, drop)
+
+        by_url = dict(self._by_url)
+        for it in dropped.items:
+            by_url.pop(it.get("url"), None)
+        for _, it in pairs:
+            by_url[it.get("url")] = it
+        self._by_url = by_url
+
+    def replace_province(self, province, records):
+        """
+        用新抓取的记录替换某个省份，返回新快照
+        """
+        new_pairs = []
+        for pair in self._partition(records):
+            # 其他省份已存在的 url 保持不变
+            existing = self._by_url.get(pair[1].get("url"))
+            if existing is None or existing.get("province") == province:
+                new_pairs.append(pair)
+        clone = self._copy()
+        clone._merge_in(new_pairs, drop_province=province)
+        return clone
+
+    def with_records(self, records):
+        """
+        并入新记录 (已存在的 url 忽略)，返回新快照
+        """
+        pairs = self._partition(records, exclude=self._by_url)
+        if not pairs:
+            return self
+        clone = self._copy()
+        clone._merge_in(pairs, drop_province=None)
+        return clone
+
+    def get(self, url):
+        return self._by_url.get(url)
+
+    def provinces(self):
+        """
+        已有数据的省份 (排序后)
+        """
+        return sorted(p for p, b in self._by_province.items() if p and len(b))
+
+    def keywords(self):
+        """
+        至少命中一条记录的关键字 (排序后)
+        """
+        return sorted(k for k, b in self._by_keyword.items() if len(b))
+
+    def query(self, range_key="all", province="", keyword="", today=None):
+        """
+        按时间范围 / 省份 / 关键字筛选，结果按发布日期倒序 (调用方不应修改返回的列表)
+        先在候选最少的索引上二分截取时间范围，再用其余条件过滤
+        """
+        start = range_start(range_key, today)
+        candidates = [self._all]
+        if province:
+            bucket = self._by_province.get(province)
+            if bucket is None:
+                return []
+            candidates.append(bucket)
+        if keyword and keyword in self._by_keyword:
+            candidates.append(self._by_keyword[keyword])
+        bucket = min(candidates, key=len)
+        rows = bucket.head(start)
+        if province and bucket is not self._by_province[province]:
+            rows = [x for x in rows if x.get("province") == province]
+        if keyword and bucket is not self._by_keyword.get(keyword):
+            rows = [x for x in rows if keyword in (x.get("title") or "")]
+        return rows
@@ -0,0 +1,502 @@
+"""
+行政处罚新公告的低延迟监视
+
+每轮只对各省份列表的第一页发条件请求 (If-None-Match / If-Modified-Since，约 36 个小请求)，
+解析出的条目与已知 URL 比较，新条目中标题包含关键字 (默认 pboc_penalty.KEY_WORDS) 的推送到:
+    - webhook: POST JSON {"items": [...]}
+    - 文件: 每条一行 JSON 追加到 JSONL
+    - SSE: /watch/stream (挂在 pboc_penalty 上，或命令行 --sse-port 单独提供)
+每轮间隔 WATCH_INTERVAL 秒，公告发布后一分钟内可以收到。
+
+已知 URL 和各站点的 ETag / Last-Modified 保存在 STATE_PATH；某省份第一次出现时只记录现有条目，不推送。
+
+用法:
+    python pboc_penalty_watch.py --webhook http://127.0.0.1:9000/hook --jsonl penalty_watch.jsonl
+    python pboc_penalty_watch.py --sse-port 5202 --all       # 推送所有新条目
+    curl -N http://127.0.0.1:5202/watch/stream
+在 pboc_penalty.py 中设置环境变量 PBOC_WATCH=1 即随服务启动，新条目同时并入首页数据。
+同一个状态文件只能有一个进程在监视 (STATE_PATH + ".lock" 上的文件锁)；gunicorn 等多进程部署时
+只有抢到锁的进程启动监视，其余进程不监视，它们的 /watch/stream 收不到推送，应把 SSE 请求转发到
+单独运行的 pboc_penalty_watch.py --sse-port。
+"""
+import argparse
+import collections
+import concurrent.futures
+import datetime
+import json
+import os
+import queue
+import sys
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows 上没有 fcntl，不做多进程互斥
+    fcntl = None
+
+import requests
+from flask import Blueprint, Flask, Response, request, stream_with_context
+
+import pboc_metrics
+import pboc_penalty_data
+
+basedir = os.path.dirname(os.path.abspath(__file__))
+STATE_PATH = os.path.join(basedir, "penalty_watch_state.json")
+WATCH_INTERVAL = 45
+WATCH_WORKERS = 6
+POLL_TIMEOUT = 10
+# 每个省份记住的最近 URL 数 (第一页约 20 条，留足余量)
+KNOWN_LIMIT = 200
+WEBHOOK_TIMEOUT = 10
+WEBHOOK_RETRIES = 3
+# 等待发送的 webhook 批次上限；接收方长时间不可用时丢弃新批次，不拖慢监视
+WEBHOOK_QUEUE = 100
+# SSE 保留的最近事件数，断线重连 (Last-Event-ID) 时补发
+CHANNEL_HISTORY = 200
+# SSE 心跳间隔，防止代理断开空闲连接
+KEEPALIVE = 15
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) "
+                  "Chrome/120.0 Safari/537.36",
+}
+
+
+# ---------------------------------------------------------------- 推送
+class EventChannel:
+    """
+    SSE 广播: 每个订阅者一个队列，保留最近 CHANNEL_HISTORY 条事件供重连补发
+    """
+
+    def __init__(self, history=CHANNEL_HISTORY):
+        self._lock = threading.Lock()
+        self._history = collections.deque(maxlen=history)
+        self._subscribers = set()
+        self._next_id = 1
+
+    def publish(self, data):
+        with self._lock:
+            event = (self._next_id, data)
+            self._next_id += 1
+            self._history.append(event)
+            for q in self._subscribers:
+                q.put(event)
+
+    def subscribe(self, last_id=None):
+        q = queue.Queue()
+        with self._lock:
+            if last_id is not None:
+                for event in self._history:
+                    if event[0] > last_id:
+                        q.put(event)
+            self._subscribers.add(q)
+        return q
+
+    def unsubscribe(self, q):
+        with self._lock:
+            self._subscribers.discard(q)
+
+    def subscribers(self):
+        with self._lock:
+            return len(self._subscribers)
+
+
+CHANNEL = EventChannel()
+
+
+class ChannelSink:
+    name = "sse"
+
+    def __init__(self, channel=CHANNEL):
+        self.channel = channel
+
+    def deliver(self, items):
+        for it in items:
+            self.channel.publish(it)
+
+
+class JsonlSink:
+    name = "jsonl"
+
+    def __init__(self, path):
+        self.path = path
+
+    def deliver(self, items):
+        with open(self.path, "a", encoding="utf-8") as f:
+            for it in items:
+                f.write(json.dumps(it, ensure_ascii=False) + "\n")
+
+
+class WebhookSink:
+    """
+    在单独的线程中按顺序发送，重试等待不占用监视的轮次；deliver() 只把批次放入队列
+    """
+    name = "webhook"
+
+    def __init__(self, url, session=None, max_pending=WEBHOOK_QUEUE):
+        self.url = url
+        self.session = session or requests.Session()
+        self._queue = queue.Queue(max_pending)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def deliver(self, items):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._worker, name="penalty-webhook", daemon=True)
+                self._thread.start()
+        # 队列已满时抛出 queue.Full，计为推送失败
+        self._queue.put_nowait(items)
+        return "queued"
+
+    def _worker(self):
+        while True:
+            items = self._queue.get()
+            try:
+                self.send(items)
+                pboc_metrics.WATCH_DELIVERIES.labels(self.name, "success").inc()
+            except Exception as e:
+                pboc_metrics.WATCH_DELIVERIES.labels(self.name, "error").inc()
+                print(f"推送到 {self.name} 失败: {e}")
+            finally:
+                self._queue.task_done()
+
+    def send(self, items):
+        for attempt in range(WEBHOOK_RETRIES):
+            try:
+                resp = self.session.post(self.url, json={"items": items}, timeout=WEBHOOK_TIMEOUT)
+                resp.raise_for_status()
+                return
+            except requests.RequestException:
+                # 最后一次失败后直接抛出，不再等待
+                if attempt == WEBHOOK_RETRIES - 1:
+                    raise
+                time.sleep(2 ** attempt)
+
+    def close(self, timeout=None):
+        """
+        等待队列中的批次发送完 (--once 退出前调用)；timeout 秒后不再等待
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+
+# ---------------------------------------------------------------- 监视
+def matches(item, keywords):
+    """
+    与 PenaltyStore 的关键字索引一致，按标题匹配；返回命中的关键字
+    """
+    title = item.get("title") or ""
+    return [k for k in keywords if k in title]
+
+
+class PenaltyWatcher:
+    """
+    :param keywords: 只推送标题包含这些关键字的新条目；为空时推送全部新条目
+    :param sinks: ChannelSink / JsonlSink / WebhookSink
+    :param on_new: 可选，每轮收到全部新条目 (不论是否命中关键字)，如 pboc_penalty.merge_db_records
+    """
+
+    def __init__(self, keywords=(), sinks=(), sites=None, state_path=STATE_PATH, interval=WATCH_INTERVAL,
+                 workers=WATCH_WORKERS, on_new=None, session=None):
+        self.keywords = list(keywords)
+        self.sinks = list(sinks)
+        self.sites = sites or pboc_penalty_data.PROVINCE_SITES
+        self.state_path = state_path
+        self.interval = interval
+        self.workers = workers
+        self.on_new = on_new
+        if session is None:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=len(self.sites), pool_maxsize=workers,
+                                                    max_retries=pboc_metrics.retries(1))
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            pboc_metrics.instrument_session(session)
+        self.session = session
+        self.state = {}
+        if state_path and os.path.exists(state_path):
+            try:
+                with open(state_path, encoding="utf-8") as f:
+                    self.state = json.load(f)
+            except Exception as e:
+                print(f"监视状态读取失败，将重新记录: {state_path}: {e}")
+        self.stats = {"cycles": 0, "last_cycle": None, "last_seconds": None, "new": 0, "matched": 0, "errors": 0}
+        self._stop = threading.Event()
+        # lock_state() 返回的锁文件，持有期间其他进程不会监视同一个状态文件
+        self.lock = None
+
+    def save(self):
+        if not self.state_path:
+            return
+        tmp = f"{self.state_path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, ensure_ascii=False)
+        os.replace(tmp, self.state_path)
+
+    def poll(self, site):
+        """
+        请求某省份第一页
+        :return: (结果, 条目列表)，结果为 "not_modified" / "ok" / "error"；304 和出错时条目为空
+        """
+        province, url = site["province"], site["base_url"]
+        st = self.state.get(province, {})
+        headers = dict(HEADERS)
+        if st.get("etag"):
+            headers["If-None-Match"] = st["etag"]
+        if st.get("last_modified"):
+            headers["If-Modified-Since"] = st["last_modified"]
+        try:
+            resp = self.session.get(url, headers=headers, timeout=POLL_TIMEOUT)
+            if resp.status_code == 304:
+                return "not_modified", [], resp.headers
+            resp.raise_for_status()
+            resp.encoding = resp.apparent_encoding or "utf-8"
+            items = pboc_penalty_data.parse_page_html(resp.text, url, province)
+        except Exception as e:
+            if not isinstance(e, requests.HTTPError):
+                pboc_metrics.observe_error(url, e)
+            print(f"监视 {province} 失败: {e}")
+            return "error", [], None
+        # 页面结构异常 (如返回了错误页) 时不更新已知 URL
+        if not items:
+            print(f"监视 {province}: 第一页没有解析到条目")
+            return "error", [], None
+        return "ok", items, resp.headers
+
+    def _update(self, site, result, items, headers):
+        """
+        与已知 URL 比较并更新状态，返回新条目
+        """
+        province = site["province"]
+        if result == "error":
+            return []
+        st = self.state.setdefault(province, {})
+        st["etag"] = headers.get("ETag") or st.get("etag")
+        st["last_modified"] = headers.get("Last-Modified") or st.get("last_modified")
+        if result == "not_modified":
+            return []
+        known = st.get("urls")
+        urls = [it["url"] for it in items if it.get("url")]
+        if known is None:
+            st["urls"] = urls[:KNOWN_LIMIT]
+            return []
+        seen = set(known)
+        new = [it for it in items if it.get("url") and it["url"] not in seen]
+        if new:
+            # 新 URL 在前，保留最近的 KNOWN_LIMIT 个
+            st["urls"] = ([it["url"] for it in new] + known)[:KNOWN_LIMIT]
+        return new
+
+    def cycle(self):
+        """
+        执行一轮
+        :return: 命中关键字 (或未设置关键字时全部) 的新条目
+        """
+        started = time.perf_counter()
+        detected_at = datetime.datetime.now().isoformat(timespec="seconds")
+        new_items = []
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = {executor.submit(self.poll, site): site for site in self.sites}
+            for future in concurrent.futures.as_completed(futures):
+                site = futures[future]
+                result, items, headers = future.result()
+                new = self._update(site, result, items, headers)
+                pboc_metrics.WATCH_POLLS.labels(site["province"], "new" if new else result).inc()
+                self.stats["errors"] += result == "error"
+                new_items.extend(new)
+
+        matched = []
+        for it in new_items:
+            hits = matches(it, self.keywords)
+            pboc_metrics.WATCH_NEW_ITEMS.labels(it.get("province") or "", "matched" if hits else "other").inc()
+            if hits or not self.keywords:
+                record = it.to_dict() if hasattr(it, "to_dict") else dict(it)
+                record["attachments"] = list(record.get("attachments") or ())
+                record["keywords"] = hits
+                record["detected_at"] = detected_at
+                matched.append(record)
+        if new_items and self.on_new is not None:
+            try:
+                self.on_new(new_items)
+            except Exception as e:
+                print(f"处理新条目失败: {e}")
+        if matched:
+            self.deliver(matched)
+        self.save()
+
+        seconds = time.perf_counter() - started
+        self.stats.update(cycles=self.stats["cycles"] + 1, last_cycle=detected_at, last_seconds=round(seconds, 3),
+                          new=self.stats["new"] + len(new_items), matched=self.stats["matched"] + len(matched))
+        if new_items:
+            print(f"[{detected_at}] 新公告 {len(new_items)} 条，命中 {len(matched)} 条，用时 {seconds:.1f} 秒")
+        return matched
+
+    def deliver(self, items):
+        for sink in self.sinks:
+            try:
+                # 异步的推送 (WebhookSink) 返回 "queued"，发送结果由其线程另行计数
+                status = sink.deliver(items) or "success"
+                pboc_metrics.WATCH_DELIVERIES.labels(sink.name, status).inc()
+            except Exception as e:
+                pboc_metrics.WATCH_DELIVERIES.labels(sink.name, "error").inc()
+                print(f"推送到 {sink.name} 失败: {e}")
+
+    def run(self, once=False):
+        while not self._stop.is_set():
+            started = time.monotonic()
+            try:
+                self.cycle()
+            except Exception as e:
+                print(f"监视出错: {e}")
+            if once:
+                return
+            # 间隔从本轮开始计算，使两轮起点相隔 interval 秒
+            self._stop.wait(max(0.0, self.interval - (time.monotonic() - started)))
+
+    def stop(self):
+        self._stop.set()
+
+    def close(self, timeout=WEBHOOK_TIMEOUT * WEBHOOK_RETRIES):
+        """
+        等待异步推送发送完已入队的批次
+        """
+        for sink in self.sinks:
+            if hasattr(sink, "close"):
+                sink.close(timeout)
+
+
+# ---------------------------------------------------------------- SSE
+blueprint = Blueprint("pboc_watch", __name__, url_prefix="/watch")
+WATCHER = {"instance": None}
+
+
+@blueprint.route("/stream")
+def stream():
+    last_id = request.headers.get("Last-Event-ID") or request.args.get("last_id")
+    q = CHANNEL.subscribe(int(last_id) if last_id and last_id.isdigit() else None)
+
+    def event_stream():
+        try:
+            yield ": connected\n\n"
+            while True:
+                try:
+                    event_id, data = q.get(timeout=KEEPALIVE)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"id: {event_id}\nevent: penalty\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+        finally:
+            CHANNEL.unsubscribe(q)
+
+    return Response(stream_with_context(event_stream()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@blueprint.route("/status")
+def status():
+    watcher = WATCHER["instance"]
+    if watcher is None:
+        return {"running": False, "subscribers": CHANNEL.subscribers()}
+    return dict(watcher.stats, running=True, interval=watcher.interval, keywords=watcher.keywords,
+                subscribers=CHANNEL.subscribers())
+
+
+def lock_state(state_path=STATE_PATH):
+    """
+    对状态文件加进程间互斥锁 (不等待)
+    :return: 加锁成功返回锁文件对象 (进程退出前保持打开)；已有其他进程持有时返回 None
+    """
+    f = open(state_path + ".lock", "a")
+    if fcntl is None:
+        return f
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        f.close()
+        return None
+    return f
+
+
+def start_watch(keywords=(), sinks=None, **kwargs):
+    """
+    在后台线程中运行监视；sinks 默认只推送到 SSE
+    其他进程已在监视同一个状态文件时不启动，返回 None
+    """
+    state_path = kwargs.get("state_path", STATE_PATH)
+    lock = lock_state(state_path) if state_path else None
+    if state_path and lock is None:
+        print(f"进程 {os.getpid()}: 其他进程已在监视 ({state_path})，本进程不启动监视")
+        return None
+    watcher = PenaltyWatcher(keywords, [ChannelSink()] if sinks is None else sinks, **kwargs)
+    watcher.lock = lock
+    WATCHER["instance"] = watcher
+    threading.Thread(target=watcher.run, name="penalty-watch", daemon=True).start()
+    return watcher
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="监视各省份行政处罚列表第一页的新公告")
+    parser.add_argument("--webhook", help="推送新条目的 URL (POST JSON)")
+    parser.add_argument("--jsonl", help="追加新条目的 JSONL 文件")
+    parser.add_argument("--sse-port", type=int, help="在该端口提供 /watch/stream")
+    parser.add_argument("--interval", type=float, default=WATCH_INTERVAL, help="每轮间隔 (秒)")
+    parser.add_argument("--keywords", nargs="+", help="关键字 (默认 pboc_penalty.KEY_WORDS)")
+    parser.add_argument("--all", action="store_true", help="推送所有新条目，不按关键字过滤")
+    parser.add_argument("--provinces", nargs="+", help="只监视这些省份")
+    parser.add_argument("--state", default=STATE_PATH, help="状态文件")
+    parser.add_argument("--once", action="store_true", help="只执行一轮")
+    args = parser.parse_args(argv)
+
+    if args.all:
+        keywords = []
+    elif args.keywords:
+        keywords = args.keywords
+    else:
+        from pboc_penalty import KEY_WORDS
+        keywords = KEY_WORDS
+    sites = pboc_penalty_data.PROVINCE_SITES
+    if args.provinces:
+        sites = [s for s in sites if s["province"] in args.provinces]
+    sinks = []
+    if args.webhook:
+        sinks.append(WebhookSink(args.webhook))
+    if args.jsonl:
+        sinks.append(JsonlSink(args.jsonl))
+    if args.sse_port:
+        sinks.append(ChannelSink())
+    if not sinks:
+        parser.error("至少指定 --webhook、--jsonl、--sse-port 之一")
+
+    lock = lock_state(args.state)
+    if lock is None:
+        parser.error(f"其他进程已在监视 {args.state}")
+    pboc_metrics.dump_on_exit()
+    watcher = PenaltyWatcher(keywords, sinks, sites, args.state, args.interval)
+    watcher.lock = lock
+    WATCHER["instance"] = watcher
+    print(f"监视 {len(sites)} 个省份，每 {args.interval:.0f} 秒一轮，关键字: {', '.join(keywords) or '全部'}")
+    if args.sse_port and not args.once:
+        threading.Thread(target=watcher.run, name="penalty-watch", daemon=True).start()
+        app = Flask(__name__)
+        app.register_blueprint(blueprint)
+        app.run(host="0.0.0.0", port=args.sse_port, threaded=True)
+    else:
+        try:
+            watcher.run(args.once)
+        except KeyboardInterrupt:
+            watcher.save()
+        finally:
+            watcher.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,206 @@
+"""
+运行中的 Flask 服务的按需性能分析端点 (pboc_penalty.py、app.py)
+
+- /debug/profile?seconds=N  对进程内所有线程 (包括后台抓取线程) 做 N 秒采样 CPU 分析
+    format=folded (默认) 下载 folded stacks 文件，可直接交给 flamegraph.pl 或 https://speedscope.app
+    format=top           文本摘要: 各线程采样数、按自身 / 累计采样排序的函数
+    interval=毫秒 (默认 SAMPLE_INTERVAL)，idle=1 保留空闲等待中的线程栈
+- /debug/memory             tracemalloc 内存分析
+    第一次调用开始追踪 (会让内存分配变慢，用完请 stop=1)；之后每次调用给出占用最多的代码行，
+    以及与上一次调用之间的增长 (diff)
+    format=folded 按完整调用栈下载 (权重为字节数)，top=N 控制行数，stop=1 停止追踪
+
+两个端点只在设置了环境变量 PBOC_DEBUG_TOKEN 时启用，请求需带 ?token= 或请求头 X-Debug-Token；
+未设置时返回 404。不按来源地址放行: 经本机反向代理转发的外部请求看起来也来自 127.0.0.1。
+
+用法:
+    app.register_blueprint(pboc_profiler.blueprint)
+    PBOC_DEBUG_TOKEN=... python pboc_penalty.py
+    curl -H 'X-Debug-Token: ...' -o cpu.folded 'http://127.0.0.1:5001/debug/profile?seconds=30'
+    flamegraph.pl cpu.folded > cpu.svg
+"""
+import collections
+import datetime
+import hmac
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+from flask import Blueprint, Response, request
+
+TOKEN_ENV = "PBOC_DEBUG_TOKEN"
+MAX_SECONDS = 120
+DEFAULT_SECONDS = 10
+# 采样间隔 (秒)，100 Hz
+SAMPLE_INTERVAL = 0.01
+TOP_N = 25
+# tracemalloc 为每次分配保存的栈深度
+MEMORY_FRAMES = 25
+# 栈顶是这些函数时线程在等待 (锁、select、空闲的线程池)，默认不计入
+IDLE_FRAMES = {
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("selectors.py", "select"),
+    ("socketserver.py", "serve_forever"),
+    ("thread.py", "_worker"),
+    ("socket.py", "accept"),
+}
+
+blueprint = Blueprint("pboc_debug", __name__, url_prefix="/debug")
+
+_profile_lock = threading.Lock()
+_memory = {"snapshot": None}
+
+
+@blueprint.before_request
+def _guard():
+    token = os.getenv(TOKEN_ENV)
+    if not token:
+        return Response("not found\n", status=404, mimetype="text/plain")
+    given = request.args.get("token") or request.headers.get("X-Debug-Token") or ""
+    if not hmac.compare_digest(given.encode(), token.encode()):
+        return Response("forbidden\n", status=403, mimetype="text/plain")
+
+
+def _download(body, kind):
+    stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+    return Response(body, mimetype="text/plain",
+                    headers={"Content-Disposition": f"attachment; filename={kind}-{stamp}.folded"})
+
+
+# ---------------------------------------------------------------- CPU
+def _frame_label(code):
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+def sample_stacks(seconds, interval=SAMPLE_INTERVAL, idle=False):
+    """
+    每隔 interval 秒抓取一次所有线程的调用栈 (调用线程本身除外)
+    :return: Counter {(线程名, 帧标签, ...): 采样次数}，帧从最外层到最内层
+    """
+    me = threading.get_ident()
+    stacks = collections.Counter()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            code = frame.f_code
+            if not idle and (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES:
+                continue
+            labels = []
+            while frame is not None:
+                labels.append(_frame_label(frame.f_code))
+                frame = frame.f_back
+            labels.append(names.get(ident, f"thread-{ident}"))
+            stacks[tuple(reversed(labels))] += 1
+        time.sleep(interval)
+    return stacks
+
+
+def folded(stacks):
+    """
+    folded stacks 格式: 每行 "帧;帧;帧 权重"
+    """
+    return "".join(f"{';'.join(stack)} {count}\n" for stack, count in stacks.most_common())
+
+
+def summarize(stacks, top=TOP_N):
+    total = sum(stacks.values())
+    if not total:
+        return "没有采样到非空闲的线程\n"
+    threads = collections.Counter()
+    own = collections.Counter()
+    inclusive = collections.Counter()
+    for stack, count in stacks.items():
+        threads[stack[0]] += count
+        own[stack[-1]] += count
+        # 递归函数在同一个栈里只算一次
+        for label in set(stack[1:]):
+            inclusive[label] += count
+    lines = [f"采样 {total} 次"]
+    lines.append("线程:")
+    lines.extend(f"  {count / total:6.1%}  {name}" for name, count in threads.most_common())
+    lines.append("自身采样最多的函数:")
+    lines.extend(f"  {count / total:6.1%}  {label}" for label, count in own.most_common(top))
+    lines.append("累计采样最多的函数:")
+    lines.extend(f"  {count / total:6.1%}  {label}" for label, count in inclusive.most_common(top))
+    return "\n".join(lines) + "\n"
+
+
+def _number_arg(name, default, lo, hi, cast=float):
+    try:
+        value = cast(request.args.get(name, default))
+    except (TypeError, ValueError):
+        value = default
+    return max(lo, min(hi, value))
+
+
+@blueprint.route("/profile")
+def profile():
+    seconds = _number_arg("seconds", DEFAULT_SECONDS, 0.1, MAX_SECONDS)
+    interval = _number_arg("interval", SAMPLE_INTERVAL * 1000, 1, 1000) / 1000
+    idle = request.args.get("idle") == "1"
+    # 同时只跑一个采样，避免叠加的采样线程互相出现在对方的结果里
+    if not _profile_lock.acquire(blocking=False):
+        return Response("另一个 profile 正在进行\n", status=409, mimetype="text/plain")
+    try:
+        stacks = sample_stacks(seconds, interval, idle)
+    finally:
+        _profile_lock.release()
+    if request.args.get("format") == "top":
+        return Response(summarize(stacks), mimetype="text/plain")
+    return _download(folded(stacks), "cpu")
+
+
+# ---------------------------------------------------------------- 内存
+def _take_snapshot():
+    return tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+        tracemalloc.Filter(False, "<unknown>"),
+    ))
+
+
+def memory_folded(snapshot):
+    lines = []
+    for stat in snapshot.statistics("traceback"):
+        # traceback 中的帧从最外层到最内层
+        frames = ";".join(f"{os.path.basename(f.filename)}:{f.lineno}" for f in stat.traceback)
+        lines.append(f"{frames} {stat.size}\n")
+    return "".join(lines)
+
+
+def memory_report(snapshot, previous, top=TOP_N):
+    current, peak = tracemalloc.get_traced_memory()
+    lines = [f"tracemalloc: 当前 {current / 2**20:.1f} MB，峰值 {peak / 2**20:.1f} MB",
+             f"占用最多的代码行 (前 {top}):"]
+    lines.extend(f"  {stat}" for stat in snapshot.statistics("lineno")[:top])
+    if previous is not None:
+        lines.append(f"与上一次快照相比增长最多的代码行 (前 {top}):")
+        diff = [d for d in snapshot.compare_to(previous, "lineno") if d.size_diff][:top]
+        lines.extend(f"  {stat}" for stat in diff)
+    return "\n".join(lines) + "\n"
+
+
+@blueprint.route("/memory")
+def memory():
+    if request.args.get("stop") == "1":
+        tracemalloc.stop()
+        _memory["snapshot"] = None
+        return Response("tracemalloc 已停止\n", mimetype="text/plain")
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(MEMORY_FRAMES)
+        _memory["snapshot"] = _take_snapshot()
+        return Response(f"tracemalloc 已开始 (栈深度 {MEMORY_FRAMES})，再次请求查看占用和增长\n",
+                        mimetype="text/plain")
+    snapshot = _take_snapshot()
+    previous, _memory["snapshot"] = _memory["snapshot"], snapshot
+    if request.args.get("format") == "folded":
+        return _download(memory_folded(snapshot), "memory")
+    top = int(_number_arg("top", TOP_N, 1, 500))
+    return Response(memory_report(snapshot, previous, top), mimetype="text/plain")
@@ -0,0 +1,113 @@
+"""
+紧凑的记录类型
+
+爬虫结果原本是每条一个 dict，相同的键名在每条记录里重复保存，
+省份 / 分行等字符串也在成千上万条记录间重复。这里改用 __slots__ 类保存，
+重复度高的字段做 sys.intern，同时保持 dict 的读写方式 (item["title"]、
+item.get(...)、dict(item))，模板、数据库写入和导出代码无需改动。
+"""
+import sys
+from collections.abc import Mapping
+
+
+class SlotRecord(Mapping):
+    """
+    基类: 子类通过 _fields 声明 (键名, 属性名) 列表，__slots__ 取属性名
+    _interned 中的键在赋值时做 sys.intern
+    """
+
+    __slots__ = ()
+    _fields = ()
+    _interned = frozenset()
+    _default = ""
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._attrs = dict(cls._fields)
+
+    def __init__(self, data=None, **kwargs):
+        if data:
+            kwargs = {**data, **kwargs}
+        for key, attr in self._fields:
+            self._set(key, attr, kwargs.get(key, self._default))
+
+    def _set(self, key, attr, value):
+        if key in self._interned and isinstance(value, str):
+            value = sys.intern(value)
+        object.__setattr__(self, attr, value)
+
+    def __getitem__(self, key):
+        attr = self._attrs.get(key)
+        if attr is None:
+            raise KeyError(key)
+        return getattr(self, attr)
+
+    def __setitem__(self, key, value):
+        attr = self._attrs.get(key)
+        if attr is None:
+            raise KeyError(key)
+        self._set(key, attr, value)
+
+    def __iter__(self):
+        return iter(self._attrs)
+
+    def __len__(self):
+        return len(self._fields)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+    def __getstate__(self):
+        return self.to_dict()
+
+    def __setstate__(self, state):
+        self.__init__(state)
+
+    def to_dict(self):
+        return {key: getattr(self, attr) for key, attr in self._fields}
+
+
+class PenaltyRecord(SlotRecord):
+    """
+    行政处罚记录 (pboc_penalty.CACHE / pboc_penalty_data.run_spider)
+    """
+
+    _fields = (
+        ("province", "province"),
+        ("branch", "branch"),
+        ("title", "title"),
+        ("url", "url"),
+        ("date", "date"),
+        ("attachments", "attachments"),
+    )
+    __slots__ = tuple(attr for _, attr in _fields)
+    _interned = frozenset({"province", "branch", "date"})
+
+    def __init__(self, data=None, **kwargs):
+        super().__init__(data, **kwargs)
+        # 大部分记录没有附件，共用同一个空元组
+        if not self.attachments:
+            self.attachments = ()
+
+
+class InstRecord(SlotRecord):
+    """
+    支付机构许可信息 (pboc_approval_mysql / pboc_approval_excel 的 scrape_page)
+    """
+
+    _fields = (
+        ("许可证号", "license_no"),
+        ("公司名称", "company"),
+        ("生成日期", "created"),
+        ("法定代表人（负责人）", "legal_rep"),
+        ("住所（营业场所）", "address"),
+        ("业务类型", "business_type"),
+        ("业务覆盖范围", "coverage"),
+        ("换证日期", "renewed"),
+        ("首次许可日期", "first_licensed"),
+        ("发证日期", "issued"),
+        ("有效期至", "valid_until"),
+        ("备注", "remark"),
+    )
+    __slots__ = tuple(attr for _, attr in _fields)
+    _interned = frozenset({"生成日期", "业务类型", "业务覆盖范围", "换证日期", "首次许可日期", "发证日期", "有效期至"})
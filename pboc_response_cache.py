@@ -0,0 +1,116 @@
+"""
+Flask 页面 / JSON 接口的响应缓存
+
+按 (路由, 查询参数) 缓存渲染结果，LRU 淘汰；支持 ETag / 304 和 gzip 压缩。
+数据更新时调用 bump() 递增代数 (generation)，旧代数的缓存全部失效。
+"""
+import gzip
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import request, make_response
+
+# 小于该长度的响应不压缩
+GZIP_MIN_SIZE = 1024
+
+
+class ResponseCache:
+    """
+    :param max_entries: 最多缓存的响应数
+    :param max_age: 缓存最长有效秒数，None 表示只靠 bump() 失效
+                    (数据由其他进程写入数据库时，用它兜底)
+    :param vary: 可选的无参函数，返回值并入缓存键 (如渲染结果依赖当天日期时传入 datetime.date.today)
+    """
+
+    def __init__(self, max_entries=128, max_age=None, vary=None):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.vary = vary
+        self.generation = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def bump(self):
+        """
+        数据已更新: 代数加一并清空缓存
+        """
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry["generation"] != self.generation or (
+                self.max_age is not None and time.time() - entry["created"] > self.max_age
+            ):
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def _put(self, key, entry):
+        with self._lock:
+            # 渲染期间数据已更新，则不缓存这份旧结果
+            if entry["generation"] != self.generation:
+                return
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _build_entry(self, resp, generation):
+        body = resp.get_data()
+        entry = {
+            "generation": generation,
+            "created": time.time(),
+            "status": resp.status_code,
+            "mimetype": resp.mimetype,
+            "body": body,
+            "gzip": None,
+            "etag": hashlib.sha1(body).hexdigest(),
+        }
+        if len(body) >= GZIP_MIN_SIZE:
+            entry["gzip"] = gzip.compress(body, compresslevel=6)
+        return entry
+
+    def _respond(self, entry):
+        if request.if_none_match.contains(entry["etag"]):
+            resp = make_response("", 304)
+            resp.set_etag(entry["etag"])
+            return resp
+        use_gzip = entry["gzip"] is not None and "gzip" in request.accept_encodings
+        resp = make_response(entry["gzip"] if use_gzip else entry["body"], entry["status"])
+        resp.mimetype = entry["mimetype"]
+        resp.set_etag(entry["etag"])
+        resp.vary.add("Accept-Encoding")
+        if use_gzip:
+            resp.headers["Content-Encoding"] = "gzip"
+        return resp
+
+    def cached(self, view):
+        """
+        视图装饰器；流式响应和非 200 响应不缓存
+        """
+
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            key = (request.path, tuple(sorted(request.args.items(multi=True))))
+            if self.vary is not None:
+                key += (self.vary(),)
+            entry = self._get(key)
+            if entry is None:
+                generation = self.generation
+                resp = make_response(view(*args, **kwargs))
+                if resp.is_streamed or resp.status_code != 200:
+                    return resp
+                entry = self._build_entry(resp, generation)
+                self._put(key, entry)
+            return self._respond(entry)
+
+        return wrapper
@@ -0,0 +1,470 @@
+"""
+按数据源更新频率自适应的常驻抓取调度器
+
+每个数据源 (各省份处罚列表首页、许可证列表、重大事项变更公示、新闻站点) 定期做一次首页探测:
+带 If-None-Match / If-Modified-Since 的条件请求，304 或解析出的条目指纹不变即视为未更新；
+指纹变化时触发对应的抓取 (同一组的多个源只抓一次，例如已获 / 已注销许可共用 run_task)。
+
+探测间隔按观测到的更新频率调整:
+    rate = (更新次数 + PRIOR_CHANGES) / (观测天数 + PRIOR_DAYS)       每天的更新次数，先验为每周一次
+    interval = 1 / (PROBES_PER_CHANGE * rate)，限制在 [MIN_INTERVAL, MAX_INTERVAL]
+每周更新的省份大约每 1.75 天探测一次，常年不更新的逐渐退到每周一次。
+全局请求预算 (--budget，每天的请求数) 同时约束探测和抓取: 预计总量超出预算时按比例拉长所有探测间隔，
+执行时再用令牌桶兜底 (容量为一小时的预算；抓取按该组历次实际请求数扣减)。
+抓取量可能远大于桶容量 (approval 约 1000 个请求)，因此桶里有半桶以上令牌即可开始抓取，不足部分记为欠账；
+欠账最多 MAX_DEBT 个桶容量，超出部分不再追溯 (长期平均已由探测间隔中的抓取预估约束)，
+所以一次大抓取之后探测最多暂停约 (1 + MAX_DEBT) 小时，而不是按实际请求数停上半天。
+
+状态 (指纹、ETag、更新次数等) 保存在 STATE_PATH，重启后继续按已学到的频率调度。
+
+用法:
+    python pboc_scheduler.py run [--budget 2000] [--sources penalty approval] [--dry-run] [--once]
+    python pboc_scheduler.py status
+"""
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import sys
+import time
+
+import requests
+from bs4 import BeautifulSoup
+
+import pboc_fetch_cache
+import pboc_metrics
+
+basedir = os.path.dirname(os.path.abspath(__file__))
+STATE_PATH = os.path.join(basedir, "scheduler_state.json")
+# 每天的请求预算 (探测 + 抓取)
+REQUEST_BUDGET = 2000
+MIN_INTERVAL = 10 * 60
+MAX_INTERVAL = 7 * 86400
+PROBES_PER_CHANGE = 4
+PRIOR_CHANGES = 1
+PRIOR_DAYS = 7
+# 探测至少占预算的比例 (抓取量很大时也保证能发现更新)
+MIN_PROBE_SHARE = 0.2
+# 省份有更新时重新抓取的列表页数
+REFRESH_PAGES = 2
+# 抓取失败后的重试间隔
+REFRESH_RETRY = 10 * 60
+# 探测失败后的首次重试间隔，连续失败时翻倍 (不超过正常间隔)
+PROBE_RETRY = 5 * 60
+# 令牌桶最多欠多少个桶容量 (见模块说明)
+MAX_DEBT = 1
+# 主循环的最长休眠
+TICK = 30
+PROBE_TIMEOUT = 15
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) "
+                  "Chrome/120.0 Safari/537.36",
+}
+APPROVAL_REGISTERED_URL = ("https://www.pbc.gov.cn/zhengwugongkai/4081330/4081344/4081407/4081702/4081749/"
+                           "4081783/9398ddc0-1.html")
+APPROVAL_UNREGISTERED_URL = ("https://www.pbc.gov.cn/zhengwugongkai/4081330/4081344/4081407/4081702/4081749/"
+                             "4081786/63ead9a6-1.html")
+IMPORTANT_DIRECTORY_URL = ("https://www.pbc.gov.cn/zhengwugongkai/4081330/4081344/4081407/4081702/4081749/"
+                           "4693227/index.html")
+IMPORTANT_KEYWORD = "非银行支付机构重大事项变更许可信息公示"
+SINA_URL = "https://finance.sina.com.cn/roll/c/249630.shtml"
+MPAYPASS_URL = "https://www.mpaypass.com.cn/news/?id=2&page=1"
+
+
+class Source:
+    """
+    :param name: 唯一名称，如 "penalty:上海市"
+    :param group: 抓取分组，同组的源共用一次 refresh
+    :param url: 探测的页面；可以是无参函数 (每次探测前求值)
+    :param keys: html -> 条目键列表 (用于指纹)；页面结构不对时返回 None
+    :param refresh: 无参函数，执行对应的抓取
+    :param cost: 抓取的预计请求数 (尚无实测值时使用)
+    """
+
+    def __init__(self, name, group, url, keys, refresh, cost):
+        self.name = name
+        self.group = group
+        self.url = url
+        self.keys = keys
+        self.refresh = refresh
+        self.cost = cost
+
+    def probe_url(self):
+        return self.url() if callable(self.url) else self.url
+
+
+# ---------------------------------------------------------------- 数据源
+def _hrefs(container):
+    if container is None:
+        return None
+    return [a.get("href") for a in container.find_all("a") if a.get("href")]
+
+
+def _penalty_keys(url, province):
+    def keys(html):
+        import pboc_penalty_data
+        items = pboc_penalty_data.parse_page_html(html, url, province)
+        return [it["url"] for it in items] or None
+    return keys
+
+
+def _approval_keys(html):
+    return _hrefs(BeautifulSoup(html, "html.parser").find("ul", class_="txtlist"))
+
+
+def _important_keys(html):
+    import pboc_approval_mysql
+    rows = pboc_approval_mysql.parse_important_news(html)
+    return ["\t".join(row) for row in rows] or None
+
+
+def _sina_keys(html):
+    return _hrefs(BeautifulSoup(html, "html.parser").find("ul", id="listcontent"))
+
+
+def _mpaypass_keys(html):
+    items = BeautifulSoup(html, "html.parser").find_all(class_="newslist")
+    return [href for item in items for href in _hrefs(item)] or None
+
+
+def _refresh_province(province):
+    def refresh():
+        import pboc_penalty_data
+        pboc_penalty_data.run_spider([province], max_pages=REFRESH_PAGES)
+    return refresh
+
+
+def _refresh_approval():
+    import pboc_approval_mysql
+    pboc_approval_mysql.run_task()
+
+
+_important_target = {}
+
+
+def _important_url():
+    # 公示页地址从目录页中查找，找到后缓存；探测失败时清空重新查找
+    if "url" not in _important_target:
+        import pboc_approval_mysql
+        _important_target["url"] = pboc_approval_mysql.find_target_url(IMPORTANT_DIRECTORY_URL, IMPORTANT_KEYWORD)
+    if not _important_target["url"]:
+        _important_target.clear()
+        raise IOError("未找到重大事项变更公示页")
+    return _important_target["url"]
+
+
+def _refresh_important_news():
+    import pboc_approval_mysql
+    import pboc_initial_database as db
+    data = pboc_approval_mysql.scrape_important_news(IMPORTANT_DIRECTORY_URL, IMPORTANT_KEYWORD)
+    conn = db.get_connection("fic")
+    try:
+        pboc_approval_mysql.insert_important_news_to_mysql(conn, data)
+    finally:
+        conn.close()
+
+
+def _refresh_sina():
+    import news_sina
+    news_sina.scrape_sina_finance(1, 1)
+
+
+def _refresh_mpaypass():
+    import news_mpaypass
+    news_mpaypass.scrape_mpaypass(1, 1)
+
+
+def build_sources():
+    import pboc_penalty_data
+    sources = [Source(f"penalty:{s['province']}", f"penalty:{s['province']}", s["base_url"],
+                      _penalty_keys(s["base_url"], s["province"]), _refresh_province(s["province"]),
+                      REFRESH_PAGES + 1)
+               for s in pboc_penalty_data.PROVINCE_SITES]
+    sources += [
+        Source("approval:registered", "approval", APPROVAL_REGISTERED_URL, _approval_keys, _refresh_approval, 1000),
+        Source("approval:unregistered", "approval", APPROVAL_UNREGISTERED_URL, _approval_keys, _refresh_approval, 1000),
+        Source("important_news", "important_news", _important_url, _important_keys, _refresh_important_news, 2),
+        Source("news:sina", "news:sina", SINA_URL, _sina_keys, _refresh_sina, 1),
+        Source("news:mpaypass", "news:mpaypass", MPAYPASS_URL, _mpaypass_keys, _refresh_mpaypass, 1),
+    ]
+    return sources
+
+
+def fingerprint(keys):
+    return hashlib.sha1("\n".join(keys).encode("utf-8")).hexdigest()
+
+
+def requests_so_far():
+    """
+    本进程累计发出的请求数 (来自 pboc_metrics，用于实测一次抓取的请求量)
+    """
+    total = 0.0
+    for metric in (pboc_metrics.HTTP_REQUESTS, pboc_metrics.HTTP_ERRORS):
+        total += sum(child.value for _, child in metric.collect())
+    return total
+
+
+# ---------------------------------------------------------------- 调度
+class Scheduler:
+    def __init__(self, sources, budget=REQUEST_BUDGET, state_path=STATE_PATH, dry_run=False, session=None):
+        self.sources = {s.name: s for s in sources}
+        self.budget = budget
+        self.state_path = state_path
+        self.dry_run = dry_run
+        self.session = session or pboc_metrics.instrument_session(requests.Session())
+        self.state = {"sources": {}, "groups": {}}
+        if state_path and os.path.exists(state_path):
+            try:
+                with open(state_path, encoding="utf-8") as f:
+                    self.state = json.load(f)
+            except Exception as e:
+                print(f"调度状态读取失败，将重新学习: {state_path}: {e}")
+        self.capacity = max(budget / 24, 1.0)
+        self.tokens = self.capacity
+        self._refilled = time.monotonic()
+
+    def log(self, message):
+        print(f"[{datetime.datetime.now():%Y-%m-%d %H:%M:%S}] {message}")
+
+    def save(self):
+        if not self.state_path:
+            return
+        tmp = self.state_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, ensure_ascii=False, indent=1)
+        os.replace(tmp, self.state_path)
+
+    def source_state(self, name):
+        return self.state["sources"].setdefault(name, {"probes": 0, "changes": 0, "errors": 0, "stale": False})
+
+    def group_state(self, group):
+        return self.state["groups"].setdefault(group, {"refreshes": 0, "failures": 0, "cost": None, "retry_at": 0})
+
+    def group_cost(self, group):
+        cost = self.group_state(group)["cost"]
+        if cost is not None:
+            return cost
+        return max(s.cost for s in self.sources.values() if s.group == group)
+
+    # ------------------------------------------------------------ 频率与间隔
+    def rate(self, name):
+        """
+        估计的每天更新次数
+        """
+        st = self.source_state(name)
+        observed = max(0.0, (st.get("last_probe", 0) - st.get("first_probe", 0)) / 86400) if st.get("first_probe") else 0.0
+        return (st["changes"] + PRIOR_CHANGES) / (observed + PRIOR_DAYS)
+
+    def intervals(self):
+        """
+        各源的探测间隔 (秒)，已按预算拉长
+        """
+        desired = {name: min(MAX_INTERVAL, max(MIN_INTERVAL, 86400 / (PROBES_PER_CHANGE * self.rate(name))))
+                   for name in self.sources}
+        probe_demand = sum(86400 / v for v in desired.values())
+        groups = {s.group: max(self.rate(n) for n, s2 in self.sources.items() if s2.group == s.group)
+                  for n, s in self.sources.items()}
+        refresh_demand = sum(rate * self.group_cost(group) for group, rate in groups.items())
+        probe_budget = max(self.budget - refresh_demand, self.budget * MIN_PROBE_SHARE)
+        factor = max(1.0, probe_demand / probe_budget)
+        result = {}
+        for name, v in desired.items():
+            interval = min(MAX_INTERVAL, v * factor)
+            failing = self.source_state(name).get("failing", 0)
+            if failing:
+                interval = min(interval, PROBE_RETRY * 2 ** (failing - 1))
+            result[name] = interval
+        return result
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._refilled) * self.budget / 86400)
+        self._refilled = now
+
+    # ------------------------------------------------------------ 探测与抓取
+    def probe(self, source):
+        """
+        :return: "changed" / "unchanged" / "not_modified" / "first" / "error"
+        """
+        st = self.source_state(source.name)
+        now = time.time()
+        st.setdefault("first_probe", now)
+        st["last_probe"] = now
+        st["probes"] += 1
+        headers = dict(HEADERS)
+        if st.get("etag"):
+            headers["If-None-Match"] = st["etag"]
+        if st.get("last_modified"):
+            headers["If-Modified-Since"] = st["last_modified"]
+        try:
+            url = source.probe_url()
+            resp = self.session.get(url, headers=headers, timeout=PROBE_TIMEOUT)
+            if resp.status_code == 304:
+                result = "not_modified"
+            else:
+                resp.raise_for_status()
+                resp.encoding = resp.apparent_encoding or "utf-8"
+                keys = source.keys(resp.text)
+                if keys is None:
+                    raise ValueError("页面中没有找到条目列表")
+                st["etag"] = resp.headers.get("ETag")
+                st["last_modified"] = resp.headers.get("Last-Modified")
+                fp = fingerprint(keys)
+                if st.get("fingerprint") is None:
+                    result = "first"
+                elif fp != st["fingerprint"]:
+                    result = "changed"
+                    st["changes"] += 1
+                    st["last_change"] = now
+                    st["stale"] = True
+                else:
+                    result = "unchanged"
+                st["fingerprint"] = fp
+            st["failing"] = 0
+        except Exception as e:
+            if source.name == "important_news":
+                _important_target.clear()
+            st["errors"] += 1
+            st["failing"] = st.get("failing", 0) + 1
+            st["last_error"] = str(e)[:500]
+            result = "error"
+        pboc_metrics.SCHEDULER_PROBES.labels(source.name, result).inc()
+        return result
+
+    def refresh(self, group):
+        """
+        抓取一个组
+        :return: 本次实际发出的请求数 (失败时同样按实际计)；成功但没有计到请求
+                 (未接入 pboc_metrics 的抓取) 时返回 None，由调用方按预估值扣除
+        """
+        gs = self.group_state(group)
+        before = requests_so_far()
+        started = time.time()
+        try:
+            next(s for s in self.sources.values() if s.group == group).refresh()
+        except Exception as e:
+            gs["failures"] += 1
+            gs["retry_at"] = time.time() + REFRESH_RETRY
+            gs["last_error"] = str(e)[:500]
+            pboc_metrics.SCHEDULER_REFRESHES.labels(group, "error").inc()
+            self.log(f"抓取 {group} 失败: {e}")
+            return requests_so_far() - before
+        used = requests_so_far() - before
+        gs["refreshes"] += 1
+        gs["last_refresh"] = started
+        # 没有接入 pboc_metrics 的抓取 (新闻站点) 保持预估值
+        if used:
+            gs["cost"] = used if gs["cost"] is None else 0.7 * gs["cost"] + 0.3 * used
+        for name, source in self.sources.items():
+            if source.group == group:
+                self.source_state(name)["stale"] = False
+        pboc_metrics.SCHEDULER_REFRESHES.labels(group, "success").inc()
+        self.log(f"抓取 {group} 完成，用时 {time.time() - started:.1f} 秒，{used:.0f} 个请求")
+        return used or None
+
+    # 探测和由它触发的抓取在同一个 scope 中，重复的请求 (如重大事项公示的目录页) 只发一次
+    @pboc_fetch_cache.scope("pboc_scheduler", verbose=False)
+    def step(self):
+        """
+        执行一轮: 先探测到期的源，再抓取有更新的组 (包括之前因预算或失败推迟的)
+        :return: 距下一个源到期的秒数
+        """
+        self._refill()
+        now = time.time()
+        intervals = self.intervals()
+        due = []
+        for name in self.sources:
+            st = self.source_state(name)
+            last = st.get("last_probe")
+            overdue = 1.0 if last is None else (now - last) / intervals[name]
+            if overdue >= 1:
+                due.append((overdue, name))
+        for _, name in sorted(due, reverse=True):
+            if self.tokens < 1:
+                break
+            self.tokens -= 1
+            result = self.probe(self.sources[name])
+            if result in ("changed", "error"):
+                st = self.source_state(name)
+                detail = f": {st['last_error']}" if result == "error" else ""
+                self.log(f"{name} {result}{detail}")
+
+        stale_groups = []
+        for name, source in self.sources.items():
+            if self.source_state(name)["stale"] and source.group not in stale_groups:
+                stale_groups.append(source.group)
+        for group in stale_groups:
+            cost = self.group_cost(group)
+            # 同一轮的探测已用掉一些令牌，不能要求桶是满的
+            if self.group_state(group)["retry_at"] > now or self.tokens < min(cost, self.capacity / 2):
+                continue
+            if self.dry_run:
+                self.log(f"[dry-run] 将抓取 {group} (约 {cost:.0f} 个请求)")
+                for name, source in self.sources.items():
+                    if source.group == group:
+                        self.source_state(name)["stale"] = False
+                continue
+            used = self.refresh(group)
+            self.tokens = max(self.tokens - (cost if used is None else used), -MAX_DEBT * self.capacity)
+        self.save()
+
+        intervals = self.intervals()
+        next_due = min(self.source_state(n).get("last_probe", now) + intervals[n] - now for n in self.sources)
+        return max(0.0, next_due)
+
+    def run(self, once=False):
+        self.log(f"调度 {len(self.sources)} 个数据源，每天预算 {self.budget} 个请求")
+        try:
+            while True:
+                wait = self.step()
+                if once:
+                    return
+                time.sleep(min(TICK, max(wait, 1.0)))
+        except KeyboardInterrupt:
+            self.save()
+
+    def report(self):
+        intervals = self.intervals()
+        rows = []
+        for name in self.sources:
+            st = self.source_state(name)
+            fmt = lambda t: datetime.datetime.fromtimestamp(t).strftime("%m-%d %H:%M") if t else "-"
+            next_due = st["last_probe"] + intervals[name] if st.get("last_probe") else None
+            rows.append(f"{name:<24}{intervals[name] / 3600:>8.1f} h{self.rate(name):>8.2f}/天"
+                        f"{st['probes']:>6}{st['changes']:>6}{st['errors']:>6}  {fmt(st.get('last_change')):<12}"
+                        f"{fmt(next_due):<12}{'待抓取' if st['stale'] else ''}")
+        demand = sum(86400 / v for v in intervals.values())
+        header = (f"{'数据源':<22}{'探测间隔':>8}{'更新频率':>9}{'探测':>5}{'更新':>5}{'失败':>5}  "
+                  f"{'上次更新':<10}{'下次探测':<10}")
+        return "\n".join([header, *rows, f"预计每天探测 {demand:.0f} 次 (预算 {self.budget})"])
+
+
+def main(argv=None):
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--state", default=STATE_PATH, help="状态文件")
+    common.add_argument("--budget", type=int, default=REQUEST_BUDGET, help="每天的请求预算")
+    common.add_argument("--sources", nargs="+", help="只调度名称以这些前缀开头的源 (penalty approval important_news news)")
+    parser = argparse.ArgumentParser(description="按更新频率自适应的抓取调度器")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_run = sub.add_parser("run", parents=[common], help="常驻运行")
+    p_run.add_argument("--once", action="store_true", help="只执行一轮 (适合 cron)")
+    p_run.add_argument("--dry-run", action="store_true", help="只探测，不执行抓取")
+    sub.add_parser("status", parents=[common], help="查看各数据源的频率和下次探测时间")
+    args = parser.parse_args(argv)
+
+    sources = build_sources()
+    if args.sources:
+        sources = [s for s in sources if s.name.startswith(tuple(args.sources))]
+    scheduler = Scheduler(sources, args.budget, args.state, getattr(args, "dry_run", False))
+    if args.command == "run":
+        pboc_metrics.dump_on_exit()
+        scheduler.run(args.once)
+    else:
+        print(scheduler.report())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
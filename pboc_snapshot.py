@@ -0,0 +1,228 @@
+"""
+把 MySQL 中的许可信息和行政处罚数据导出为分区 Parquet 快照，并用 DuckDB 在本地查询
+
+每次抓取结束后 (pboc_approval_mysql.run_task / pboc_penalty_data.run_spider) 自动导出:
+    snapshots/<表名>/crawl_date=YYYY-MM-DD/[省份=上海市/]part-*.parquet
+同一天重复导出会整体替换当天的分区 (先写到 <表名>/.staging/ 下再改名，查询不会读到写了一半的数据)。
+分析查询直接读列式文件，不再在线上 MySQL 上做全表扫描。
+
+查询时每张表有两个视图: <表名> 为最新一次快照，<表名>_history 为全部快照 (带 crawl_date 列)。
+
+用法:
+    python pboc_snapshot.py export [--tables pboc_penalty ...]
+    python pboc_snapshot.py query "SELECT 省份, count(*) FROM pboc_penalty GROUP BY 1 ORDER BY 2 DESC"
+    python pboc_snapshot.py tables
+"""
+import argparse
+import datetime
+import os
+import shutil
+import sys
+import time
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import pboc_initial_database as db
+
+basedir = os.path.dirname(os.path.abspath(__file__))
+SNAPSHOT_ROOT = os.path.join(basedir, "snapshots")
+# 抓取任务结束后是否自动导出快照
+SNAPSHOT_AFTER_RUN = True
+FETCH_SIZE = 5000
+PARTITION_DATE = "crawl_date"
+# 查询时只读取名为 crawl_date=YYYY-MM-DD 的分区目录
+PARTITION_GLOB = f"{PARTITION_DATE}=[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]"
+STAGING_DIR = ".staging"
+
+# 表名 -> 除抓取日期外的分区列
+TABLES = {
+    "pbc_inst_registered": [],
+    "pbc_inst_unregistered": [],
+    "pbc_important_news": [],
+    "pboc_penalty": ["省份"],
+}
+
+
+def _arrow_type(type_code, scale):
+    t = db.pymysql.constants.FIELD_TYPE
+    if type_code in (t.TINY, t.SHORT, t.LONG, t.INT24, t.LONGLONG, t.YEAR):
+        return pa.int64()
+    if type_code in (t.FLOAT, t.DOUBLE):
+        return pa.float64()
+    if type_code in (t.DECIMAL, t.NEWDECIMAL):
+        return pa.decimal128(38, scale or 0)
+    if type_code in (t.DATE, t.NEWDATE):
+        return pa.date32()
+    if type_code in (t.DATETIME, t.TIMESTAMP):
+        return pa.timestamp("us")
+    if type_code == t.TIME:
+        return pa.duration("us")
+    # 字符串、TEXT、JSON 及其他类型
+    return pa.string()
+
+
+def _arrow_schema(description):
+    """
+    按游标的列描述确定列类型，与数据内容无关 (某一批中整列为空也不影响后续批次)
+    """
+    return pa.schema([pa.field(d[0], _arrow_type(d[1], d[5])) for d in description])
+
+
+def _write_batch(rows, schema, target, partition_cols, batch_no):
+    table = pa.Table.from_pylist(rows, schema=schema)
+    if partition_cols:
+        pq.write_to_dataset(table, target, partition_cols=partition_cols,
+                            basename_template=f"part-{batch_no:05d}-{{i}}.parquet")
+    else:
+        pq.write_table(table, os.path.join(target, f"part-{batch_no:05d}.parquet"))
+
+
+def export_table(conn, table_name, crawl_date=None, root=None):
+    """
+    把一张表流式导出为当天的 Parquet 分区
+    :return: 导出的行数
+    """
+    root = root or SNAPSHOT_ROOT
+    crawl_date = crawl_date or datetime.date.today().isoformat()
+    partition_cols = TABLES.get(table_name, [])
+    final_dir = os.path.join(root, table_name, f"{PARTITION_DATE}={crawl_date}")
+    # 临时目录不在 crawl_date=* 之下，写入中途或导出失败留下的数据都不会被查询到
+    tmp_dir = os.path.join(root, table_name, STAGING_DIR, f"{PARTITION_DATE}={crawl_date}")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    count = 0
+    # SSDictCursor 流式读取，不把整表加载到内存
+    with conn.cursor(db.pymysql.cursors.SSDictCursor) as cursor:
+        cursor.execute(f"SELECT * FROM `{table_name}`")
+        schema = _arrow_schema(cursor.description)
+        batch_no = 0
+        while True:
+            rows = cursor.fetchmany(FETCH_SIZE)
+            if not rows:
+                break
+            for row in rows:
+                # 分区列为空时归入 "未知"，避免出现 __HIVE_DEFAULT_PARTITION__
+                for col in partition_cols:
+                    if not row.get(col):
+                        row[col] = "未知"
+            _write_batch(rows, schema, tmp_dir, partition_cols, batch_no)
+            batch_no += 1
+            count += len(rows)
+
+    shutil.rmtree(final_dir, ignore_errors=True)
+    os.replace(tmp_dir, final_dir)
+    return count
+
+
+def export_snapshot(tables=None, crawl_date=None, root=None, conn=None):
+    """
+    导出多张表，返回 {表名: 行数}；单表失败不影响其他表
+    :param conn: 已有的数据库连接 (不会被关闭)；为空时新建到 fic 的连接
+    """
+    tables = tables or list(TABLES)
+    result = {}
+    own_conn = conn is None
+    if own_conn:
+        conn = db.get_connection("fic")
+    try:
+        for table_name in tables:
+            start = time.time()
+            try:
+                result[table_name] = export_table(conn, table_name, crawl_date, root)
+                print(f"快照 {table_name}: {result[table_name]} 行，用时 {time.time() - start:.2f} 秒")
+            except Exception as e:
+                print(f"快照 {table_name} 导出失败: {e}")
+    finally:
+        if own_conn:
+            conn.close()
+    return result
+
+
+def snapshot_after_run(tables, conn=None):
+    """
+    供抓取任务结束时调用；SNAPSHOT_AFTER_RUN 为假或导出出错时不影响抓取结果
+    """
+    if not SNAPSHOT_AFTER_RUN:
+        return
+    try:
+        export_snapshot(tables, conn=conn)
+    except Exception as e:
+        print(f"导出快照失败: {e}")
+
+
+def connect(root=None):
+    """
+    返回一个 DuckDB 连接，已为每张有快照的表建立 <表名> 和 <表名>_history 视图
+    """
+    import duckdb
+
+    root = root or SNAPSHOT_ROOT
+    con = duckdb.connect()
+    for table_name in TABLES:
+        table_dir = os.path.join(root, table_name)
+        if not os.path.isdir(table_dir):
+            continue
+        pattern = os.path.join(table_dir, PARTITION_GLOB, "**", "*.parquet").replace("'", "''")
+        con.execute(f"""
+            CREATE VIEW "{table_name}_history" AS
+            SELECT * FROM read_parquet('{pattern}', hive_partitioning = true, union_by_name = true)
+        """)
+        con.execute(f"""
+            CREATE VIEW "{table_name}" AS
+            SELECT * EXCLUDE ({PARTITION_DATE}) FROM "{table_name}_history"
+            WHERE {PARTITION_DATE} = (SELECT max({PARTITION_DATE}) FROM "{table_name}_history")
+        """)
+    return con
+
+
+def query(sql, root=None):
+    """
+    在快照上执行 SQL，返回 (列名列表, 行列表)
+    """
+    con = connect(root)
+    try:
+        cursor = con.execute(sql)
+        columns = [d[0] for d in cursor.description]
+        return columns, cursor.fetchall()
+    finally:
+        con.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Parquet 快照导出与 DuckDB 查询")
+    parser.add_argument("--root", default=SNAPSHOT_ROOT, help="快照目录")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_export = sub.add_parser("export", help="从 MySQL 导出当天快照")
+    p_export.add_argument("--tables", nargs="+", choices=list(TABLES), help="只导出指定的表")
+    p_export.add_argument("--date", help="快照日期 (默认今天)")
+    p_query = sub.add_parser("query", help="在快照上执行 SQL")
+    p_query.add_argument("sql")
+    p_query.add_argument("--limit", type=int, default=50, help="最多打印的行数")
+    sub.add_parser("tables", help="列出可查询的视图及行数")
+    args = parser.parse_args(argv)
+
+    if args.command == "export":
+        export_snapshot(args.tables, args.date, args.root)
+        return 0
+
+    if args.command == "tables":
+        con = connect(args.root)
+        for (name,) in con.execute("SELECT view_name FROM duckdb_views() WHERE NOT internal ORDER BY 1").fetchall():
+            count = con.execute(f'SELECT count(*) FROM "{name}"').fetchone()[0]
+            print(f"{name}\t{count}")
+        con.close()
+        return 0
+
+    columns, rows = query(args.sql, args.root)
+    print("\t".join(columns))
+    for row in rows[:args.limit]:
+        print("\t".join("" if v is None else str(v) for v in row))
+    if len(rows) > args.limit:
+        print(f"... 共 {len(rows)} 行")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
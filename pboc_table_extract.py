@@ -0,0 +1,210 @@
+"""
+从行政处罚详情页提取处罚信息表格并保存为 xlsx (web_download_pboc 在详情页没有附件时使用)
+
+- lxml 只解析一次，每个表格只取一次文本用于打分
+- 按 rowspan / colspan 展开成规整的二维网格，合并单元格的内容填入它覆盖的每一格
+- 用 numpy 对整张网格做去空白、去空行空列
+- xlsxwriter constant_memory 模式逐行写出，不构造 DataFrame
+"""
+import os
+
+import lxml.html
+import numpy as np
+import xlsxwriter
+
+KEYWORDS = [
+    "序号",
+    "当事人",
+    "当事人名称",
+    "行政处罚",
+    "决定书文号",
+    "违法",
+    "罚款",
+    "作出行政处罚",
+    "行政处罚决定日期",
+    "备注"
+]
+MIN_SCORE = 2
+END_MARK = "以上内容"
+
+# 不间断空格、全角空格等统一成普通空格，便于 strip
+_SPACES = str.maketrans({"\xa0": " ", "\u3000": " ", "\u200b": ""})
+_HTML_PARSER = lxml.html.HTMLParser(encoding="utf-8")
+
+
+def parse_html(content):
+    """
+    解析详情页；content 为 bytes 时按 utf-8 解码
+    """
+    if isinstance(content, bytes):
+        return lxml.html.document_fromstring(content, parser=_HTML_PARSER)
+    return lxml.html.document_fromstring(content)
+
+
+def _span(cell, name):
+    try:
+        return max(int(cell.get(name, 1)), 1)
+    except ValueError:
+        return 1
+
+
+def cell_text(cell):
+    return "".join(s.strip() for s in cell.itertext()).translate(_SPACES)
+
+
+def table_rows(table):
+    """
+    表格自身的 <tr> (不含嵌套表格中的行)
+    """
+    return table.xpath("./tr | ./thead/tr | ./tbody/tr | ./tfoot/tr")
+
+
+def table_grid(table):
+    """
+    将表格展开为二维列表，rowspan / colspan 覆盖的格子填入同样的文本
+    不含任何单元格的 <tr> 被跳过
+    """
+    grid = []
+    # 列号 -> [剩余行数, 文本]，来自上方的 rowspan
+    pending = {}
+    for tr in table_rows(table):
+        cells = tr.xpath("./td | ./th")
+        if not cells and not pending:
+            continue
+        row = []
+        col = 0
+        it = iter(cells)
+        cell = next(it, None)
+        while cell is not None or any(c >= col for c in pending):
+            carried = pending.get(col)
+            if carried is not None:
+                row.append(carried[1])
+                carried[0] -= 1
+                if carried[0] == 0:
+                    del pending[col]
+                col += 1
+                continue
+            if cell is None:
+                # 这一行的单元格已用完，只剩右侧的 rowspan
+                row.append("")
+                col += 1
+                continue
+            text = cell_text(cell)
+            rowspan = _span(cell, "rowspan")
+            for _ in range(_span(cell, "colspan")):
+                row.append(text)
+                if rowspan > 1:
+                    pending[col] = [rowspan - 1, text]
+                col += 1
+            cell = next(it, None)
+        if row:
+            grid.append(row)
+    return grid
+
+
+def find_penalty_table(doc):
+    """
+    返回最像处罚信息的表格及其得分 (命中的关键字数，含 "中国人民银行" 加 1 分)
+    """
+    best_table = None
+    best_score = 0
+    for table in doc.iter("table"):
+        text = table.text_content()
+        score = sum(1 for kw in KEYWORDS if kw in text)
+        if "中国人民银行" in text:
+            score += 1
+        # 同分时取嵌套在内层的表格 (外层布局表格的文本包含了内层表格)
+        if score > best_score or (score and score == best_score and best_table in table.iterancestors()):
+            best_score = score
+            best_table = table
+    return best_table, best_score
+
+
+def _header_index(grid):
+    """
+    表头行: 优先取同时含 "序号" 和 "当事人" / "单位" 的行，否则取第一个非空行
+    """
+    first_nonempty = None
+    for idx, row in enumerate(grid):
+        row_text = "".join(row)
+        if not row_text:
+            continue
+        if first_nonempty is None:
+            first_nonempty = idx
+        if "序号" in row_text and ("当事人" in row_text or "单位" in row_text):
+            return idx
+    return first_nonempty
+
+
+def extract_penalty_table(doc):
+    """
+    :return: (表头 list, 数据 numpy 二维数组)；找不到合适的表格返回 None
+    """
+    table, score = find_penalty_table(doc)
+    if table is None or score < MIN_SCORE:
+        return None
+    grid = table_grid(table)
+    header_idx = _header_index(grid)
+    if header_idx is None:
+        return None
+
+    body = []
+    for row in grid[header_idx + 1:]:
+        if END_MARK in "".join(row):
+            break
+        body.append(row)
+    if not body:
+        return None
+
+    width = max(len(grid[header_idx]), max(len(r) for r in body))
+    arr = np.full((len(body) + 1, width), "", dtype=object)
+    for i, row in enumerate([grid[header_idx]] + body):
+        arr[i, :len(row)] = row[:width]
+    arr = np.char.strip(arr.astype(str))
+
+    header, data = arr[0], arr[1:]
+    # 去掉全空的数据行和表头为空的列
+    data = data[(data != "").any(axis=1)]
+    keep = header != ""
+    if not len(data) or not keep.any():
+        return None
+    return header[keep].tolist(), data[:, keep]
+
+
+def write_xlsx(path, header, rows, sheet_name="Sheet1"):
+    """
+    constant_memory 模式逐行写出；空字符串写为空单元格
+    """
+    workbook = xlsxwriter.Workbook(path, {"constant_memory": True})
+    try:
+        sheet = workbook.add_worksheet(sheet_name)
+        bold = workbook.add_format({"bold": True})
+        sheet.write_row(0, 0, header, bold)
+        for r, row in enumerate(rows, start=1):
+            for c, value in enumerate(row):
+                if value:
+                    sheet.write_string(r, c, value)
+    finally:
+        workbook.close()
+
+
+def save_table_as_xlsx(doc, final_path, log=None):
+    """
+    详情页没有附件时，查找最像处罚信息的表格并保存为 xlsx
+    :param doc: parse_html 的结果
+    :return: 是否保存成功
+    """
+    try:
+        result = extract_penalty_table(doc)
+    except Exception as e:
+        if log:
+            log(f"Table search failed: {e}", "error")
+        return False
+    if result is None:
+        return False
+    header, rows = result
+    # 先写临时文件再替换，中断时不留下损坏的 xlsx
+    tmp = final_path + ".part"
+    write_xlsx(tmp, header, rows)
+    os.replace(tmp, final_path)
+    return True
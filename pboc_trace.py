@@ -0,0 +1,324 @@
+"""
+抓取任务的分阶段耗时追踪 (job → phase → page → fetch / parse → write)
+
+用法:
+    token = pboc_trace.begin("pboc_approval")         # 开始一次运行
+    with pboc_trace.phase("抓取“已获许可机构”数据"):   # 阶段，结束时打印 "… 用时 x 秒"
+        ...
+    @pboc_trace.traced("page")                          # 函数整体记为一个 span，第一个参数记为 target
+    def scrape_page(url): ...
+    with pboc_trace.span("fetch", url=url): ...         # 任意代码块
+    executor.submit(pboc_trace.wrap(scrape_page), url)  # 线程池中的 span 挂到提交时的父 span 下
+    pboc_trace.finish(token)                            # 写 JSON 报告 (可选 Chrome trace)，打印最慢的 URL / host
+
+没有进行中的运行时 span 不做任何记录，开销只是一次 ContextVar 读取。
+报告写到 TRACE_DIR/<任务名>-<时间>.json；TRACE_CHROME 为真 (或环境变量 PBOC_TRACE_CHROME=1) 时另写
+*.trace.json，可在 chrome://tracing 或 https://ui.perfetto.dev 中打开。
+
+命令行:
+    python pboc_trace.py report traces/pboc_approval-20250101-120000.json [--top 20]
+    python pboc_trace.py chrome traces/pboc_approval-20250101-120000.json [-o out.trace.json]
+"""
+import argparse
+import contextvars
+import datetime
+import functools
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+basedir = os.path.dirname(os.path.abspath(__file__))
+TRACE_DIR = os.path.join(basedir, "traces")
+TRACE_ENABLED = True
+TRACE_CHROME = os.getenv("PBOC_TRACE_CHROME") == "1"
+TOP_N = 10
+# 报告中按耗时汇总的 span 类型，依次对应网络、解析、数据库
+KINDS = ("fetch", "parse", "write")
+
+_trace = contextvars.ContextVar("pboc_trace", default=None)
+_parent = contextvars.ContextVar("pboc_trace_parent", default=None)
+
+
+def peak_memory_mb():
+    """
+    当前进程的峰值常驻内存 (MB)；不支持的平台返回 None
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS 单位为字节，Linux 为 KB
+    return peak / 2**20 if sys.platform == "darwin" else peak / 1024
+
+
+class Trace:
+    def __init__(self, name):
+        self.name = name
+        self.started_at = datetime.datetime.now()
+        self.origin = time.perf_counter()
+        self.spans = []
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def next_id(self):
+        return next(self._ids)
+
+    def add(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def to_dict(self):
+        with self._lock:
+            spans = list(self.spans)
+        return {
+            "name": self.name,
+            "started_at": self.started_at.isoformat(timespec="seconds"),
+            "spans": sorted(spans, key=lambda s: s["start"]),
+        }
+
+
+@contextmanager
+def span(kind, name=None, **attrs):
+    """
+    记录一个代码块；name 默认与 kind 相同，attrs 中的 url 用于按 URL / host 汇总
+    """
+    trace = _trace.get()
+    if trace is None:
+        yield None
+        return
+    record = {"id": trace.next_id(), "parent": _parent.get(), "name": name or kind, "kind": kind,
+              "thread": threading.current_thread().name, "attrs": attrs}
+    token = _parent.set(record["id"])
+    started = time.perf_counter()
+    try:
+        yield record
+    except BaseException as e:
+        record["error"] = type(e).__name__
+        raise
+    finally:
+        record["start"] = round(started - trace.origin, 6)
+        record["duration"] = round(time.perf_counter() - started, 6)
+        _parent.reset(token)
+        trace.add(record)
+
+
+@contextmanager
+def phase(description, show_memory=False):
+    """
+    一个阶段: 记为 phase span，结束时打印耗时 (代替原来的 log_time_taken)
+    """
+    started = time.time()
+    try:
+        with span("phase", description):
+            yield
+    finally:
+        message = f"{description} 用时 {time.time() - started:.2f} 秒"
+        if show_memory and peak_memory_mb() is not None:
+            message += f"，峰值内存 {peak_memory_mb():.1f} MB"
+        print(message)
+
+
+def traced(kind, target=0):
+    """
+    装饰器: 函数整体记为一个 span，位置参数 args[target] 记为 target 属性 (为 None 则不记)
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _trace.get() is None:
+                return func(*args, **kwargs)
+            attrs = {}
+            if target is not None and len(args) > target:
+                attrs["target"] = str(args[target])
+            with span(kind, func.__name__, **attrs):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def wrap(func):
+    """
+    把当前运行和父 span (以及其他 ContextVar，如 pboc_fetch_cache 的 scope) 带到线程池的工作线程中
+    """
+    context = contextvars.copy_context()
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        # 同一个 Context 不能在多个线程中同时进入，每次调用用一份拷贝
+        return context.copy().run(func, *args, **kwargs)
+    return wrapper
+
+
+def current():
+    return _trace.get()
+
+
+def begin(name):
+    """
+    开始一次运行；返回的 token 交给 finish()。TRACE_ENABLED 为假时返回 None
+    """
+    if not TRACE_ENABLED:
+        return None
+    trace = Trace(name)
+    token = _trace.set(trace)
+    job_span = span("job", name)
+    job_span.__enter__()
+    return token, trace, job_span
+
+
+def finish(token, save=True, chrome=None):
+    """
+    结束运行: 写报告并打印摘要
+    :return: 报告 dict (未启用追踪时为 None)
+    """
+    if token is None:
+        return None
+    ctx_token, trace, job_span = token
+    job_span.__exit__(None, None, None)
+    _trace.reset(ctx_token)
+    data = trace.to_dict()
+    data["report"] = report(data["spans"])
+    if save:
+        try:
+            paths = save_trace(data, chrome=TRACE_CHROME if chrome is None else chrome)
+            print(f"追踪报告: {', '.join(paths)}")
+        except OSError as e:
+            print(f"写入追踪报告失败: {e}")
+    print(format_report(data["report"]))
+    return data
+
+
+# ---------------------------------------------------------------- 报告
+def _host(url):
+    return urlparse(url).netloc or url
+
+
+def report(spans, top=TOP_N):
+    """
+    汇总: 各阶段耗时、网络 / 解析 / 数据库的总耗时、最慢的 URL 和 host
+    """
+    job = next((s for s in spans if s["kind"] == "job"), None)
+    by_kind = {}
+    for s in spans:
+        entry = by_kind.setdefault(s["kind"], {"count": 0, "seconds": 0.0, "errors": 0})
+        entry["count"] += 1
+        entry["seconds"] += s["duration"]
+        entry["errors"] += "error" in s
+    for entry in by_kind.values():
+        entry["seconds"] = round(entry["seconds"], 3)
+
+    fetches = [s for s in spans if s["kind"] == "fetch" and s["attrs"].get("url")]
+    hosts = {}
+    for s in fetches:
+        h = hosts.setdefault(_host(s["attrs"]["url"]), {"count": 0, "seconds": 0.0, "max": 0.0, "errors": 0})
+        h["count"] += 1
+        h["seconds"] += s["duration"]
+        h["max"] = max(h["max"], s["duration"])
+        h["errors"] += "error" in s
+    host_rows = [{"host": k, "count": v["count"], "seconds": round(v["seconds"], 3),
+                  "avg": round(v["seconds"] / v["count"], 4), "max": round(v["max"], 4), "errors": v["errors"]}
+                 for k, v in hosts.items()]
+
+    return {
+        "seconds": job["duration"] if job else None,
+        "threads": len({s["thread"] for s in spans}),
+        "phases": [{"name": s["name"], "seconds": round(s["duration"], 3)} for s in spans if s["kind"] == "phase"],
+        "kinds": by_kind,
+        "slowest_urls": [{"url": s["attrs"]["url"], "seconds": round(s["duration"], 4), "thread": s["thread"],
+                          "error": s.get("error")}
+                         for s in sorted(fetches, key=lambda s: s["duration"], reverse=True)[:top]],
+        "slowest_hosts": sorted(host_rows, key=lambda h: h["avg"], reverse=True)[:top],
+    }
+
+
+def format_report(rep):
+    lines = []
+    if rep["seconds"] is not None:
+        lines.append(f"总用时 {rep['seconds']:.2f} 秒，{rep['threads']} 个线程")
+    # 各线程上的耗时累加，可能超过总用时
+    totals = [f"{k} {rep['kinds'][k]['seconds']:.2f} 秒 ({rep['kinds'][k]['count']} 次)"
+              for k in KINDS if k in rep["kinds"]]
+    if totals:
+        lines.append("累计: " + "，".join(totals))
+    if rep["slowest_hosts"]:
+        lines.append("最慢的 host (平均 / 最大 / 次数):")
+        lines.extend(f"  {h['host']}  {h['avg'] * 1000:.0f} ms / {h['max'] * 1000:.0f} ms / {h['count']}"
+                     + (f"  失败 {h['errors']}" if h["errors"] else "") for h in rep["slowest_hosts"])
+    if rep["slowest_urls"]:
+        lines.append("最慢的 URL:")
+        lines.extend(f"  {u['seconds'] * 1000:.0f} ms  {u['url']}" + (f"  ({u['error']})" if u["error"] else "")
+                     for u in rep["slowest_urls"])
+    return "\n".join(lines)
+
+
+def to_chrome(data):
+    """
+    转为 Chrome trace event 格式 (每个 span 一个 "X" 事件，线程名作为 tid 标签)
+    """
+    pid = 1
+    tids = {}
+    events = []
+    for s in data["spans"]:
+        tid = tids.setdefault(s["thread"], len(tids) + 1)
+        args = dict(s["attrs"])
+        if "error" in s:
+            args["error"] = s["error"]
+        events.append({"name": s["name"], "cat": s["kind"], "ph": "X", "pid": pid, "tid": tid,
+                       "ts": round(s["start"] * 1e6), "dur": round(s["duration"] * 1e6), "args": args})
+    for thread, tid in tids.items():
+        events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": thread}})
+    events.append({"name": "process_name", "ph": "M", "pid": pid, "args": {"name": data["name"]}})
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+def _write_json(path, obj):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(obj, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def save_trace(data, directory=None, chrome=False):
+    directory = directory or TRACE_DIR
+    os.makedirs(directory, exist_ok=True)
+    stem = os.path.join(directory, f"{data['name']}-{data['started_at'].replace(':', '').replace('-', '').replace('T', '-')}")
+    paths = [stem + ".json"]
+    _write_json(paths[0], data)
+    if chrome:
+        paths.append(stem + ".trace.json")
+        _write_json(paths[1], to_chrome(data))
+    return paths
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="查看抓取任务的追踪报告")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_report = sub.add_parser("report", help="打印摘要")
+    p_report.add_argument("path")
+    p_report.add_argument("--top", type=int, default=TOP_N)
+    p_chrome = sub.add_parser("chrome", help="转为 Chrome trace 格式")
+    p_chrome.add_argument("path")
+    p_chrome.add_argument("-o", "--output", help="输出文件 (默认与输入同名的 .trace.json)")
+    args = parser.parse_args(argv)
+
+    with open(args.path, encoding="utf-8") as f:
+        data = json.load(f)
+    if args.command == "report":
+        print(format_report(report(data["spans"], args.top)))
+        for p in report(data["spans"], args.top)["phases"]:
+            print(f"  {p['name']}: {p['seconds']:.2f} 秒")
+        return 0
+    output = args.output or os.path.splitext(args.path)[0] + ".trace.json"
+    _write_json(output, to_chrome(data))
+    print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,517 @@
+"""
+行政处罚全量抓取的共享任务队列 (多进程 / 多台机器上的 worker 共同消费)
+
+任务分四类，处理完一个任务会把后续任务放回队列:
+    index       省份首页 -> 全部列表页 (page)
+    page        列表页 -> 解析并写入 pboc_penalty 表，每条记录一个 detail
+    detail      详情页 -> 附件 (attachment)；没有附件时把表格保存为 xlsx
+    attachment  下载附件到 DOWNLOAD_ROOT/<省份>/
+
+队列存放在 SQLite (单机多进程) 或 MySQL (多台机器，使用 pboc_initial_database 的 fic 库) 中:
+- 同一次抓取 (crawl) 内按任务类型 + URL 去重，重复放入会被忽略
+- worker 领取任务时加租约 (LEASE_SECONDS)，处理期间由心跳线程续约；进程崩溃后租约过期，任务被其他 worker 重新领取
+- 失败的任务按指数退避重试，累计 MAX_ATTEMPTS 次后标记为 failed (retry-failed 可重新放回)
+- 优先处理更深层的任务 (attachment > detail > page > index)，队列不会无限堆积
+
+各 worker 在本进程内按 host 限流 (web_download_pboc.HostLimiter)；N 个 worker 同时运行时同一 host 的请求速率约为单个的 N 倍，
+请相应调大 web_download_pboc.HOST_DELAY。多台机器写附件时 DOWNLOAD_ROOT 应为共享目录。
+附件不经过 AttachmentStore (其索引是单进程的 JSON 文件)，也不写 web_download_pboc 的 manifest。
+
+用法:
+    python pboc_work_queue.py seed [--provinces 上海市 北京市] [--max-pages 50] [--no-details]
+    python pboc_work_queue.py work [--threads 4] [--kinds page detail] [--idle-exit 60]
+    python pboc_work_queue.py status
+    python pboc_work_queue.py retry-failed
+所有子命令都接受 --queue (sqlite:///路径 或 mysql，默认取环境变量 PBOC_QUEUE) 和 --crawl (默认当天日期)。
+"""
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from urllib.parse import urljoin
+
+import pboc_metrics
+
+basedir = os.path.dirname(os.path.abspath(__file__))
+QUEUE_ENV = "PBOC_QUEUE"
+DEFAULT_QUEUE = "sqlite:///" + os.path.join(basedir, "work_queue.db")
+TABLE = "pboc_work_queue"
+LEASE_SECONDS = 300
+MAX_ATTEMPTS = 3
+# 第 n 次失败后等待 RETRY_BACKOFF * 2**(n-1) 秒再重试
+RETRY_BACKOFF = 30
+# 队列为空时的轮询间隔 (秒)
+IDLE_POLL = 5
+# 数字越大越先处理
+PRIORITY = {"index": 0, "page": 1, "detail": 2, "attachment": 3}
+KINDS = tuple(PRIORITY)
+
+SCHEMA = {
+    "sqlite": f"""
+        CREATE TABLE IF NOT EXISTS {TABLE} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            crawl TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            task_key TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            priority INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            lease_owner TEXT,
+            lease_until REAL,
+            not_before REAL NOT NULL DEFAULT 0,
+            error TEXT,
+            updated_at REAL NOT NULL,
+            UNIQUE (crawl, task_key)
+        )""",
+    "mysql": f"""
+        CREATE TABLE IF NOT EXISTS {TABLE} (
+            id BIGINT AUTO_INCREMENT PRIMARY KEY,
+            crawl VARCHAR(64) NOT NULL,
+            kind VARCHAR(16) NOT NULL,
+            task_key CHAR(40) NOT NULL,
+            payload MEDIUMTEXT NOT NULL,
+            priority TINYINT NOT NULL,
+            status VARCHAR(16) NOT NULL DEFAULT 'pending',
+            attempts INT NOT NULL DEFAULT 0,
+            lease_owner VARCHAR(128),
+            lease_until DOUBLE,
+            not_before DOUBLE NOT NULL DEFAULT 0,
+            error TEXT,
+            updated_at DOUBLE NOT NULL,
+            UNIQUE KEY uk_crawl_task (crawl, task_key),
+            KEY idx_claim (crawl, status, priority, id)
+        ) DEFAULT CHARSET=utf8mb4""",
+}
+SQLITE_INDEX = f"CREATE INDEX IF NOT EXISTS idx_{TABLE}_claim ON {TABLE} (crawl, status, priority, id)"
+
+
+class PermanentTaskError(Exception):
+    """
+    不需要重试的失败 (例如详情页既没有附件也没有表格)
+    """
+
+
+def task_key(kind, url):
+    return hashlib.sha1(f"{kind}:{url}".encode("utf-8")).hexdigest()
+
+
+def default_crawl():
+    return datetime.date.today().isoformat()
+
+
+class WorkQueue:
+    """
+    :param url: sqlite:///路径 或 mysql
+    :param crawl: 抓取批次名，不同批次的任务互不去重
+    """
+
+    def __init__(self, url=None, crawl=None, max_attempts=MAX_ATTEMPTS, lease_seconds=LEASE_SECONDS):
+        self.url = url or os.getenv(QUEUE_ENV) or DEFAULT_QUEUE
+        self.crawl = crawl or default_crawl()
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        if self.url.startswith("sqlite:///"):
+            self.dialect = "sqlite"
+            self.path = self.url[len("sqlite:///"):]
+        elif self.url == "mysql":
+            self.dialect = "mysql"
+        else:
+            raise ValueError(f"不支持的队列地址: {self.url}")
+        # 每个线程一个连接
+        self._local = threading.local()
+        self.ensure_table()
+
+    # ------------------------------------------------------------ 连接
+    def _connect(self):
+        if self.dialect == "sqlite":
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            return conn
+        import pboc_initial_database as db
+        return db.get_connection("fic")
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        elif self.dialect == "mysql":
+            conn.ping(reconnect=True)
+        return conn
+
+    def _sql(self, sql):
+        return sql.replace("%s", "?") if self.dialect == "sqlite" else sql
+
+    def _execute(self, sql, params=(), many=False):
+        """
+        执行一条写语句并提交，返回影响的行数
+        """
+        conn = self._conn()
+        cursor = conn.cursor()
+        try:
+            if many:
+                cursor.executemany(self._sql(sql), params)
+            else:
+                cursor.execute(self._sql(sql), params)
+            if self.dialect == "mysql":
+                conn.commit()
+            return cursor.rowcount
+        finally:
+            cursor.close()
+
+    def _query(self, sql, params=()):
+        conn = self._conn()
+        cursor = conn.cursor()
+        try:
+            cursor.execute(self._sql(sql), params)
+            rows = cursor.fetchall()
+            if self.dialect == "mysql":
+                # DictCursor 返回字典，统一为元组
+                conn.commit()
+                rows = [tuple(r.values()) if isinstance(r, dict) else r for r in rows]
+            return rows
+        finally:
+            cursor.close()
+
+    def ensure_table(self):
+        self._execute(SCHEMA[self.dialect])
+        if self.dialect == "sqlite":
+            self._execute(SQLITE_INDEX)
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    # ------------------------------------------------------------ 入队 / 领取 / 完成
+    def put(self, tasks):
+        """
+        :param tasks: [(类型, payload)]，payload 中必须有 url
+        :return: 实际新增的任务数 (重复的被忽略)
+        """
+        now = time.time()
+        rows = [(self.crawl, kind, task_key(kind, payload["url"]), json.dumps(payload, ensure_ascii=False),
+                 PRIORITY[kind], now) for kind, payload in tasks]
+        if not rows:
+            return 0
+        verb = "INSERT OR IGNORE" if self.dialect == "sqlite" else "INSERT IGNORE"
+        return self._execute(f"{verb} INTO {TABLE} (crawl, kind, task_key, payload, priority, updated_at) "
+                             "VALUES (%s, %s, %s, %s, %s, %s)", rows, many=True)
+
+    def claim(self, owner, kinds=KINDS):
+        """
+        领取一个可执行的任务 (待处理且已过退避时间，或租约已过期)
+        :param owner: 租约持有者，同一 worker 的各线程用 "<worker>/<线程号>"
+        :return: {"id", "kind", "payload", "attempts"}，没有任务时返回 None
+        """
+        now = time.time()
+        # 租约过期且重试次数已用完的任务不再领取
+        self._execute(f"UPDATE {TABLE} SET status='failed', error='lease expired', updated_at=%s "
+                      "WHERE crawl=%s AND status='leased' AND lease_until<%s AND attempts>=%s",
+                      (now, self.crawl, now, self.max_attempts))
+        token = f"{owner}#{uuid.uuid4().hex[:12]}"
+        kind_list = ", ".join(["%s"] * len(kinds))
+        where = (f"crawl=%s AND kind IN ({kind_list}) AND "
+                 "((status='pending' AND not_before<=%s) OR (status='leased' AND lease_until<%s))")
+        params = (self.crawl, *kinds, now, now)
+        set_clause = "status='leased', lease_owner=%s, lease_until=%s, attempts=attempts+1, updated_at=%s"
+        set_params = (token, now + self.lease_seconds, now)
+        if self.dialect == "sqlite":
+            # 单条语句在 SQLite 中是原子的
+            sql = (f"UPDATE {TABLE} SET {set_clause} WHERE id = "
+                   f"(SELECT id FROM {TABLE} WHERE {where} ORDER BY priority DESC, id LIMIT 1)")
+        else:
+            sql = f"UPDATE {TABLE} SET {set_clause} WHERE {where} ORDER BY priority DESC, id LIMIT 1"
+        if not self._execute(sql, set_params + params):
+            return None
+        rows = self._query(f"SELECT id, kind, payload, attempts FROM {TABLE} WHERE lease_owner=%s AND status='leased'",
+                           (token,))
+        if not rows:
+            return None
+        task_id, kind, payload, attempts = rows[0]
+        return {"id": task_id, "kind": kind, "payload": json.loads(payload), "attempts": attempts, "token": token}
+
+    def complete(self, task, children=()):
+        """
+        标记完成并放入后续任务；租约已被其他 worker 接手时返回 False (后续任务仍会放入，重复的被忽略)
+        """
+        self.put(children)
+        return bool(self._execute(f"UPDATE {TABLE} SET status='done', error=NULL, updated_at=%s "
+                                  "WHERE id=%s AND lease_owner=%s",
+                                  (time.time(), task["id"], task["token"])))
+
+    def fail(self, task, error, permanent=False):
+        """
+        失败: 未用完重试次数的按指数退避放回队列，否则标记为 failed
+        :return: True 表示已放回队列等待重试
+        """
+        now = time.time()
+        retry = not permanent and task["attempts"] < self.max_attempts
+        status = "pending" if retry else "failed"
+        not_before = now + RETRY_BACKOFF * 2 ** (task["attempts"] - 1) if retry else now
+        self._execute(f"UPDATE {TABLE} SET status=%s, not_before=%s, lease_until=NULL, error=%s, updated_at=%s "
+                      "WHERE id=%s AND lease_owner=%s",
+                      (status, not_before, str(error)[:2000], now, task["id"], task["token"]))
+        return retry
+
+    def heartbeat(self, owner):
+        """
+        为 owner (worker 名) 名下所有进行中的任务续约
+        """
+        return self._execute(f"UPDATE {TABLE} SET lease_until=%s WHERE crawl=%s AND status='leased' "
+                             "AND lease_owner LIKE %s",
+                             (time.time() + self.lease_seconds, self.crawl, owner + "/%"))
+
+    def retry_failed(self):
+        return self._execute(f"UPDATE {TABLE} SET status='pending', attempts=0, not_before=0, error=NULL, "
+                             "updated_at=%s WHERE crawl=%s AND status='failed'", (time.time(), self.crawl))
+
+    # ------------------------------------------------------------ 进度
+    def progress(self, window=60):
+        """
+        汇总所有 worker 的进度
+        :return: {"kinds": {类型: {状态: 数量}}, "workers": {worker: 最近 window 秒完成数},
+                  "rate": 最近 window 秒每秒完成数, "pending", "leased"}
+        """
+        kinds = {}
+        for kind, status, count in self._query(
+                f"SELECT kind, status, COUNT(*) FROM {TABLE} WHERE crawl=%s GROUP BY kind, status", (self.crawl,)):
+            kinds.setdefault(kind, {})[status] = int(count)
+        since = time.time() - window
+        workers = {}
+        for owner, count in self._query(
+                f"SELECT lease_owner, COUNT(*) FROM {TABLE} WHERE crawl=%s AND status='done' AND updated_at>=%s "
+                "GROUP BY lease_owner", (self.crawl, since)):
+            worker = (owner or "").split("/", 1)[0]
+            workers[worker] = workers.get(worker, 0) + int(count)
+        total = lambda status: sum(v.get(status, 0) for v in kinds.values())
+        return {"crawl": self.crawl, "kinds": kinds, "workers": workers,
+                "rate": round(sum(workers.values()) / window, 2),
+                "pending": total("pending"), "leased": total("leased"),
+                "done": total("done"), "failed": total("failed")}
+
+    def failures(self, limit=20):
+        return self._query(f"SELECT kind, payload, attempts, error FROM {TABLE} WHERE crawl=%s AND status='failed' "
+                           f"ORDER BY updated_at DESC LIMIT {int(limit)}", (self.crawl,))
+
+
+# ---------------------------------------------------------------- 任务处理
+def seed_tasks(provinces=None, max_pages=50, details=True):
+    import pboc_penalty_data
+    return [("index", {"url": s["base_url"], "province": s["province"], "max_pages": max_pages, "details": details})
+            for s in pboc_penalty_data.PROVINCE_SITES if provinces is None or s["province"] in provinces]
+
+
+def handle_index(payload, ctx):
+    import pboc_penalty_data
+    html = pboc_penalty_data.fetch(payload["url"])
+    if not html:
+        raise IOError(f"首页获取失败: {payload['url']}")
+    pages = pboc_penalty_data.parse_page_links(html, payload["url"], payload["max_pages"])
+    common = {"province": payload["province"], "details": payload["details"]}
+    return [("page", {"url": page, **common}) for page in pages]
+
+
+def handle_page(payload, ctx):
+    import pboc_penalty_data
+    html = pboc_penalty_data.fetch(payload["url"])
+    if not html:
+        raise IOError(f"列表页获取失败: {payload['url']}")
+    items = pboc_penalty_data.parse_page_html(html, payload["url"], payload["province"])
+    pboc_penalty_data.save_to_db(items)
+    if not payload["details"]:
+        return []
+    return [("detail", {"url": item["url"], "province": item["province"], "title": item["title"]})
+            for item in items if item["url"]]
+
+
+def handle_detail(payload, ctx):
+    import web_download_pboc as web
+    from pboc_table_extract import parse_html, save_table_as_xlsx
+    resp = ctx.limiter.get(ctx.session, payload["url"], headers=web.HEADERS, timeout=15)
+    resp.raise_for_status()
+    with pboc_metrics.PARSE_SECONDS.labels("penalty_detail").time():
+        doc = parse_html(resp.content)
+        link, ext = web.find_attachment_link(doc)
+    name = web.sanitize_filename(payload.get("title") or "") or task_key("detail", payload["url"])
+    if link:
+        return [("attachment", {"url": urljoin(payload["url"], link), "province": payload["province"],
+                                "file": name + ext, "detail_url": payload["url"]})]
+    final_path = os.path.join(ctx.download_dir(payload["province"]), name + ".xlsx")
+    if not save_table_as_xlsx(doc, final_path, ctx.log):
+        raise PermanentTaskError("No document or valid table found")
+    return []
+
+
+def handle_attachment(payload, ctx):
+    import web_download_pboc as web
+    final_path = os.path.join(ctx.download_dir(payload["province"]), payload["file"])
+    stats = web.fetch_file(ctx.limiter, ctx.session, payload["url"], final_path)
+    ctx.log(f"{payload['file']} ({web.format_throughput(stats)})")
+    return []
+
+
+HANDLERS = {"index": handle_index, "page": handle_page, "detail": handle_detail, "attachment": handle_attachment}
+
+
+class WorkerContext:
+    """
+    同一 worker 各线程共享的会话、限流器和下载目录
+    """
+
+    def __init__(self, threads, verbose=True):
+        import web_download_pboc as web
+        self.session = web.make_session(threads)
+        self.limiter = web.HostLimiter()
+        self.root = web.DOWNLOAD_ROOT
+        self.verbose = verbose
+
+    def download_dir(self, province):
+        path = os.path.join(self.root, province)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def log(self, message, level="info"):
+        if self.verbose:
+            print(f"[{datetime.datetime.now():%H:%M:%S}] {level}: {message}")
+
+
+class Worker:
+    """
+    :param queue: WorkQueue
+    :param threads: 线程数，每个线程独立领取任务
+    :param idle_exit: 队列持续为空 (且没有进行中的任务) 这么多秒后退出；None 表示一直运行
+    """
+
+    def __init__(self, queue, threads=4, kinds=KINDS, idle_exit=None, name=None, verbose=True):
+        self.queue = queue
+        self.threads = threads
+        self.kinds = tuple(kinds)
+        self.idle_exit = idle_exit
+        self.name = name or f"{socket.gethostname()}:{os.getpid()}"
+        self.context = WorkerContext(threads, verbose)
+        self.stop = threading.Event()
+        self.done = 0
+        self.failed = 0
+        self._lock = threading.Lock()
+
+    def _heartbeat(self):
+        depth = pboc_metrics.QUEUE_DEPTH.labels("work_queue")
+        while not self.stop.wait(self.queue.lease_seconds / 3):
+            try:
+                self.queue.heartbeat(self.name)
+                depth.set(self.queue.progress()["pending"])
+            except Exception as e:
+                print(f"续约失败: {e}")
+
+    def _run_thread(self, index):
+        owner = f"{self.name}/{index}"
+        idle_since = None
+        while not self.stop.is_set():
+            task = self.queue.claim(owner, self.kinds)
+            if task is None:
+                idle_since = idle_since or time.monotonic()
+                if self.idle_exit is not None and time.monotonic() - idle_since >= self.idle_exit:
+                    # 其他 worker 仍在处理的任务可能产生后续任务，等待退避中的任务也还会被领取
+                    kinds = self.queue.progress()["kinds"]
+                    if not any(kinds.get(k, {}).get(s) for k in self.kinds for s in ("pending", "leased")):
+                        return
+                self.stop.wait(IDLE_POLL)
+                continue
+            idle_since = None
+            self._run_task(task)
+
+    def _run_task(self, task):
+        payload = task["payload"]
+        try:
+            with pboc_metrics.ACTIVE_WORKERS.track("work_queue"):
+                children = HANDLERS[task["kind"]](payload, self.context)
+        except Exception as e:
+            retry = self.queue.fail(task, e, permanent=isinstance(e, PermanentTaskError))
+            with self._lock:
+                self.failed += not retry
+            self.context.log(f"{task['kind']} {payload['url']} 失败 (第 {task['attempts']} 次"
+                             f"{'，稍后重试' if retry else ''}): {e}", "error")
+            return
+        self.queue.complete(task, children)
+        with self._lock:
+            self.done += 1
+
+    def run(self):
+        heartbeat = threading.Thread(target=self._heartbeat, daemon=True)
+        heartbeat.start()
+        workers = [threading.Thread(target=self._run_thread, args=(k,), daemon=True) for k in range(self.threads)]
+        for t in workers:
+            t.start()
+        try:
+            for t in workers:
+                while t.is_alive():
+                    t.join(1)
+        except KeyboardInterrupt:
+            print("正在停止，进行中的任务完成后退出 (未完成的任务租约过期后会被重新领取)")
+        finally:
+            self.stop.set()
+        return self.done, self.failed
+
+
+def format_progress(progress):
+    lines = [f"批次 {progress['crawl']}: 待处理 {progress['pending']}，进行中 {progress['leased']}，"
+             f"完成 {progress['done']}，失败 {progress['failed']}，最近每秒完成 {progress['rate']}"]
+    for kind in KINDS:
+        if kind in progress["kinds"]:
+            counts = "，".join(f"{k} {v}" for k, v in sorted(progress["kinds"][kind].items()))
+            lines.append(f"  {kind:<11}{counts}")
+    for worker, count in sorted(progress["workers"].items()):
+        lines.append(f"  worker {worker}: 最近 1 分钟完成 {count}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="行政处罚抓取的共享任务队列")
+    parser.add_argument("--queue", help=f"sqlite:///路径 或 mysql (默认取环境变量 {QUEUE_ENV}，否则 {DEFAULT_QUEUE})")
+    parser.add_argument("--crawl", help="抓取批次名 (默认当天日期)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_seed = sub.add_parser("seed", help="放入各省份首页任务")
+    p_seed.add_argument("--provinces", nargs="+", help="只抓取这些省份")
+    p_seed.add_argument("--max-pages", type=int, default=50, help="每个省份最多的列表页数")
+    p_seed.add_argument("--no-details", action="store_true", help="只抓列表页，不下载详情页和附件")
+    p_work = sub.add_parser("work", help="启动 worker")
+    p_work.add_argument("--threads", type=int, default=4)
+    p_work.add_argument("--kinds", nargs="+", choices=KINDS, default=list(KINDS), help="只处理这些类型的任务")
+    p_work.add_argument("--idle-exit", type=float, help="队列为空这么多秒后退出")
+    p_work.add_argument("--name", help="worker 名 (默认 主机名:进程号)")
+    sub.add_parser("status", help="查看进度")
+    sub.add_parser("retry-failed", help="把失败的任务重新放回队列")
+    args = parser.parse_args(argv)
+
+    queue = WorkQueue(args.queue, args.crawl)
+    if args.command == "seed":
+        added = queue.put(seed_tasks(args.provinces, args.max_pages, not args.no_details))
+        print(f"批次 {queue.crawl}: 新增 {added} 个首页任务")
+    elif args.command == "work":
+        pboc_metrics.dump_on_exit()
+        worker = Worker(queue, args.threads, args.kinds, args.idle_exit, args.name)
+        print(f"worker {worker.name} 开始处理批次 {queue.crawl} ({args.threads} 个线程)")
+        done, failed = worker.run()
+        print(f"worker {worker.name} 结束: 完成 {done}，失败 {failed}")
+        print(format_progress(queue.progress()))
+    elif args.command == "status":
+        print(format_progress(queue.progress()))
+        for kind, payload, attempts, error in queue.failures():
+            print(f"  失败 {kind} {json.loads(payload)['url']} ({attempts} 次): {error}")
+    else:
+        print(f"重新放回 {queue.retry_failed()} 个任务")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,129 @@
+"""
+把某个省份的下载目录 (附件和生成的 xlsx) 边打包边输出为 ZIP
+
+zipfile 写入一个不可 seek 的缓冲区，每写完一块就把缓冲区的内容交给调用方，
+不落临时文件，内存占用与文件大小无关，几个 GB 的压缩包也能直接从服务器流式下载。
+目录中的隐藏文件 (.manifest.json、未完成的 .part 等) 不打包。
+
+用法:
+    python pboc_zip_export.py 上海市                 # 写入 上海市.zip
+    python pboc_zip_export.py 上海市 -o - > a.zip    # 输出到标准输出
+"""
+import argparse
+import os
+import sys
+import time
+import zipfile
+
+COPY_CHUNK = 1024 * 1024
+# 本身已压缩的格式直接存储，避免白白消耗 CPU
+STORED_EXTS = {".xlsx", ".docx", ".zip", ".rar", ".7z", ".jpg", ".jpeg", ".png", ".et", ".wps"}
+
+
+class _StreamBuffer:
+    """
+    只追加、不可 seek 的写入目标；zipfile 检测到不可 seek 时会使用数据描述符
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self._offset = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._offset
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def list_export_files(directory):
+    """
+    返回需要打包的文件 (相对路径)，按名称排序
+    """
+    files = []
+    for base, dirs, names in os.walk(directory):
+        dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+        for name in sorted(names):
+            if name.startswith(".") or name.endswith((".part", ".part.json", ".link")):
+                continue
+            path = os.path.join(base, name)
+            if os.path.isfile(path):
+                files.append(os.path.relpath(path, directory))
+    return files
+
+
+def iter_zip(directory, arc_root=""):
+    """
+    逐块生成 directory 的 ZIP 数据
+    :param arc_root: 压缩包内的顶层目录名，为空则直接放在根下
+    """
+    buffer = _StreamBuffer()
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED, allowZip64=True) as zf:
+        for rel in list_export_files(directory):
+            path = os.path.join(directory, rel)
+            arcname = os.path.join(arc_root, rel).replace(os.sep, "/")
+            info = zipfile.ZipInfo(arcname, time.localtime(os.path.getmtime(path))[:6])
+            info.external_attr = 0o644 << 16
+            if os.path.splitext(rel)[1].lower() in STORED_EXTS:
+                info.compress_type = zipfile.ZIP_STORED
+            else:
+                info.compress_type = zipfile.ZIP_DEFLATED
+            with open(path, "rb") as src, zf.open(info, "w", force_zip64=True) as dst:
+                while True:
+                    block = src.read(COPY_CHUNK)
+                    if not block:
+                        break
+                    dst.write(block)
+                    data = buffer.drain()
+                    if data:
+                        yield data
+            data = buffer.drain()
+            if data:
+                yield data
+    # 中央目录
+    data = buffer.drain()
+    if data:
+        yield data
+
+
+def main(argv=None):
+    from web_download_pboc import DOWNLOAD_ROOT
+
+    parser = argparse.ArgumentParser(description="把省份下载目录打包为 ZIP")
+    parser.add_argument("province")
+    parser.add_argument("-o", "--output", help="输出文件，'-' 为标准输出 (默认 <省份>.zip)")
+    parser.add_argument("--root", default=DOWNLOAD_ROOT, help="下载根目录")
+    args = parser.parse_args(argv)
+
+    directory = os.path.join(args.root, args.province)
+    if not os.path.isdir(directory):
+        print(f"目录不存在: {directory}", file=sys.stderr)
+        return 1
+
+    output = args.output or f"{args.province}.zip"
+    out = sys.stdout.buffer if output == "-" else open(output, "wb")
+    size = 0
+    try:
+        for data in iter_zip(directory, args.province):
+            out.write(data)
+            size += len(data)
+    finally:
+        if out is not sys.stdout.buffer:
+            out.close()
+    if output != "-":
+        print(f"已导出 {output} ({size / 2**20:.1f} MB)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())